@@ -1,110 +1,204 @@
 
-import pandas as pd
-import openpyxl
-from openpyxl import Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-import requests
-import time
+import argparse
+import os
+from geocode_cache import GeocodeCache
+from gazetteer import load_default_gazetteer
+from geocode_journal import GeocodeJournal
+from incremental import (ArtifactStore, artifact_name, read_incremental, save_incremental, drop_internal_columns,
+                         stringify_mixed_columns)
+from thumbnails import thumbnail_frame
+from tile_export import export_tile_bundle
+from geocoding import geocode_frame, get_client, get_rate_limiter, DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND
+from hedging import get_hedged_client, DEFAULT_HEDGE_PERCENTILE, LOCATIONIQ_HEDGE_URL
+from excel_export import hyperlink_formulas, save_dataframe_to_excel_with_hyperlinks
 
 # Function to geocode an address using LocationIQ API
-def geocode_address_locationiq(address, api_key, retries=3):
-    url = f"https://us1.locationiq.com/v1/search.php?key={api_key}&q={address}&format=json"
-    
-    for attempt in range(retries):
-        try:
-            response = requests.get(url)
-            data = response.json()
-
-            if len(data) > 0:
-                lat = data[0]['lat']
-                lon = data[0]['lon']
-                return float(lat), float(lon)
-            else:
-                print(f"Could not geocode address: {address}")
-                return None, None
-        except Exception as e:
-            print(f"Error geocoding {address}: {e}")
-            if attempt < retries - 1:
-                print("Retrying...")
-                time.sleep(2)  # Adding a delay before retry
-            else:
-                print("Max retries reached. Could not geocode address.")
-                return None, None
+def geocode_address_locationiq(address, api_key, retries=3, hedge_url=None, hedge_percentile=DEFAULT_HEDGE_PERCENTILE):
+    if hedge_url:
+        lat, lon = get_hedged_client(api_key, hedge_url, percentile=hedge_percentile).search(address)
+    else:
+        # Raises GeocodingError when the lookup fails, so it is not journaled as "not found"
+        lat, lon = get_client(api_key).search(address, retries=retries)
+    if lat is None:
+        print(f"Could not geocode address: {address}")
+    return lat, lon
 
 # Function to process each sheet, geocode addresses, and write latitude and longitude columns
-def add_geocoded_columns_to_excel(excel_file, address_column, people_column, img_column, api_key):
+def add_geocoded_columns_to_excel(excel_file, address_column, people_column, img_column, api_key, cache=None,
+                                  max_workers=DEFAULT_MAX_WORKERS, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                                  gazetteer=None, processes=1, hyperlinks=True, retry_failed=False,
+                                  thumbnails=False, thumbnail_url_prefix=None, thumbnail_allow_local=False,
+                                  fuzzy_addresses=False,
+                                  hedge_url=LOCATIONIQ_HEDGE_URL, hedge_percentile=DEFAULT_HEDGE_PERCENTILE):
     """
     Processes all sheets, adds Latitude and Longitude columns, and consolidates all sheets into a single file.
     
     Parameters:
-        excel_file (str): Path to the input Excel file.
+        excel_file (str): Path or uploaded file (xlsx, csv or parquet).
         address_column (str): Name of the column containing addresses.
         people_column (str): Name of the column containing the number of people served.
         img_column (str): Name of the column containing image URLs.
-        api_key (str): The LocationIQ API key.
+        api_key (str): The LocationIQ API key. ``None`` skips LocationIQ and only uses local lookups.
+        cache (GeocodeCache, optional): Persistent geocode store. Defaults to the shared on-disk cache.
+        max_workers (int): Number of concurrent geocoding requests.
+        requests_per_second (float): Request rate allowed by the LocationIQ plan, counting every HTTP
+            request of the API key including retries and hedges.
+        gazetteer (GazetteerGeocoder, optional): Local tier answered before LocationIQ. Defaults to
+            ``gazetteer.csv`` (or ``$GAZETTEER_PATH``) when that file exists.
+        processes (int): Worker processes used to parse workbook sheets in parallel.
+        hyperlinks (bool): Convert the image column to ``=HYPERLINK`` formulas for Excel export.
+        retry_failed (bool): When resuming an interrupted run, look up addresses that failed before again.
+        thumbnails (bool): Replace the image column with small thumbnails for map tooltips.
+        thumbnail_url_prefix (str, optional): URL the thumbnail cache directory is served under; without
+            it thumbnails too large to inline keep their original URL.
+        thumbnail_allow_local (bool): Let the image column name local files and private hosts. Only for
+            trusted input such as the command line, never for uploads.
+        fuzzy_addresses (bool): Also merge near-duplicate spellings of an address into one lookup.
+        hedge_url (str, optional): Secondary LocationIQ-compatible endpoint. Requests slower than the
+            primary's recent ``hedge_percentile`` latency are also sent there and the first answer wins.
+            Defaults to ``$LOCATIONIQ_HEDGE_URL``.
+        hedge_percentile (float): Primary latency percentile after which a request is hedged.
     
     Returns:
         pd.DataFrame: Consolidated DataFrame with the added Latitude and Longitude columns.
     """
-    # Load workbook using openpyxl
-    workbook = pd.ExcelFile(excel_file)
-    sheets = workbook.sheet_names
-    all_data = []
-
-    for sheet_name in sheets:
-        print(f"Processing sheet: {sheet_name}")
-        data = workbook.parse(sheet_name)
-
-        # Skip sheets without the necessary columns
-        if address_column not in data.columns or people_column not in data.columns or img_column not in data.columns:
-            print(f"Skipping sheet '{sheet_name}' - Missing required columns.")
-            continue
-
-        # Add Latitude and Longitude columns if they don't exist
-        if "Latitude" not in data.columns:
-            data["Latitude"] = None
-        if "Longitude" not in data.columns:
-            data["Longitude"] = None
-
-        # Geocode each address and add latitude/longitude
-        for idx, address in enumerate(data[address_column]):
-            if pd.notna(address) and not data.at[idx, "Latitude"]:
-                lat, lon = geocode_address_locationiq(address, api_key)
-                if lat is not None and lon is not None:
-                    data.at[idx, "Latitude"] = lat
-                    data.at[idx, "Longitude"] = lon
-                    print(f"Geocoded '{address}': Latitude = {lat}, Longitude = {lon}")
-
-        # Append the data from this sheet to the all_data list
-        all_data.append(data)
-
-    # Consolidate all sheets into one DataFrame
-    consolidated_data = pd.concat(all_data, ignore_index=True)
+    if cache is None:
+        cache = GeocodeCache()
+    if gazetteer is None:
+        gazetteer = load_default_gazetteer()
+    remote = (lambda address: geocode_address_locationiq(address, api_key, hedge_url=hedge_url,
+                                                         hedge_percentile=hedge_percentile)) if api_key else None
+
+    # Read the sheets, reusing the previous run's artifact for unchanged sheets and rows
+    consolidated_data, info = read_incremental(excel_file, [address_column, people_column, img_column],
+                                               processes=processes)
+    for sheet_name in info["sheets_skipped"]:
+        print(f"Skipping sheet '{sheet_name}' - Missing required columns.")
+    print(f"Reused {len(info['sheets_reused'])} unchanged sheets and {info['rows_reused']} previously geocoded rows; "
+          f"read sheets: {', '.join(map(str, info['sheets_read'])) or 'none'}")
+
+    # Geocode each distinct address once across every sheet and merge the coordinates back. Results are
+    # journaled as they arrive, so an interrupted run picks up where it stopped.
+    journal = GeocodeJournal(ArtifactStore().journal_path(artifact_name(excel_file)), retry_failed=retry_failed)
+    if len(journal):
+        print(f"Resuming interrupted run: {len(journal)} addresses already looked up")
+    # The client takes a token from the key's bucket for every HTTP request (retries and hedges included),
+    # so the per-call limit of geocode_frame is off
+    if api_key:
+        get_rate_limiter(api_key, requests_per_second)
+    try:
+        consolidated_data, stats = geocode_frame(consolidated_data, address_column, remote, cache=cache,
+                                                 local=gazetteer, journal=journal, max_workers=max_workers,
+                                                 requests_per_second=None, fuzzy=fuzzy_addresses)
+    finally:
+        journal.close()
+    print(f"Geocoded {stats['unique_addresses']} unique addresses for {stats['rows']} rows "
+          f"({stats['lookups_saved']} lookups saved by deduplication)")
+    print(f"Canonicalized {stats['raw_addresses']} distinct address spellings into {stats['canonical_addresses']} "
+          f"addresses ({stats['collapsed_addresses']} collapsed)")
+    if gazetteer is not None:
+        print(f"Gazetteer: {gazetteer.hits} hits, {gazetteer.misses} misses")
+    print(f"Geocode cache: {cache.hits} hits, {cache.misses} misses")
+    if api_key and hedge_url:
+        hedging = get_hedged_client(api_key, hedge_url, percentile=hedge_percentile).summary()
+        print(f"Hedging: {hedging['hedged']} of {hedging['calls']} requests hedged, {hedging['hedge_wins']} won by "
+              f"the secondary (hedge delay {hedging['hedge_delay_seconds']} s)")
+        for provider, summary in hedging["providers"].items():
+            print(f"  {provider}: {summary}")
+
+    # Save the geocoded rows so the next run only geocodes what changed
+    save_incremental(consolidated_data, excel_file)
+    journal.complete()
+    consolidated_data = drop_internal_columns(consolidated_data)
+
+    # Swap full-size photos for thumbnails so map tooltips do not download multi-MB images
+    if thumbnails:
+        consolidated_data, thumb_stats = thumbnail_frame(consolidated_data, img_column, url_prefix=thumbnail_url_prefix,
+                                                         allow_local=thumbnail_allow_local)
+        print(f"Thumbnails: {thumb_stats['fetched']} fetched, {thumb_stats['cache_hits']} cached, "
+              f"{thumb_stats['failed']} failed, {thumb_stats['blocked']} blocked, {thumb_stats['too_large']} kept as URLs "
+              f"({thumb_stats['source_bytes']} -> {thumb_stats['thumbnail_bytes']} bytes)")
 
     # Convert the 'Img' column to hyperlinks for Excel export
-    def create_hyperlink_formula(url):
-        return f'=HYPERLINK("{url}", "{url}")' if pd.notna(url) else None
-
-    consolidated_data[img_column] = consolidated_data[img_column].apply(create_hyperlink_formula)
+    if hyperlinks:
+        consolidated_data[img_column] = hyperlink_formulas(consolidated_data[img_column])
 
     return consolidated_data
 
 
 
-# Example Usage
-excel_file = "test.xlsx"  # Path to your Excel file
-address_column = "Address"  # Column containing addresses
-people_column = "People Attended"  # Column containing people served data
-img_column = "Img"  # Column containing image URLs
-api_key = "API_KEY"  # Replace with your LocationIQ API key
-
-try:
-    # Get the consolidated data with Latitude and Longitude columns
-    consolidated_data = add_geocoded_columns_to_excel(excel_file, address_column, people_column, img_column, api_key)
-    print(consolidated_data)
-    # Save the consolidated DataFrame to a new Excel file
-    #output_excel = "consolidated_output_with_geocoded_data.xlsx"
-    #save_dataframe_to_excel_with_hyperlinks(consolidated_data, output_excel)
-except Exception as e:
-    print(f"An error occurred: {e}")
+def save_consolidated_data(consolidated_data, output_file, hyperlink_columns=(), copy_file=None):
+    """
+    Write the consolidated DataFrame to Parquet, CSV or Excel based on the output file extension.
 
+    Excel output is streamed with ``save_dataframe_to_excel_with_hyperlinks``, turning
+    ``hyperlink_columns`` into links and writing the Parquet or CSV ``copy_file`` in the same pass.
+    """
+    extension = os.path.splitext(output_file)[1].lower()
+    if extension in (".parquet", ".pq"):
+        # Parquet needs one type per column, so e.g. attendance with "N/A" entries is written as text
+        stringify_mixed_columns(consolidated_data).to_parquet(output_file, index=False)
+    elif extension == ".csv":
+        consolidated_data.to_csv(output_file, index=False)
+    else:
+        save_dataframe_to_excel_with_hyperlinks(consolidated_data, output_file, hyperlink_columns=hyperlink_columns,
+                                                copy_file=copy_file)
+        return
+    if copy_file:
+        save_consolidated_data(consolidated_data, copy_file)
+
+
+def main(argv=None):
+    """Command line entry point for running the geocoding preprocessing offline (e.g. from cron)."""
+    parser = argparse.ArgumentParser(description="Geocode every sheet of a workbook and write one consolidated file.")
+    parser.add_argument("input", help="Input workbook (.xlsx), .csv or .parquet file")
+    parser.add_argument("output", help="Output file; the extension selects Parquet, CSV or Excel")
+    parser.add_argument("--address-column", default="Address")
+    parser.add_argument("--people-column", default="People Attended")
+    parser.add_argument("--img-column", default="Img")
+    parser.add_argument("--api-key", default=os.environ.get("LOCATIONIQ_API_KEY"),
+                        help="LocationIQ API key (default: $LOCATIONIQ_API_KEY); omit to use only local lookups")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes used to parse sheets in parallel")
+    parser.add_argument("--geocode-workers", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Concurrent geocoding requests")
+    parser.add_argument("--requests-per-second", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="Request rate allowed by the LocationIQ plan")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="When resuming an interrupted run, also retry addresses LocationIQ did not find")
+    parser.add_argument("--thumbnails", action="store_true",
+                        help="Replace the image column with small thumbnails for map tooltips")
+    parser.add_argument("--thumbnail-url-prefix", default=None,
+                        help="URL the thumbnail cache directory is served under (default: only small thumbnails are inlined)")
+    parser.add_argument("--fuzzy-addresses", action="store_true",
+                        help="Also merge near-duplicate spellings of an address (typos, missing words) into one lookup")
+    parser.add_argument("--hedge-url", default=LOCATIONIQ_HEDGE_URL,
+                        help="Secondary LocationIQ-compatible endpoint for hedging slow requests "
+                             "(default: $LOCATIONIQ_HEDGE_URL), e.g. https://eu1.locationiq.com/v1/search.php")
+    parser.add_argument("--hedge-percentile", type=float, default=DEFAULT_HEDGE_PERCENTILE,
+                        help="Primary latency percentile after which a request is hedged")
+    parser.add_argument("--copy", default=None, metavar="FILE",
+                        help="Also write the rows to this Parquet or CSV file (with an Excel output, in the same pass)")
+    parser.add_argument("--tile-bundle", default=None, metavar="DIR",
+                        help="Also write a static tiled map bundle (tiles/z/x/y.json plus index.html) to DIR")
+    args = parser.parse_args(argv)
+
+    consolidated_data = add_geocoded_columns_to_excel(
+        args.input, args.address_column, args.people_column, args.img_column, args.api_key,
+        max_workers=args.geocode_workers, requests_per_second=args.requests_per_second,
+        processes=args.processes, hyperlinks=False, retry_failed=args.retry_failed,
+        thumbnails=args.thumbnails, thumbnail_url_prefix=args.thumbnail_url_prefix, thumbnail_allow_local=True,
+        fuzzy_addresses=args.fuzzy_addresses, hedge_url=args.hedge_url,
+        hedge_percentile=args.hedge_percentile,
+    )
+    if args.tile_bundle:
+        bundle = export_tile_bundle(consolidated_data, args.tile_bundle, lat_key="Latitude", lon_key="Longitude",
+                                    weight_key=args.people_column,
+                                    fields={"people": args.people_column, "img": args.img_column})
+        print(f"Wrote {bundle['tiles']} tiles for {bundle['count']} points to {args.tile_bundle}")
+    save_consolidated_data(consolidated_data, args.output, hyperlink_columns=[args.img_column], copy_file=args.copy)
+    print(f"Wrote {len(consolidated_data)} rows to {args.output}" + (f" and {args.copy}" if args.copy else ""))
+
+
+if __name__ == "__main__":
+    main()
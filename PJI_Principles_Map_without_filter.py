@@ -1,22 +1,24 @@
 import streamlit as st
 import pandas as pd
 import folium
-import base64
 import os
 from folium.plugins import MarkerCluster
 from streamlit_folium import st_folium
 from Data_Preproccess import add_geocoded_columns_to_excel
+from map_export import map_download_button
+from map_layers import PointLayer, HIGH_VOLUME_THRESHOLD
+from pointset import DEFAULT_CENTER, PointSet
 # Function to generate the map based on the selected year and workshop
 # Function to generate the map based on the selected year
-def generate_map(data):
+def generate_map(points, high_volume=None):
 
 
     # Create a map centered at an approximate location
-    m = folium.Map(location=[28, -82], zoom_start=5, tiles='cartodb dark_matter')
+    m = folium.Map(location=list(DEFAULT_CENTER), zoom_start=5, tiles='cartodb dark_matter')
 
     # Add total people served and total projects as a title
-    total_people_attended = 19150  # Replace with your actual data
-    total_workshops = 1200  # Replace with your actual data
+    total_people_attended = points.total()
+    total_workshops = points.count()
     # Add a custom HTML overlay at the top (modified)
     html = f"""
     <div style="
@@ -39,37 +41,46 @@ def generate_map(data):
   """
     m.get_root().html.add_child(folium.Element(html))
 
-    # Create a MarkerCluster
-    marker_cluster = MarkerCluster().add_to(m)
-
     # Define data with actual image URLs from Wikimedia Commons
     # Add markers for the filtered data
     circle_scaling_factor = 0.001
 
-    for entry in data:
-        # Calculate radius and font size based on people served
-        radius = int(entry["People Attended"]) * circle_scaling_factor
-
-        # Tooltip content for hover
-        tooltip_content = f"""
-        <div style="width:150px">
-            <p>{entry['People Attended']} people Attended</p>
-            <img src="{entry['Img']}" width="150px">
-        </div>
-        """
-
-        # Add the circle marker to the marker cluster
-        marker = folium.CircleMarker(
-            location=[entry["lat"], entry["lon"]],
-            radius=radius,
-            color="yellow",
-            fill=True,
-            fill_color="yellow",
-            fill_opacity=0.7,
-            tooltip=folium.Tooltip(tooltip_content),
-        )
-
-        marker.add_to(marker_cluster)
+    if high_volume is None:
+        high_volume = points.count(points.valid) > HIGH_VOLUME_THRESHOLD
+
+    if high_volume:
+        # Draw every point on one canvas from a single payload with a shared tooltip template
+        columns = points.columns(["people", "img"])
+        PointLayer(columns, radius_field="people", radius_scale=circle_scaling_factor, color="yellow").add_to(m)
+    else:
+        # Create a MarkerCluster
+        marker_cluster = MarkerCluster().add_to(m)
+        columns = points.columns(["people", "img"])
+
+        for lat, lon, people, img in zip(columns["lat"], columns["lon"], columns["people"], columns["img"]):
+            # Calculate radius and font size based on people served
+            radius = people * circle_scaling_factor
+
+            # Tooltip content for hover
+            tooltip_content = f"""
+            <div style="width:150px">
+                <p>{people} people Attended</p>
+                <img src="{img}" width="150px">
+            </div>
+            """
+
+            # Add the circle marker to the marker cluster
+            marker = folium.CircleMarker(
+                location=[lat, lon],
+                radius=radius,
+                color="yellow",
+                fill=True,
+                fill_color="yellow",
+                fill_opacity=0.7,
+                tooltip=folium.Tooltip(tooltip_content),
+            )
+
+            marker.add_to(marker_cluster)
 
     # Display the map
 
@@ -80,34 +91,23 @@ def main():
     st.title("PJI Principles Map Viewer")
 
     # Upload dataset
-    uploaded_file = st.file_uploader("Upload your dataset (CSV format):", type=["csv"])
+    uploaded_file = st.file_uploader("Upload your dataset (CSV, Excel or Parquet format):", type=["csv", "xlsx", "parquet"])
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
         address_column="Address"
         people_column="People Attended"
         img_column="Img"
         api_key="******************"
-        df = add_geocoded_columns_to_excel(uploaded_file, address_column, people_column, img_column, api_key)
-
-        data = df.to_dict(orient="records")
+        df = add_geocoded_columns_to_excel(uploaded_file, address_column, people_column, img_column, api_key,
+                                           hyperlinks=False, thumbnails=True)
 
-       
+        points = PointSet.from_frame(df, fields={"img": img_column})
 
         # Generate and display the map
-        map_object = generate_map(data)
+        map_object = generate_map(points)
         map_html = st_folium(map_object, width=800, height=600)
 
-        # Button to save/export map as HTML
-        if st.button("Save Map as HTML"):
-            map_object.save('Principles_Map.html')
-            
-            # Generate download link
-            with open("Principles_Map.html", "rb") as f:
-               html_bytes = f.read()
-            encoded_html = base64.b64encode(html_bytes).decode()
-            href = f'<a href="data:text/html;base64,{encoded_html}" download="Principles_Map.html">Download HTML File</a>'
-            st.markdown(href, unsafe_allow_html=True)
-            st.success("Map has been saved as 'Principles_Map.html' in your working directory.")
+        # Button to download the map as HTML, rendered in memory for this session
+        map_download_button(map_object, uploaded_file.file_id)
 
 if __name__ == "__main__":
     main()
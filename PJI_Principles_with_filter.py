@@ -1,33 +1,68 @@
 import streamlit as st
 import pandas as pd
 import folium
-import base64
+import hashlib
+import io
 import os
-from folium.plugins import MarkerCluster
 from streamlit_folium import st_folium
+from map_export import map_download_button
+from metrics import Metrics, diagnostics_panel
+from map_layers import ElementText, FilteredPointLayer, PointLayer
+from pointset import PointSet
+from spatial_index import DEFAULT_MAX_DETAIL, GridIndex, fit_zoom, viewport_columns
+from thumbnails import thumbnail_frame
+from filter_cache import LRUCache, empty_aggregate, ALL_YEARS, ALL_WORKSHOPS
+
+MAP_CACHE_SIZE = 16  # Built maps kept per session, one per (Year, workshop) selection
+MAP_KEY = "principles_map"  # Stable st_folium key, so the incremental mode keeps one map mounted
+MAP_WIDTH, MAP_HEIGHT = 800, 600
+
+TOOLTIP_TEMPLATE = """
+<div style="width:150px">
+    <h4>{name} Workshop</h4>
+    <p>{people} people served</p>
+    <img src="{img}" width="150px">
+</div>
+"""
+AGGREGATE_TOOLTIP_TEMPLATE = "<div>{count} workshops<br>{people} people served</div>"
+TOTALS_TEMPLATE = "Number of People Exposed to PJI Principles: {total} | Total Workshops: {count}"
+TOTALS_BANNER = """
+<style>
+    #total-info {
+        position: absolute;
+        top: 10px;
+        left: 50%;
+        transform: translateX(-50%);
+        z-index: 1000;
+        background: rgba(205, 127, 50, 0.7);
+        color: white;
+        padding: 10px;
+        border-radius: 5px;
+        text-align: center;
+    }
+</style>
+<div id="total-info"></div>
+"""
 
 # Function to generate the map based on the selected year and workshop
-def generate_map(data, year=None, names=None):
-    if year == "All Years":
-        f_data = data
-        if names == "All Workshops":
-            filtered_data = f_data
-        else:
-            filtered_data = [d for d in f_data if d["name"] == names]
-    else:
-        f_data = [d for d in data if d["Year"] == year]
-        if names == "All Workshops":
-            filtered_data = f_data
-        else:
-            filtered_data = [d for d in f_data if d["name"] == names]
+def generate_map(points, year=None, names=None, columns=None, totals=None):
+    """
+    Build the filterable map from a ``PointSet``. ``columns`` is the indexed payload and ``totals`` the
+    precomputed aggregate for the selection (see ``prepare_upload``); both are computed from ``points``
+    when omitted.
+    """
+    if totals is None:
+        totals = points.aggregate(year, names)
 
     m = folium.Map(location=[28, -82], zoom_start=5, tiles='cartodb dark_matter')
-        
+    if totals["bounds"] is not None:
+        m.fit_bounds(totals["bounds"])
+
     # Add total people served and total projects as a title
-    total_people_attended = 19150  # Replace with your actual data
-    total_workshops = 1200  # Replace with your actual data
+    total_people_attended = totals["people"]
+    total_workshops = totals["workshops"]
 
-    # Add JavaScript for interactivity
+    # Add the filter controls and totals banner
     m.get_root().html.add_child(folium.Element("""
     <style>
         #map-container {
@@ -67,114 +102,96 @@ def generate_map(data, year=None, names=None):
         </select>
     </div>
     <div id="total-info">
-        number of People Exposed to PJI Principles: 0 | Total Workshops: 0
+        Number of People Exposed to PJI Principles: """ + f"{total_people_attended:,}" + """ | Total Workshops: """ + f"{total_workshops:,}" + """
     </div>
-    <script>
-    document.addEventListener('DOMContentLoaded', function() {
-        // Extract unique years and names
-        const data = """ + str(data) + """;
-        const yearSelect = document.getElementById('year-select');
-        const nameSelect = document.getElementById('name-select');
-        const totalInfo = document.getElementById('total-info');
-
-        // Populate year dropdown
-        const years = [...new Set(data.map(d => d.Year))].sort();
-        years.forEach(year => {
-            const option = document.createElement('option');
-            option.value = year;
-            option.textContent = year;
-            yearSelect.appendChild(option);
-        });
-
-        // Populate name dropdown
-        const names = [...new Set(data.map(d => d.name))].sort();
-        names.forEach(name => {
-            const option = document.createElement('option');
-            option.value = name;
-            option.textContent = name;
-            nameSelect.appendChild(option);
-        });
-
-        // Marker cluster group
-        const markers = L.markerClusterGroup();
-
-        // Function to filter and display markers
-        function updateMarkers() {
-            // Clear existing markers
-            markers.clearLayers();
-
-            // Filter data
-            const selectedYear = yearSelect.value;
-            const selectedName = nameSelect.value;
-
-            const filteredData = data.filter(entry =>
-                (selectedYear === '' || entry.Year == selectedYear) &&
-                (selectedName === '' || entry.name === selectedName)
-            );
-
-            // Update total info
-            const totalPeopleserved = filteredData.reduce((sum, entry) => sum + entry.people_served, 0);
-            const totalWorkshops = filteredData.length;
-            totalInfo.innerHTML = `Number of People Exposed to PJI Principles: ${totalPeopleserved.toLocaleString()} | Total Workshops: ${totalWorkshops}`;
-
-            // Add markers
-            filteredData.forEach(entry => {
-                const radius = Math.max(5, entry.people_served * 0.001);
-                const marker = L.circleMarker([entry.lat, entry.lon], {
-                    radius: radius,
-                    color: 'yellow',
-                    fillColor: 'yellow',
-                    fillOpacity: 0.7
-                });
-
-                // Add tooltip
-                marker.bindTooltip(`
-                    <div style="width:200px;">
-                        <h4>${entry.name} Workshop</h4>
-                        <p>${entry.people_served} people served</p>
-                        <img src="${entry.image_url}" width="180px">
-                    </div>
-                `);
-
-                markers.addLayer(marker);
-            });
-        }
+    """))
 
-        // Add event listeners
-        yearSelect.addEventListener('change', updateMarkers);
-        nameSelect.addEventListener('change', updateMarkers);
-
-        // Initial marker update
-        updateMarkers();
-    });
-    </script>
-    """))    
-    
-    
-    marker_cluster = MarkerCluster().add_to(m)
-    circle_scaling_factor = 0.001
-
-    for entry in filtered_data:
-        radius = int(entry["people_served"]) * circle_scaling_factor
-        tooltip_content = f"""
-        <div style="width:150px">
-            <h4>{entry['name'] + ' Workshop'}</h4>
-            <p>{entry['people_served']} people served</p>
-            <img src="{entry['image_url']}" width="150px">
-        </div>
-        """
-        marker = folium.CircleMarker(
-            location=[entry["lat"], entry["lon"]],
-            radius=radius,
-            color="orange",
-            fill=True,
-            fill_color="orange",
-            fill_opacity=0.7,
-            tooltip=folium.Tooltip(tooltip_content),
-        )
-        marker.add_to(marker_cluster)
+    # One compact payload with precomputed year/name row indexes drives both dropdowns and the markers,
+    # so a filter change only touches the matching rows
+    if columns is None:
+        columns = points.indexed_columns(["people", "img"])
+    FilteredPointLayer(
+        columns,
+        filters={"year": "year-select", "name": "name-select"},
+        selected={"year": None if year == "All Years" else year, "name": None if names == "All Workshops" else names},
+        tooltip_template=TOOLTIP_TEMPLATE,
+        radius_field="people",
+        radius_scale=0.001,
+        min_radius=5,
+        color="orange",
+        sum_field="people",
+        totals_id="total-info",
+        totals_template=TOTALS_TEMPLATE,
+    ).add_to(m)
     return m
 
+def generate_base_map(bounds=None):
+    """
+    Base map for the incremental mode: tiles and an empty totals banner only. It is identical for every
+    filter selection, so ``st_folium`` keeps it mounted (with the user's zoom and position) and only
+    swaps the data layer from ``generate_data_layer``.
+    """
+    m = folium.Map(location=[28, -82], zoom_start=5, tiles='cartodb dark_matter')
+    if bounds is not None:
+        m.fit_bounds(bounds)
+    m.get_root().html.add_child(folium.Element(TOTALS_BANNER))
+    return m
+
+def generate_data_layer(points, year=None, names=None, index=None, bounds=None, zoom=None):
+    """
+    Feature group with only the selection's markers, plus the banner text for its totals.
+
+    With a spatial ``index`` and the map's current (padded) ``bounds`` and ``zoom``, selections larger than
+    ``DEFAULT_MAX_DETAIL`` send individual markers only for the visible area and grey cluster bubbles
+    (workshop count and attendance) for everything else; see ``spatial_index.viewport_columns``.
+
+    Returns:
+        tuple: (FeatureGroup, dict of marker counts for diagnostics)
+    """
+    mask = points.mask(year, names)
+    layer = folium.FeatureGroup(name="Workshops")
+    if index is None or bounds is None or zoom is None or points.count(mask & points.valid) <= DEFAULT_MAX_DETAIL:
+        columns = points.columns(["people", "img", "name"], mask=mask)
+        stats = {"detail_markers": len(columns["lat"]), "aggregate_markers": 0}
+    else:
+        columns, aggregates, stats = viewport_columns(points, index, bounds, zoom, mask=mask)
+        PointLayer(aggregates, tooltip_template=AGGREGATE_TOOLTIP_TEMPLATE, radius_field="size", min_radius=6,
+                   color="#999999", fill_opacity=0.5).add_to(layer)
+    PointLayer(columns, tooltip_template=TOOLTIP_TEMPLATE, radius_field="people", radius_scale=0.001,
+               min_radius=5, color="orange").add_to(layer)
+    text = TOTALS_TEMPLATE.format(total=f"{points.total(mask):,}", count=f"{points.count(mask):,}")
+    ElementText("total-info", text).add_to(layer)
+    return layer, stats
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_spatial_index(file_hash, _points):
+    """Grid index over an upload's points, built once per file and shared by every session."""
+    return GridIndex(_points.lat, _points.lon)
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def prepare_upload(file_hash, _file_bytes):
+    """
+    Parse an upload once and precompute everything that does not depend on the filter selection:
+    the ``PointSet``, the indexed map payload, the (Year, workshop) aggregates and the dropdown choices, plus
+    the thumbnail statistics for diagnostics.
+
+    Cached by file hash as shared objects rather than copies, so a filter change does not deserialize
+    them again; callers must not modify what is returned.
+    """
+    df = pd.read_csv(io.BytesIO(_file_bytes))
+    # Tooltips show 150px images, so replace full-size photos with cached thumbnails
+    thumb_stats = {}
+    if "image_url" in df.columns:
+        df, thumb_stats = thumbnail_frame(df, "image_url")
+    points = PointSet.from_frame(df, lat="lat", lon="lon", people="people_served", year="Year", name="name",
+                                 fields={"img": "image_url"})
+    columns = points.indexed_columns(["people", "img"])
+    aggregates = points.aggregates()
+    years = [ALL_YEARS] + points.labels("year")
+    names = [ALL_WORKSHOPS] + points.labels("name")
+    return points, columns, aggregates, years, names, thumb_stats
+
+
 # Streamlit app
 def main():
     st.title("PJI Principles Map Viewer")
@@ -182,32 +199,86 @@ def main():
     # Upload dataset
     uploaded_file = st.file_uploader("Upload your dataset (CSV format):", type=["csv"])
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        data = df.to_dict(orient="records")
+        metrics = Metrics()
+        file_bytes = uploaded_file.getvalue()
+        file_hash = hashlib.sha1(file_bytes).hexdigest()
+        with metrics.stage("prepare_upload"):
+            points, columns, aggregates, years, names, thumb_stats = prepare_upload(file_hash, file_bytes)
+        metrics.update({"upload_bytes": len(file_bytes), "rows": len(points), "markers": len(columns["lat"])})
+        metrics.update(thumb_stats, prefix="thumbnail_")
 
         st.sidebar.header("Filter Options")
 
         # Dropdowns for filtering
-        years = ["All Years"] + sorted(set(d["Year"] for d in data))
-        names = ["All Workshops"] + sorted(set(d["name"] for d in data))
         selected_year = st.sidebar.selectbox("Select Year", years)
         selected_workshop = st.sidebar.selectbox("Select Workshop", names)
+        totals = aggregates.get((selected_year, selected_workshop), empty_aggregate())
+        st.sidebar.metric("People Attended", f"{totals['people']:,}")
+        st.sidebar.metric("Workshops", f"{totals['workshops']:,}")
+
+        incremental = st.sidebar.checkbox(
+            "Update markers only", value=True,
+            help="Keep the map, its zoom and position, and only replace the markers when the filters change")
+
+        # Reuse the map (or data layer) built for this selection earlier in the session, if any
+        if "map_cache" not in st.session_state:
+            st.session_state["map_cache"] = LRUCache(MAP_CACHE_SIZE)
+        map_cache = st.session_state["map_cache"]
+        cache_key = (file_hash, selected_year, selected_workshop)
+        layer_key = cache_key
+        if incremental:
+            # st_folium stores the map's latest view under its key before this run starts, so the markers
+            # follow the area in view; bounds are padded and snapped to index cells to reuse layers
+            map_state = st.session_state.get(MAP_KEY) or {}
+            index = get_spatial_index(file_hash, points)
+            center, zoom, bounds = None, map_state.get("zoom"), None
+            if map_state.get("center"):
+                center = (map_state["center"]["lat"], map_state["center"]["lng"])
+            if map_state.get("bounds") and map_state["bounds"]["_southWest"].get("lat") is not None:
+                south_west, north_east = map_state["bounds"]["_southWest"], map_state["bounds"]["_northEast"]
+                bounds = index.snap([[south_west["lat"], south_west["lng"]], [north_east["lat"], north_east["lng"]]])
+            elif points.bounds() is not None:
+                # Before the map reports a view it shows what generate_base_map fits to
+                bounds = index.snap(points.bounds())
+                zoom = fit_zoom(points.bounds(), MAP_WIDTH, MAP_HEIGHT)
+            # Small selections are drawn in full whatever the view, so panning must not rebuild them
+            if points.count(points.mask(selected_year, selected_workshop) & points.valid) > DEFAULT_MAX_DETAIL:
+                layer_key = cache_key + ("layer", str(bounds), zoom)
+            else:
+                layer_key = cache_key + ("layer",)
+        cached = map_cache.get(layer_key)
+        metrics.set("map_cache_hit", int(cached is not None))
+        if cached is None:
+            with metrics.stage("generate_map"):
+                if incremental:
+                    cached = generate_data_layer(points, year=selected_year, names=selected_workshop, index=index,
+                                                 bounds=bounds, zoom=zoom)
+                else:
+                    cached = generate_map(points, year=selected_year, names=selected_workshop, columns=columns,
+                                          totals=totals)
+            map_cache.put(layer_key, cached)
+        metrics.set("selected_markers", totals["workshops"])
+
+        if incremental:
+            # The base map is rebuilt every run but renders to the same script, so st_folium keeps the
+            # mounted map and only swaps in the data layer; the last reported view is passed back in case
+            # the component is remounted
+            data_layer, layer_stats = cached
+            metrics.update(layer_stats)
+            map_object = generate_base_map(points.bounds())
+            with metrics.stage("render"):
+                st_folium(map_object, key=MAP_KEY, width=MAP_WIDTH, height=MAP_HEIGHT,
+                          feature_group_to_add=data_layer, center=center, zoom=zoom,
+                          returned_objects=["center", "zoom", "bounds"])
+        else:
+            map_object = cached
+            with metrics.stage("render"):
+                map_html = st_folium(map_object, width=MAP_WIDTH, height=MAP_HEIGHT)
 
-        # Generate and display the map
-        map_object = generate_map(data, year=selected_year, names=selected_workshop)
-        map_html = st_folium(map_object, width=800, height=600)
-
-        # Button to save/export map as HTML
-        if st.button("Save Map as HTML"):
-            map_object.save('Principles_Map.html')
-            
-            # Generate download link
-            with open("Principles_Map.html", "rb") as f:
-               html_bytes = f.read()
-            encoded_html = base64.b64encode(html_bytes).decode()
-            href = f'<a href="data:text/html;base64,{encoded_html}" download="Principles_Map.html">Download HTML File</a>'
-            st.markdown(href, unsafe_allow_html=True)
-            st.success("Map has been saved as 'Principles_Map.html' in your working directory.")
+        # Button to download the map as HTML, rendered in memory for this session. In the incremental mode
+        # st_folium has attached the data layer to the base map, so the export shows the current selection.
+        map_download_button(map_object, layer_key)
+        diagnostics_panel(metrics, map_object)
 
 if __name__ == "__main__":
     main()
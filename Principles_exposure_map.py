@@ -1,100 +1,171 @@
-import pandas as pd
-import requests
-import time
+import hashlib
+import io
 import streamlit as st
 import folium
-from folium.plugins import MarkerCluster
-from streamlit_folium import folium_static
-import base64
+from streamlit_folium import folium_static, st_folium
 import os
 from dotenv import load_dotenv
+from geocode_cache import GeocodeCache
+from gazetteer import load_default_gazetteer
+from map_layers import ClusterLayer, ElementText, PointLayer, build_cluster_levels, HIGH_VOLUME_THRESHOLD
+from pointset import DEFAULT_CENTER, PointSet
+from geocode_journal import GeocodeJournal
+from incremental import ArtifactStore, artifact_name, read_incremental, save_incremental, drop_internal_columns
+from geocoding import geocode_frame, get_client
+from hedging import get_hedged_client, LOCATIONIQ_HEDGE_URL
+from thumbnails import ThumbnailCache, thumbnail_frame
+from map_export import map_download_button
+from metrics import Metrics, diagnostics_panel
+from geocode_jobs import JobCancelled, drop_job, get_job
 
 # Load environment variables from .env file
 #load_dotenv()
 
-# Get the API key from the environment variable
-api_key = st.secrets["API_KEY"]
+# Get the API key from the environment variable, falling back to the Streamlit secrets
+api_key = os.environ.get("LOCATIONIQ_API_KEY") or st.secrets["API_KEY"]
 
+POLL_SECONDS = 2.0  # How often the page polls a running geocoding job
+LIVE_MAP_KEY = "exposure_live_map"  # Stable st_folium key, so the live map stays mounted between polls
+LIVE_LAYER_KEY = "exposure_live_layer"  # Session state holding the last drawn data layer
+LIVE_THROTTLE_POINTS = 5000  # Above this many resolved points the live layer is redrawn less often
+LIVE_REDRAW_GROWTH = 0.1  # ... namely once the resolved points grew by this share
+
+LIVE_BANNER = """
+<div id="live-totals" style="position: fixed; top: 10px; left: 50%; transform: translateX(-50%); z-index: 9999;
+     background-color: #111; color: white; padding: 8px 16px; border-radius: 8px;
+     font-family: Arial, sans-serif;">Geocoding...</div>
+"""
+
+
+def geocode_address_locationiq(address, api_key, retries=3, timings=None):
+    """
+    Geocode an address using LocationIQ API, hedged to ``$LOCATIONIQ_HEDGE_URL`` when that is set.
+    Raises ``GeocodingError`` when the lookup failed, so the address is retried on the next run.
+    ``timings`` receives the HTTP time of the answer (see ``GeocoderClient.search``).
+    """
+    if LOCATIONIQ_HEDGE_URL:
+        return get_hedged_client(api_key).search(address, timings=timings)
+    return get_client(api_key).search(address, retries=retries, timings=timings)
 
-@st.cache_data
-def geocode_address_locationiq(address, api_key, retries=3):
-    """Geocode an address using LocationIQ API."""
-    url = f"https://us1.locationiq.com/v1/search.php?key={api_key}&q={address}&format=json"
 
-    for attempt in range(retries):
-        try:
-            response = requests.get(url)
-            data = response.json()
-
-            if len(data) > 0:
-                lat = data[0]['lat']
-                lon = data[0]['lon']
-                return float(lat), float(lon)
-            else:
-                #print(f"Could not geocode address: {address}")
-                return None, None
-        except Exception as e:
-            #print(f"Error geocoding {address}: {e}")
-            if attempt < retries - 1:
-                #print("Retrying...")
-                time.sleep(2)  # Adding a delay before retry
-            else:
-                #print("Max retries reached. Could not geocode address.")
-                return None, None
-
-
-
-def add_geocoded_columns_to_excel(excel_file, address_column, people_column, img_column, api_key):
-    """Add geocoded columns to an Excel file."""
-    xls = pd.ExcelFile(excel_file)
-    all_data = []
-
-    for sheet_name in xls.sheet_names:
-        #print(f"Processing sheet: {sheet_name}")
-        data = pd.read_excel(xls, sheet_name=sheet_name)
-        data = data[[address_column, people_column, img_column]]
-
-        # Skip sheets without the necessary columns
-        if address_column not in data.columns or people_column not in data.columns or img_column not in data.columns:
-            #print(f"Skipping sheet '{sheet_name}' - Missing required columns.")
-            continue
-
-        # Add Latitude and Longitude columns if they don't exist
-        if "Latitude" not in data.columns:
-            data["Latitude"] = None
-        if "Longitude" not in data.columns:
-            data["Longitude"] = None
-
-        # Geocode each address and add latitude/longitude
-        progress_bar = st.progress(0)
-        for idx, address in enumerate(data[address_column]):
-            if pd.notna(address) and not data.at[idx, "Latitude"]:
-                lat, lon = geocode_address_locationiq(address, api_key)
-                if lat is not None and lon is not None:
-                    data.at[idx, "Latitude"] = lat
-                    data.at[idx, "Longitude"] = lon
-                    #print(f"Geocoded '{address}': Latitude = {lat}, Longitude = {lon}")
-            progress_bar.progress((idx + 1) / len(data))
 
-        # Append the data from this sheet to the all_data list
-        all_data.append(data)
+@st.cache_resource
+def get_gazetteer():
+    """Load the local gazetteer once per server process (None when there is no gazetteer file)."""
+    return load_default_gazetteer()
 
-    # Consolidate all sheets into one DataFrame
-    consolidated_data = pd.concat(all_data, ignore_index=True)
 
-    # Convert the 'Img' column to hyperlinks for Excel export
+@st.cache_resource
+def get_thumbnail_cache():
+    """Open the on-disk thumbnail store once per server process."""
+    return ThumbnailCache()
 
 
+def add_geocoded_columns_to_excel(excel_file, address_column, people_column, img_column, api_key, metrics=None,
+                                  job=None):
+    """
+    Add geocoded columns to an Excel file. Stage timings and geocoder counters are recorded in ``metrics``.
+
+    When run as a background ``GeocodeJob`` (``job``), progress, messages and every resolved address are
+    reported to the job instead of the page, and its metrics are used.
+    """
+    if job is not None:
+        metrics, log, result_callback = job.metrics, job.log, job.record
+    else:
+        metrics, log, result_callback = metrics or Metrics(), st.caption, None
+    cache = GeocodeCache()
+    gazetteer = get_gazetteer()
+    client = get_client(api_key)
+    client_before = dict(client.stats)
+    hedging_before = dict(get_hedged_client(api_key).stats) if LOCATIONIQ_HEDGE_URL else None
+    gazetteer_before = (gazetteer.hits, gazetteer.misses) if gazetteer is not None else (0, 0)
+
+    # Read the sheets, reusing the previous run's artifact for unchanged sheets and rows
+    with metrics.stage("read"):
+        consolidated_data, info = read_incremental(excel_file, [address_column, people_column, img_column])
+    metrics.update({"rows": len(consolidated_data), "sheets_read": len(info["sheets_read"]),
+                    "sheets_reused": len(info["sheets_reused"]), "rows_reused": info["rows_reused"]})
+    if job is not None:
+        job.set_frame(consolidated_data, address_column)
+
+    # Geocode each distinct address once across every sheet and merge the coordinates back. Results are
+    # journaled as they arrive, so re-uploading after a crash or closed tab resumes instead of starting over.
+    journal = GeocodeJournal(ArtifactStore().journal_path(artifact_name(excel_file)))
+    if len(journal):
+        log(f"Resuming interrupted run: {len(journal)} addresses already looked up")
+    def remote(address):
+        # A cancelled job fails its queued lookups fast; failures are not journaled, so nothing is lost
+        if job is not None:
+            job.check_cancelled()
+        # Only LocationIQ's response time is observed, not the wait for the key's rate limiter
+        timings = {}
+        try:
+            return geocode_address_locationiq(address, api_key, timings=timings)
+        finally:
+            if "request_seconds" in timings:
+                metrics.observe("geocode_latency_seconds", timings["request_seconds"])
+    if job is not None:
+        progress_callback = job.progress
+    else:
+        progress_bar = st.progress(0)
+        progress_callback = lambda done, total: progress_bar.progress(done / total)
+    try:
+        with metrics.stage("geocode"):
+            # The shared client rate-limits every HTTP request of the key, retries and hedges included
+            consolidated_data, stats = geocode_frame(consolidated_data, address_column, remote,
+                                                     cache=cache, local=gazetteer, journal=journal,
+                                                     requests_per_second=None,
+                                                     progress_callback=progress_callback,
+                                                     result_callback=result_callback)
+    finally:
+        journal.close()
+    if job is None:
+        progress_bar.progress(1.0)
+    log(f"Geocoded {stats['unique_addresses']} unique addresses for {stats['rows']} rows "
+        f"({stats['lookups_saved']} lookups saved by deduplication)")
+    log(f"Canonicalized {stats['raw_addresses']} distinct address spellings into "
+        f"{stats['canonical_addresses']} addresses ({stats['collapsed_addresses']} collapsed)")
+    if gazetteer is not None:
+        log(f"Gazetteer: {gazetteer.hits} hits, {gazetteer.misses} misses")
+    log(f"Geocode cache: {cache.hits} hits, {cache.misses} misses")
+    log(f"Reused {len(info['sheets_reused'])} unchanged sheets and {info['rows_reused']} previously geocoded rows")
+    metrics.update(stats, prefix="geocode_")
+    metrics.update({"cache_hits": cache.hits, "cache_misses": cache.misses}, prefix="geocode_")
+    if gazetteer is not None:
+        metrics.update({"hits": gazetteer.hits - gazetteer_before[0], "misses": gazetteer.misses - gazetteer_before[1]},
+                       prefix="gazetteer_")
+    # The client is shared by the whole process, so report this run's share of its counters
+    metrics.update({key: value - client_before.get(key, 0) for key, value in client.stats.items()}, prefix="locationiq_")
+    if hedging_before is not None:
+        hedging = get_hedged_client(api_key).summary()
+        metrics.update({key: hedging[key] - hedging_before[key] for key in hedging_before}, prefix="hedge_")
+        metrics.set("hedge_delay_seconds", hedging["hedge_delay_seconds"])
+        for provider, summary in hedging["providers"].items():
+            metrics.update(summary, prefix=f"{provider}_")
+    cache.close()
+
+    # Save the geocoded rows so the next upload only geocodes what changed
+    with metrics.stage("save_artifact"):
+        save_incremental(consolidated_data, excel_file)
+    journal.complete()
+    consolidated_data = drop_internal_columns(consolidated_data)
+
+    # Swap full-size photos for thumbnails so map tooltips do not download multi-MB images
+    with metrics.stage("thumbnails"):
+        consolidated_data, thumb_stats = thumbnail_frame(consolidated_data, img_column, cache=get_thumbnail_cache())
+    log(f"Thumbnails: {thumb_stats['fetched']} fetched, {thumb_stats['cache_hits']} cached, "
+        f"{thumb_stats['failed']} failed, {thumb_stats['blocked']} blocked")
+    metrics.update(thumb_stats, prefix="thumbnail_")
+
     return consolidated_data
 
-def generate_map(data):
-    """Generate a map from the given data."""
+def generate_map(points, high_volume=None):
+    """Generate a map from a ``PointSet``. ``high_volume`` forces (or disables) the canvas point layer."""
     # Create a map centered around the average latitude and longitude
-    avg_lat = sum(entry["Latitude"] for entry in data) / len(data)
-    avg_lon = sum(entry["Longitude"] for entry in data) / len(data)
-    m = folium.Map(location=[avg_lat, avg_lon], zoom_start=10, tiles='CartoDB dark_matter')
-    number_of_people = sum(entry["People Attended"] for entry in data)
-    num_locations = len(pd.unique([entry["Address"] for entry in data]))
+    center = points.centroid() or DEFAULT_CENTER
+    m = folium.Map(location=list(center), zoom_start=10, tiles='CartoDB dark_matter')
+    number_of_people = points.total()
+    num_locations = points.distinct_locations(field="address")
     # Add a banner to the top of the map
     banner_html = f"""
         <div style="position: fixed;
@@ -126,77 +197,85 @@ def generate_map(data):
     """
     m.get_root().html.add_child(folium.Element(banner_html))
 
-    # Create a MarkerCluster with custom icons
-    marker_cluster = MarkerCluster(
-        icon_create_function="""
-        function(cluster) {
-            var markers = cluster.getAllChildMarkers();
-            var totalPeople = 0;
-            for (var i = 0; i < markers.length; i++) {
-                var tooltipContent = markers[i].getTooltip().getContent();
-                var peopleAttended = parseInt(tooltipContent.match(/(\d+) people Attended/)[1]);
-                totalPeople += peopleAttended;
-            }
-            var c = ' marker-cluster-';
-            if (totalPeople < 10) {
-                c += 'small';
-            } else if (totalPeople < 100) {
-                c += 'medium';
-            } else {
-                c += 'large';
-            }
-            return new L.DivIcon({ html: '<div><span>' + totalPeople + '</span></div>', className: 'marker-cluster' + c, iconSize: new L.Point(40, 40) });
-        }
-        """
-    ).add_to(m)
-
     # Define data with actual image URLs from Wikimedia Commons
     # Add markers for the filtered data
     circle_scaling_factor = 0.1  # Adjust this factor to scale the circle sizes appropriately
 
-    for entry in data:
-        # Calculate radius based on people served
-        radius = int(entry["People Attended"]) * circle_scaling_factor
-
-
-        img_url = entry['Img']
-        #print(f"Converted URL: {img_url}")  # Debugging: Print the converted URL
-
-        # Tooltip content for hover
-        tooltip_content = f"""
+    if high_volume is None:
+        high_volume = points.count(points.valid) > HIGH_VOLUME_THRESHOLD
+
+    if high_volume:
+        # Draw every point on one canvas from a single payload with a shared tooltip template
+        columns = points.columns(["people", "img"])
+        PointLayer(columns, radius_field="people", radius_scale=circle_scaling_factor, color="yellow").add_to(m)
+    else:
+        # Clusters and their attendance totals are precomputed per zoom level, so the browser only
+        # draws ready-made aggregates instead of parsing every child marker's tooltip
+        columns = points.columns(["people", "img"])
+        levels = build_cluster_levels(columns, "people")
+        tooltip_template = """
         <div style="width:150px; text-align:center;">
-            <p>{entry['People Attended']} people Attended</p>
-            <img src= {entry['Img']} width="150px">
+            <p>{people} people Attended</p>
+            <img src="{img}" width="150px">
         </div>
         """
-        #print(f"Tooltip content: {tooltip_content}")  # Debugging: Print the tooltip content
-
-        # Popup content for click
-        popup_html = f"""
-        <html><body>
-            <img src="{img_url}" width="150px">
-        </body></html>
+        popup_template = """
+        <img src="{img}" width="150px">
         """
+        ClusterLayer(columns, levels, tooltip_template=tooltip_template, popup_template=popup_template,
+                     radius_field="people", radius_scale=circle_scaling_factor, color="yellow").add_to(m)
 
-        # Add the circle marker to the marker cluster
-        marker = folium.CircleMarker(
-            location=[entry["Latitude"], entry["Longitude"]],
-            radius=radius,
-            color="yellow",
-            fill=True,
-            fill_color="yellow",
-            fill_opacity=0.7,
-            tooltip=folium.Tooltip(tooltip_content, sticky=True),
-            popup=folium.Popup(popup_html, max_width=300)
-        )
+    return m
 
-        marker.add_to(marker_cluster)
-
-    # Save the map as an HTML file
-    map_html = 'Principles_Map.html'
-    m.save(map_html)
-
-    return m, map_html
+def generate_live_base_map():
+    """
+    Base map shown while a job runs: tiles and an empty banner only. It is the same on every poll, so
+    ``st_folium`` keeps it mounted with the user's zoom and position and only swaps the data layer.
+    """
+    m = folium.Map(location=list(DEFAULT_CENTER), zoom_start=5, tiles='CartoDB dark_matter')
+    m.get_root().html.add_child(folium.Element(LIVE_BANNER))
+    return m
+
+def generate_live_layer(points):
+    """Feature group with the points resolved so far on one canvas, plus the banner text."""
+    layer = folium.FeatureGroup(name="Workshops")
+    PointLayer(points.columns(["people", "img"]), radius_field="people", radius_scale=0.1,
+               color="yellow").add_to(layer)
+    text = f"{points.total():,} people attended at {points.distinct_locations(field='address'):,} locations so far"
+    ElementText("live-totals", text).add_to(layer)
+    return layer
+
+def live_map(job, address_column, img_column):
+    """
+    Poll a running geocoding job every ``POLL_SECONDS`` until it finishes, then rerun the page so the
+    final map, downloads and diagnostics replace it. The data layer is rebuilt only when more addresses
+    have resolved, and beyond ``LIVE_THROTTLE_POINTS`` only once they grew by ``LIVE_REDRAW_GROWTH``.
+    """
+    @st.fragment(run_every=POLL_SECONDS)
+    def poll():
+        if job.finished:
+            st.rerun()
+        fraction = job.done_count / job.total if job.total else 0.0
+        st.progress(fraction, text=f"Geocoded {job.done_count} of {job.total or '?'} addresses")
+        for message in job.messages:
+            st.caption(message)
+        drawn = st.session_state.get(LIVE_LAYER_KEY)
+        if drawn is None or drawn["job"] is not job:
+            drawn = st.session_state[LIVE_LAYER_KEY] = {"job": job, "resolved": 0, "layer": None}
+        resolved = job.resolved
+        grown = resolved - drawn["resolved"]
+        if grown > 0 and (drawn["layer"] is None or resolved <= LIVE_THROTTLE_POINTS or
+                          grown >= drawn["resolved"] * LIVE_REDRAW_GROWTH):
+            frame = job.partial_frame()
+            if frame is not None:
+                points = PointSet.from_frame(frame, fields={"img": img_column, "address": address_column})
+                if points.valid.any():
+                    drawn.update(resolved=resolved, layer=generate_live_layer(points))
+        if drawn["layer"] is not None:
+            st_folium(generate_live_base_map(), key=LIVE_MAP_KEY, width=800, height=600,
+                      feature_group_to_add=drawn["layer"], returned_objects=[])
+
+    poll()
 
 def main():
     # Stylish title using HTML and CSS
@@ -217,28 +296,48 @@ def main():
     """, unsafe_allow_html=True)
 
     # Upload dataset
-    uploaded_file = st.file_uploader("Upload your dataset (Excel Format only, column names: Address, People Attended and Img):", type=["xlsx"])
+    uploaded_file = st.file_uploader("Upload your dataset (Excel, CSV or Parquet, column names: Address, People Attended and Img):", type=["xlsx", "csv", "parquet"])
     if uploaded_file:
         address_column = "Address"
         people_column = "People Attended"
         img_column = "Img"
-        df = add_geocoded_columns_to_excel(uploaded_file, address_column, people_column, img_column, api_key)
+        metrics = Metrics()
+        # Geocoding runs as a background job keyed by the upload's content, so reruns, re-uploads and
+        # other sessions with the same file attach to it. A changed file of the same name supersedes it.
+        data = uploaded_file.getvalue()
+        upload = io.BytesIO(data)
+        upload.name = uploaded_file.name
+        job_key = hashlib.sha1(data).hexdigest()
+        job = get_job(job_key, add_geocoded_columns_to_excel, upload, address_column, people_column,
+                      img_column, api_key, group=artifact_name(upload))
+        if not job.finished:
+            live_map(job, address_column, img_column)
+            return
+        for message in job.messages:
+            st.caption(message)
+        if isinstance(job.error, JobCancelled):
+            st.warning(f"{job.error}; upload this file again to restart it.")
+            drop_job(job_key)
+            return
+        if job.error is not None:
+            st.error(f"Geocoding failed: {job.error}")
+            drop_job(job_key)
+            return
+        df = job.result
+        metrics.merge(job.metrics)
+
+        points = PointSet.from_frame(df, fields={"img": img_column, "address": address_column})
 
-        data = df.to_dict(orient="records")
-        
         # Generate and display the map
-        map_object, map_html = generate_map(data)
-        folium_static(map_object, width=800, height=600)
-
-        # Button to download the map as HTML
-        with open(map_html, "rb") as f:
-            html_bytes = f.read()
-        st.download_button(
-            label="Download Map as HTML",
-            data=html_bytes,
-            file_name="Principles_Map.html",
-            mime="text/html"
-        )
+        with metrics.stage("generate_map"):
+            map_object = generate_map(points)
+        metrics.set("markers", points.count(points.valid))
+        with metrics.stage("render"):
+            folium_static(map_object, width=800, height=600)
+
+        # Button to download the map as HTML, rendered in memory for this session
+        map_download_button(map_object, uploaded_file.file_id)
+        diagnostics_panel(metrics, map_object)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,138 @@
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+# Near-duplicates must share this trigram (Jaccard) similarity to be merged by fuzzy canonicalization
+DEFAULT_SIMILARITY = 0.75
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_ZIP_PLUS_FOUR = re.compile(r"\b(\d{5})-\d{4}\b")
+_ORDINAL = re.compile(r"\b(\d+)(?:st|nd|rd|th)\b")
+
+# USPS-style abbreviations, so "Street", "St" and "St." produce the same key
+ABBREVIATIONS = {
+    "street": "st", "str": "st", "avenue": "ave", "av": "ave", "boulevard": "blvd", "road": "rd",
+    "drive": "dr", "lane": "ln", "court": "ct", "place": "pl", "parkway": "pkwy", "highway": "hwy",
+    "circle": "cir", "terrace": "ter", "trail": "trl", "square": "sq", "expressway": "expy",
+    "suite": "ste", "apartment": "apt", "building": "bldg", "room": "rm",
+    "north": "n", "south": "s", "east": "e", "west": "w",
+    "northeast": "ne", "northwest": "nw", "southeast": "se", "southwest": "sw",
+    "saint": "st", "mount": "mt", "fort": "ft", "florida": "fl", "usa": "", "unitedstates": "",
+}
+
+# Tokens that tell otherwise identical addresses apart; fuzzy merging never crosses them
+DIRECTIONALS = {"n", "s", "e", "w", "ne", "nw", "se", "sw"}
+STREET_TYPES = {"st", "ave", "blvd", "rd", "dr", "ln", "ct", "pl", "pkwy", "hwy", "cir", "ter", "trl", "sq", "expy",
+                "way"}
+
+
+@lru_cache(maxsize=65536)
+def _canonicalize(text):
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    text = _ZIP_PLUS_FOUR.sub(r"\1", text)
+    text = text.replace("&", " and ").replace("united states", "unitedstates")
+    text = _ORDINAL.sub(r"\1", _NON_ALNUM.sub(" ", text))
+    tokens = [ABBREVIATIONS.get(token, token) for token in text.split()]
+    return " ".join(token for token in tokens if token)
+
+
+def canonicalize(address):
+    """
+    Canonical lookup key for an address: accents folded, lowercase, punctuation and whitespace collapsed,
+    ZIP+4 cut to the ZIP, ordinals reduced ("21st" -> "21") and common words abbreviated, so
+    "123 Main Street, Tampa" and "123 main st. tampa " share one key. Missing addresses give "".
+    """
+    if address is None or address != address:
+        return ""
+    return _canonicalize(str(address))
+
+
+def _block(key):
+    # Numbers (house number, ZIP, suite), directionals and street types, in order of appearance
+    return tuple(token for token in key.split()
+                 if token.isdigit() or token in DIRECTIONALS or token in STREET_TYPES)
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AddressIndex:
+    """
+    Incremental near-duplicate index over canonical keys.
+
+    Keys are only compared within a block of identical numbers (house number, ZIP, suite),
+    directionals and street types, so "123 Main St" never merges with "125 Main St", "123 N Main St"
+    or "123 Main Ave". Inside a block a trigram inverted index finds the
+    candidates sharing the most trigrams, and a key joins the first representative whose Jaccard
+    similarity reaches ``threshold``; otherwise it becomes a representative itself.
+    """
+
+    def __init__(self, threshold=DEFAULT_SIMILARITY):
+        self.threshold = threshold
+        self.representatives = []
+        self._grams = []
+        self._postings = {}
+        self._assigned = {}
+
+    def add(self, key):
+        """Return the representative key ``key`` belongs to, registering it as a new one if needed."""
+        found = self._assigned.get(key)
+        if found is not None:
+            return found
+        block = _block(key)
+        grams = _trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get((block, gram), ()))
+        for candidate, count in shared.most_common():
+            if count / (len(grams) + len(self._grams[candidate]) - count) >= self.threshold:
+                found = self.representatives[candidate]
+                break
+        if found is None:
+            candidate = len(self.representatives)
+            self.representatives.append(key)
+            self._grams.append(grams)
+            for gram in grams:
+                self._postings.setdefault((block, gram), []).append(candidate)
+            found = key
+        self._assigned[key] = found
+        return found
+
+
+def canonicalize_addresses(addresses, fuzzy=False, threshold=DEFAULT_SIMILARITY):
+    """
+    Map raw addresses to canonical lookup keys.
+
+    Parameters:
+        addresses (iterable): Raw addresses; duplicates and missing values are fine.
+        fuzzy (bool): Also merge near-duplicates (typos, missing words) with ``AddressIndex``.
+        threshold (float): Trigram similarity needed for a fuzzy merge.
+
+    Returns:
+        tuple: (dict raw address -> canonical key, report dict). The report counts the distinct raw
+        addresses, the distinct keys after normalization and after fuzzy merging, and how many raw
+        addresses collapsed into another one's key. Addresses with an empty key are left out.
+    """
+    mapping = {}
+    for address in addresses:
+        if address not in mapping:
+            mapping[address] = canonicalize(address)
+    mapping = {address: key for address, key in mapping.items() if key}
+    normalized = len(set(mapping.values()))
+    if fuzzy:
+        index = AddressIndex(threshold)
+        # Longest keys first, so the most complete spelling becomes the representative
+        merged = {key: index.add(key) for key in sorted(set(mapping.values()), key=len, reverse=True)}
+        mapping = {address: merged[key] for address, key in mapping.items()}
+    canonical = len(set(mapping.values()))
+    report = {
+        "raw_addresses": len(mapping),
+        "normalized_addresses": normalized,
+        "canonical_addresses": canonical,
+        "collapsed_addresses": len(mapping) - canonical,
+    }
+    return mapping, report
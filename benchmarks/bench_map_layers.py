@@ -0,0 +1,96 @@
+"""
+Compare the per-marker folium path with the canvas PointLayer path.
+
+Usage:
+    python benchmarks/bench_map_layers.py --points 1000 10000 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import folium
+from folium.plugins import MarkerCluster
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from map_layers import PointLayer, build_columns  # noqa: E402
+
+
+def synthetic_records(n, seed=0):
+    """Records shaped like the geocoded workbook, scattered over Florida."""
+    rng = random.Random(seed)
+    return [
+        {
+            "Latitude": rng.uniform(25.0, 30.5),
+            "Longitude": rng.uniform(-87.5, -80.0),
+            "People Attended": rng.randint(5, 500),
+            "Img": f"https://example.org/photos/{i}.jpg",
+        }
+        for i in range(n)
+    ]
+
+
+def build_per_marker(data):
+    # Mirrors the marker loop in Principles_exposure_map.generate_map
+    m = folium.Map(location=[28, -82], zoom_start=6, tiles="CartoDB dark_matter")
+    marker_cluster = MarkerCluster().add_to(m)
+    for entry in data:
+        tooltip_content = f"""
+        <div style="width:150px; text-align:center;">
+            <p>{entry['People Attended']} people Attended</p>
+            <img src= {entry['Img']} width="150px">
+        </div>
+        """
+        popup_html = f"""
+        <html><body>
+            <img src="{entry['Img']}" width="150px">
+        </body></html>
+        """
+        folium.CircleMarker(
+            location=[entry["Latitude"], entry["Longitude"]],
+            radius=int(entry["People Attended"]) * 0.1,
+            color="yellow",
+            fill=True,
+            fill_color="yellow",
+            fill_opacity=0.7,
+            tooltip=folium.Tooltip(tooltip_content, sticky=True),
+            popup=folium.Popup(popup_html, max_width=300),
+        ).add_to(marker_cluster)
+    return m
+
+
+def build_point_layer(data):
+    m = folium.Map(location=[28, -82], zoom_start=6, tiles="CartoDB dark_matter")
+    columns = build_columns(data, "Latitude", "Longitude", {"people": "People Attended", "img": "Img"})
+    PointLayer(columns, radius_field="people", radius_scale=0.1, color="yellow").add_to(m)
+    return m
+
+
+def measure(builder, data):
+    """Return (seconds to build and serialize the map, size of the HTML in bytes)."""
+    start = time.perf_counter()
+    html = builder(data).get_root().render()
+    return time.perf_counter() - start, len(html.encode("utf-8"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--skip-per-marker-above", type=int, default=50000,
+                        help="Skip the slow per-marker path above this many points")
+    args = parser.parse_args(argv)
+
+    print(f"{'points':>8} {'path':>12} {'seconds':>9} {'html bytes':>12}")
+    for n in args.points:
+        data = synthetic_records(n)
+        paths = [("point_layer", build_point_layer)]
+        if n <= args.skip_per_marker_above:
+            paths.insert(0, ("per_marker", build_per_marker))
+        for label, builder in paths:
+            seconds, size = measure(builder, data)
+            print(f"{n:>8} {label:>12} {seconds:>9.3f} {size:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Benchmark preprocessing, map building and HTML export end to end against a local mock LocationIQ.
+
+Usage:
+    python benchmarks/bench_pipeline.py --sheets 4 --rows 2500 --unique 1500 --latency 0.05 --rate-429 0.02
+    python benchmarks/bench_pipeline.py --latency 0.05 --slow-rate 0.03 --slow-latency 2 --hedge
+
+Writes a JSON report (default ``benchmarks/results/pipeline-<timestamp>.json``) so runs can be compared.
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from openpyxl import Workbook
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_locationiq import MockLocationIQ  # noqa: E402
+
+API_KEY = "benchmark"
+STREETS = ["Main St", "Oak Ave", "Palm Blvd", "Bay Dr", "Lake Rd", "Pine St", "Ocean Blvd", "Orange Ave"]
+CITIES = ["Tampa", "Orlando", "Miami", "Gainesville", "Tallahassee", "Jacksonville", "Sarasota", "Naples"]
+WORKSHOPS = ["Intro", "Advanced", "Community", "Youth"]
+
+
+def make_workbook(path, sheets=3, rows_per_sheet=1000, unique_addresses=500, seed=0):
+    """
+    Write a synthetic multi-sheet workbook shaped like the attendance workbooks.
+
+    Every sheet draws its addresses from one pool of ``unique_addresses``, so the duplication ratio
+    across the workbook is ``sheets * rows_per_sheet / unique_addresses``.
+    """
+    rng = random.Random(seed)
+    pool = [
+        f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, {rng.choice(CITIES)}, FL {rng.randint(32003, 34997)}"
+        for _ in range(unique_addresses)
+    ]
+    workbook = Workbook(write_only=True)
+    for index in range(sheets):
+        sheet = workbook.create_sheet(f"Sheet{index + 1}")
+        sheet.append(["Address", "People Attended", "Img", "Year", "name"])
+        for row in range(rows_per_sheet):
+            sheet.append([rng.choice(pool), rng.randint(5, 500), f"https://example.org/photos/{index}-{row}.jpg",
+                          rng.randint(2019, 2024), rng.choice(WORKSHOPS)])
+    workbook.save(path)
+    return os.path.getsize(path)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(function, *args, **kwargs):
+    """Return (result, seconds), silencing the progress printed by the pipeline."""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_preprocess(workbook, mock, workdir, workers, requests_per_second, hedge_url=None):
+    """
+    Run ``add_geocoded_columns_to_excel`` cold (empty cache and artifacts) and then warm, hedging slow
+    requests to ``hedge_url`` when given.
+    """
+    import Data_Preproccess
+    from geocode_cache import GeocodeCache
+    from geocoding import get_client
+    from hedging import get_hedged_client
+
+    results = []
+    data = None
+    client = get_client(API_KEY)
+    for run in ("cold", "warm"):
+        requests_before = mock.stats["requests"]
+        client_before = dict(client.stats)
+        cache = GeocodeCache(os.path.join(workdir, "geocode_cache.sqlite"))
+        data, seconds = timed(Data_Preproccess.add_geocoded_columns_to_excel, workbook, "Address", "People Attended",
+                              "Img", API_KEY, cache=cache, max_workers=workers,
+                              requests_per_second=requests_per_second, hyperlinks=False, hedge_url=hedge_url)
+        cache.close()
+        result = {
+            "stage": "add_geocoded_columns_to_excel",
+            "variant": run,
+            "seconds": round(seconds, 4),
+            "rows": len(data),
+            "geocoded_rows": int(data["Latitude"].notna().sum()),
+            "http_requests": mock.stats["requests"] - requests_before,
+            "retries": client.stats["retries"] - client_before["retries"],
+            "rate_limited": client.stats["rate_limited"] - client_before["rate_limited"],
+        }
+        if hedge_url:
+            result["hedging"] = get_hedged_client(API_KEY, hedge_url).summary()
+        results.append(result)
+    return data, results
+
+
+def map_points(data):
+    """One ``PointSet`` carrying every column the three apps' generate_map read."""
+    from pointset import PointSet
+
+    return PointSet.from_frame(data, year="Year", name="name", fields={"img": "Img", "address": "Address"})
+
+
+def bench_save(data, workdir):
+    """Write the consolidated rows with ``to_excel`` and with the streaming writer plus a Parquet copy."""
+    import Data_Preproccess
+    from excel_export import hyperlink_formulas
+
+    def naive(path):
+        frame = data.copy()
+        frame["Img"] = hyperlink_formulas(frame["Img"])
+        frame.to_excel(path, index=False)
+
+    results = []
+    naive_path = os.path.join(workdir, "naive.xlsx")
+    _, seconds = timed(naive, naive_path)
+    results.append({"stage": "save_consolidated_data", "variant": "to_excel", "seconds": round(seconds, 4),
+                    "bytes": os.path.getsize(naive_path)})
+    stream_path = os.path.join(workdir, "streamed.xlsx")
+    copy_path = os.path.join(workdir, "streamed.parquet")
+    _, seconds = timed(Data_Preproccess.save_consolidated_data, data, stream_path, hyperlink_columns=["Img"],
+                       copy_file=copy_path)
+    results.append({"stage": "save_consolidated_data", "variant": "streaming + parquet copy",
+                    "seconds": round(seconds, 4), "bytes": os.path.getsize(stream_path),
+                    "copy_bytes": os.path.getsize(copy_path)})
+    return results
+
+
+def bench_maps(points):
+    """Build each app's map, then measure the raw render and the in-memory export."""
+    os.environ.setdefault("LOCATIONIQ_API_KEY", API_KEY)
+    import PJI_Principles_Map_without_filter
+    import PJI_Principles_with_filter
+    import Principles_exposure_map
+    from map_export import export_map_html, gzip_bytes, render_html
+
+    variants = [
+        ("Principles_exposure_map", Principles_exposure_map.generate_map),
+        ("PJI_Principles_Map_without_filter", PJI_Principles_Map_without_filter.generate_map),
+        ("PJI_Principles_with_filter", PJI_Principles_with_filter.generate_map),
+    ]
+    results = []
+    for name, generate_map in variants:
+        m, build_seconds = timed(generate_map, points)
+        html, render_seconds = timed(render_html, m)
+        exported, export_seconds = timed(export_map_html, m)
+        results.append({
+            "stage": "generate_map",
+            "variant": name,
+            "points": points.count(points.valid),
+            "seconds": round(build_seconds, 4),
+            "render_seconds": round(render_seconds, 4),
+            "html_bytes": len(html.encode("utf-8")),
+            "html_gzip_bytes": len(gzip.compress(html.encode("utf-8"))),
+        })
+        results.append({
+            "stage": "export",
+            "variant": name,
+            "seconds": round(export_seconds, 4),
+            "bytes": len(exported),
+            "gzip_bytes": len(gzip_bytes(exported)),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sheets", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per sheet")
+    parser.add_argument("--unique", type=int, default=500, help="Distinct addresses across the workbook")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random mock latency in seconds")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of mock responses that are HTTP 429")
+    parser.add_argument("--rate-404", type=float, default=0.0, help="Share of addresses the mock cannot find")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of mock responses delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="Extra delay of the slow mock responses")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Hedge slow requests to a second mock server without the slow responses")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent geocoding requests")
+    parser.add_argument("--requests-per-second", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-maps", action="store_true", help="Only benchmark preprocessing")
+    parser.add_argument("--output", default=None, help="JSON report path")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results",
+                                         time.strftime("pipeline-%Y%m%d-%H%M%S.json"))
+    with tempfile.TemporaryDirectory() as workdir, \
+            MockLocationIQ(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429, rate_404=args.rate_404,
+                           seed=args.seed, slow_rate=args.slow_rate, slow_latency=args.slow_latency) as mock, \
+            MockLocationIQ(latency=args.latency, jitter=args.jitter, seed=args.seed + 1) as secondary:
+        # Keep the run isolated from the real cache, artifacts, gazetteer and API
+        os.environ["LOCATIONIQ_SEARCH_URL"] = mock.url
+        os.environ["GEOCODE_ARTIFACT_DIR"] = os.path.join(workdir, "artifacts")
+        os.environ["GAZETTEER_PATH"] = os.path.join(workdir, "no-gazetteer.csv")
+        os.environ["THUMBNAIL_DIR"] = os.path.join(workdir, "thumbnails")
+
+        workbook = os.path.join(workdir, "bench.xlsx")
+        (workbook_bytes, workbook_seconds) = timed(make_workbook, workbook, args.sheets, args.rows, args.unique,
+                                                   args.seed)
+        results = [{"stage": "make_workbook", "variant": "openpyxl", "seconds": round(workbook_seconds, 4),
+                    "bytes": workbook_bytes}]
+        data, preprocess = bench_preprocess(workbook, mock, workdir, args.workers, args.requests_per_second,
+                                            hedge_url=secondary.url if args.hedge else None)
+        results.extend(preprocess)
+        results.extend(bench_save(data, workdir))
+        if not args.skip_maps:
+            results.extend(bench_maps(map_points(data)))
+        mock_stats = dict(mock.stats)
+        secondary_stats = dict(secondary.stats)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "mock_server": mock_stats,
+        "secondary_mock_server": secondary_stats,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'stage':<32} {'variant':<36} {'seconds':>9} {'bytes':>12}")
+    for result in results:
+        size = result.get("bytes", result.get("html_bytes", ""))
+        print(f"{result['stage']:<32} {result['variant']:<36} {result['seconds']:>9.3f} {size:>12}")
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Local stand-in for the LocationIQ search endpoint with configurable latency and error rates.
+
+Usage:
+    python benchmarks/mock_locationiq.py --port 8765 --latency 0.2 --rate-429 0.05
+
+Point the geocoder at it with ``LOCATIONIQ_SEARCH_URL=http://127.0.0.1:8765/v1/search.php``.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_coordinates(address):
+    """Deterministic coordinates in Florida for an address, so repeated runs geocode identically."""
+    digest = hashlib.sha1(address.encode("utf-8")).digest()
+    lat = 25.0 + int.from_bytes(digest[:4], "big") / 2 ** 32 * 5.5
+    lon = -87.5 + int.from_bytes(digest[4:8], "big") / 2 ** 32 * 7.5
+    return round(lat, 6), round(lon, 6)
+
+
+class MockLocationIQ:
+    """
+    Threaded HTTP server answering ``/v1/search.php`` like LocationIQ.
+
+    Parameters:
+        latency (float): Seconds added to every response.
+        jitter (float): Extra random delay of up to this many seconds.
+        slow_rate (float): Share of requests delayed by a further ``slow_latency`` seconds, to model a
+            latency tail.
+        slow_latency (float): Delay of the slow requests.
+        rate_429 (float): Share of requests answered with HTTP 429.
+        rate_404 (float): Share of requests answered as "not found" (HTTP 404).
+        rate_500 (float): Share of requests answered with HTTP 500.
+        retry_after (float): ``Retry-After`` header sent with 429 responses.
+        host, port (str, int): Address to bind; port 0 picks a free port.
+        seed (int): Seed for the error and jitter draws.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_429=0.0, rate_404=0.0, rate_500=0.0, retry_after=0.0,
+                 host="127.0.0.1", port=0, seed=0, slow_rate=0.0, slow_latency=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.rate_429 = rate_429
+        self.rate_404 = rate_404
+        self.rate_500 = rate_500
+        self.retry_after = retry_after
+        self.stats = {"requests": 0, "ok": 0, "not_found": 0, "rate_limited": 0, "errors": 0, "slow": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/search.php"
+
+    def _draw(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            return self._random.random(), self._random.random(), self._random.random()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=()):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers:
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path != "/v1/search.php":
+                    self._send(404, {"error": "Unknown endpoint"})
+                    return
+                roll, delay, slow = mock._draw()
+                if slow < mock.slow_rate:
+                    mock._count("slow")
+                    delay_seconds = mock.slow_latency
+                else:
+                    delay_seconds = 0.0
+                time.sleep(mock.latency + delay * mock.jitter + delay_seconds)
+                address = parse_qs(parsed.query).get("q", [""])[0]
+                if roll < mock.rate_429:
+                    mock._count("rate_limited")
+                    self._send(429, {"error": "Rate Limited Second"}, [("Retry-After", str(mock.retry_after))])
+                elif roll < mock.rate_429 + mock.rate_500:
+                    mock._count("errors")
+                    self._send(500, {"error": "Internal Server Error"})
+                elif roll < mock.rate_429 + mock.rate_500 + mock.rate_404 or not address:
+                    mock._count("not_found")
+                    self._send(404, {"error": "Unable to geocode"})
+                else:
+                    mock._count("ok")
+                    lat, lon = fake_coordinates(address)
+                    self._send(200, [{"lat": str(lat), "lon": str(lon), "display_name": address}])
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-404", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    mock = MockLocationIQ(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429, rate_404=args.rate_404,
+                          rate_500=args.rate_500, retry_after=args.retry_after, port=args.port,
+                          slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+    print(f"Serving {mock.url}")
+    try:
+        mock._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock._server.server_close()
+        print(json.dumps(mock.stats))
+
+
+if __name__ == "__main__":
+    main()
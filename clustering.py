@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+TILE_SIZE = 256
+DEFAULT_MIN_ZOOM = 0
+DEFAULT_MAX_ZOOM = 14  # Above this zoom every point is drawn on its own
+DEFAULT_RADIUS = 60  # Cluster cell size in screen pixels
+
+
+def project(lat, lon, zoom):
+    """Return Web Mercator world pixel coordinates (x, y) of lat/lon arrays at a zoom level."""
+    scale = TILE_SIZE * 2.0 ** zoom
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    x = (lon + 180.0) / 360.0 * scale
+    sin_lat = np.clip(np.sin(np.radians(lat)), -0.9999, 0.9999)
+    y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)) * scale
+    return x, y
+
+
+def build_cluster_hierarchy(lat, lon, weight, min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM,
+                            radius=DEFAULT_RADIUS):
+    """
+    Precompute grid clusters for every zoom level, supercluster-style.
+
+    The finest level groups the points themselves; each coarser level groups the clusters of the
+    level below, so sums stay consistent across zooms. Centroids are the mean position of all points
+    in a cluster.
+
+    Parameters:
+        lat, lon (array-like): Point coordinates. Rows with missing coordinates are ignored.
+        weight (array-like): Value summed per cluster, e.g. people attended.
+        min_zoom, max_zoom (int): Zoom range to precompute.
+        radius (int): Cluster cell size in pixels.
+
+    Returns:
+        dict: {zoom: DataFrame with columns lat, lon, weight, count, point}. ``point`` is the original
+        row position for single-point clusters and -1 otherwise.
+    """
+    points = pd.DataFrame({
+        "lat": pd.to_numeric(pd.Series(lat), errors="coerce").to_numpy(),
+        "lon": pd.to_numeric(pd.Series(lon), errors="coerce").to_numpy(),
+        "weight": pd.to_numeric(pd.Series(weight), errors="coerce").fillna(0).to_numpy(),
+    })
+    points["point"] = np.arange(len(points))
+    points = points.dropna(subset=["lat", "lon"])
+
+    # Running sums let each level be built from the one below without revisiting the points
+    level = pd.DataFrame({
+        "sum_lat": points["lat"].to_numpy(),
+        "sum_lon": points["lon"].to_numpy(),
+        "weight": points["weight"].to_numpy(),
+        "count": np.ones(len(points), dtype=np.int64),
+        "point": points["point"].to_numpy(),
+    })
+
+    levels = {}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        x, y = project(level["sum_lat"] / level["count"], level["sum_lon"] / level["count"], zoom)
+        cell_x = np.floor(x / radius).astype(np.int64)
+        cell_y = np.floor(y / radius).astype(np.int64)
+        level = (
+            level.assign(cell_x=cell_x, cell_y=cell_y)
+            .groupby(["cell_x", "cell_y"], sort=False)
+            .agg(sum_lat=("sum_lat", "sum"), sum_lon=("sum_lon", "sum"), weight=("weight", "sum"),
+                 count=("count", "sum"), point=("point", "first"))
+            .reset_index(drop=True)
+        )
+        level.loc[level["count"] > 1, "point"] = -1
+        levels[zoom] = pd.DataFrame({
+            "lat": level["sum_lat"] / level["count"],
+            "lon": level["sum_lon"] / level["count"],
+            "weight": level["weight"],
+            "count": level["count"],
+            "point": level["point"],
+        })
+    return levels
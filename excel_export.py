@@ -0,0 +1,161 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+
+EXCEL_CHUNK_ROWS = 20000  # Rows converted to Python values at a time; memory stays bounded by this
+MAX_EXCEL_ROWS = 1048576  # Rows per worksheet, header included; longer exports continue on a new sheet
+MAX_FORMULA_STRING = 255  # Excel rejects longer string literals in a formula, so such URLs stay plain text
+MAX_CELL_CHARS = 32767  # Excel's limit per cell; longer text is cut off or makes the workbook fail to open
+
+
+def hyperlink_formulas(urls):
+    """
+    ``=HYPERLINK`` formulas for a Series of URLs, built column-wise.
+
+    Only http(s) URLs short enough for a formula literal become links, with quotes doubled as Excel
+    requires. Inlined ``data:`` thumbnails have nothing to link to and easily exceed Excel's cell limit,
+    so they become empty cells, as does any other value over ``MAX_CELL_CHARS``. Missing values stay
+    missing and the rest (longer URLs, local paths, existing formulas) are kept as plain text.
+    """
+    text = urls.astype("string")
+    quoted = text.str.replace('"', '""', regex=False)
+    formulas = '=HYPERLINK("' + quoted + '", "' + quoted + '")'
+    linkable = text.str.match(r"https?://", case=False) & (quoted.str.len() <= MAX_FORMULA_STRING)
+    dropped = text.str.startswith("data:") | (text.str.len() > MAX_CELL_CHARS)
+    values = formulas.where(linkable.fillna(False), urls).astype(object)
+    return values.where(urls.notna() & ~dropped.fillna(False), None)
+
+
+def _arrow_type(values, widen=False):
+    # Object columns are typed from all their values; text, mixed and all-missing ones become strings
+    if values.dtype != object:
+        arrow_type = pa.Schema.from_pandas(values.to_frame().head(0), preserve_index=False).field(0).type
+        return pa.float64() if widen and pa.types.is_integer(arrow_type) else arrow_type
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind == "integer" and not widen:
+        return pa.int64()
+    if kind in ("integer", "floating", "mixed-integer-float"):
+        return pa.float64()
+    if kind == "boolean":
+        return pa.bool_()
+    if kind in ("datetime", "datetime64"):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def arrow_schema(data, widen=False):
+    """
+    Arrow schema for writing ``data`` to Parquet, derived from whole columns rather than inferred per chunk.
+
+    Object columns that mix types (e.g. attendance numbers and "N/A") or hold no values at all are
+    typed as strings. With ``widen`` integer columns become floats, for when later chunks are unknown
+    and may bring missing or fractional values.
+    """
+    return pa.schema([pa.field(str(name), _arrow_type(data[name], widen)) for name in data.columns])
+
+
+class _CopyWriter:
+    # Appends chunks to a Parquet or CSV file chosen by its extension
+    def __init__(self, path, schema=None):
+        self.path = path
+        self.parquet = os.path.splitext(path)[1].lower() in (".parquet", ".pq")
+        self._writer = None
+        self._schema = schema
+        self._header = True
+
+    def write(self, chunk):
+        if self.parquet:
+            if self._schema is None:
+                self._schema = arrow_schema(chunk, widen=True)
+            chunk = chunk.copy()
+            for field in self._schema:
+                if pa.types.is_string(field.type) and chunk[field.name].dtype == object:
+                    chunk[field.name] = chunk[field.name].map(lambda value: None if pd.isna(value) else str(value))
+            table = pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            self._writer.write_table(table)
+        else:
+            chunk.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _iter_frames(data, chunk_rows):
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, max(len(data), 1), chunk_rows):
+            yield data.iloc[start:start + chunk_rows]
+    else:
+        yield from data
+
+
+def _cell_values(chunk, hyperlink_columns):
+    # One list of plain Python values per column, with missing values as empty cells
+    columns = []
+    for name in chunk.columns:
+        values = chunk[name]
+        if name in hyperlink_columns:
+            values = hyperlink_formulas(values)
+        columns.append(values.astype(object).where(values.notna(), None).tolist())
+    return columns
+
+
+def save_dataframe_to_excel_with_hyperlinks(data, output_file, hyperlink_columns=("Img",), copy_file=None,
+                                            sheet_name="Sheet1", chunk_rows=EXCEL_CHUNK_ROWS):
+    """
+    Stream a DataFrame to an Excel workbook with openpyxl's write-only mode.
+
+    Rows are converted and written one chunk at a time, so memory does not grow with the row count
+    the way ``DataFrame.to_excel`` does. Link columns become ``=HYPERLINK`` formulas, which unlike
+    cell hyperlinks need no relationship entry per cell and have no per-sheet limit.
+
+    Parameters:
+        data (DataFrame or iterable): The rows, or DataFrame chunks with identical columns.
+        output_file (str or file-like): Workbook to write.
+        hyperlink_columns (collection): Columns whose URLs become clickable; missing ones are ignored.
+        copy_file (str, optional): Also write the same rows (plain URLs) to this Parquet or CSV file. A
+            Parquet schema comes from the whole DataFrame, or from the first chunk (see ``arrow_schema``'s
+            ``widen``) when ``data`` is an iterable.
+        sheet_name (str): Worksheet name; rows beyond Excel's limit continue on "<name> (2)" and so on.
+        chunk_rows (int): Rows converted at a time when ``data`` is a single DataFrame.
+
+    Returns:
+        int: Number of data rows written.
+    """
+    workbook = Workbook(write_only=True)
+    schema = arrow_schema(data) if copy_file and isinstance(data, pd.DataFrame) else None
+    copy = _CopyWriter(copy_file, schema) if copy_file else None
+    sheet = None
+    sheets = 0
+    sheet_rows = 0
+    written = 0
+    header = None
+    try:
+        for chunk in _iter_frames(data, chunk_rows):
+            if header is None:
+                header = [str(name) for name in chunk.columns]
+            if copy is not None:
+                copy.write(chunk)
+            for row in zip(*_cell_values(chunk, set(hyperlink_columns))):
+                if sheet is None or sheet_rows == MAX_EXCEL_ROWS:
+                    sheets += 1
+                    sheet = workbook.create_sheet(sheet_name if sheets == 1 else f"{sheet_name} ({sheets})")
+                    sheet.append(header)
+                    sheet_rows = 1
+                sheet.append(row)
+                sheet_rows += 1
+                written += 1
+        if sheet is None:
+            # Keep the header of an empty export
+            workbook.create_sheet(sheet_name).append(header or [])
+        workbook.save(output_file)
+    finally:
+        if copy is not None:
+            copy.close()
+    return written
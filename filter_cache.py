@@ -0,0 +1,40 @@
+from collections import OrderedDict
+
+ALL_YEARS = "All Years"
+ALL_WORKSHOPS = "All Workshops"
+
+
+def label_sort_key(value):
+    """Sort key for filter labels: numbers sort numerically and everything else as text, never across types."""
+    return (0, value, "") if isinstance(value, (int, float)) else (1, 0, str(value))
+
+
+def empty_aggregate():
+    """Aggregate for a selection with no matching rows."""
+    return {"people": 0, "workshops": 0, "bounds": None}
+
+
+class LRUCache:
+    """Small least-recently-used cache, e.g. for built maps keyed by filter selection."""
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,112 @@
+import bisect
+import csv
+import os
+import re
+
+from addresses import canonicalize
+from geocoding import GeocoderBackend
+
+# CSV of known venues / ZIP centroids with address, lat and lon columns
+DEFAULT_GAZETTEER_PATH = os.environ.get("GAZETTEER_PATH", "gazetteer.csv")
+
+_ZIP = re.compile(r"\b(\d{5})(?:-\d{4})?\b")
+MIN_PREFIX_LENGTH = 8  # Shorter keys are too ambiguous for prefix matching
+
+
+def normalize_key(address):
+    """Canonical form of an address for gazetteer lookups, shared with the geocode cache keys."""
+    return canonicalize(address)
+
+
+class GazetteerGeocoder(GeocoderBackend):
+    """
+    Offline geocoder answering from an in-memory index of known places.
+
+    Lookups try, in order: the exact address, its normalized form, a unique gazetteer entry that
+    starts with the normalized address, the longest gazetteer entry the address starts with (so
+    "123 Main St, Tampa FL" finds "123 Main St"), and optionally the address's ZIP code.
+
+    Parameters:
+        entries (iterable): (address, lat, lon) tuples.
+        zip_fallback (bool): Fall back to a ZIP centroid entry when the address contains a ZIP code.
+    """
+
+    name = "gazetteer"
+    is_local = True
+
+    def __init__(self, entries=(), zip_fallback=True):
+        self.zip_fallback = zip_fallback
+        self.exact = {}
+        self.normalized = {}
+        for address, lat, lon in entries:
+            coords = (float(lat), float(lon))
+            self.exact[str(address)] = coords
+            self.normalized.setdefault(normalize_key(address), coords)
+        self.keys = sorted(self.normalized)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_csv(cls, path, address_column="address", lat_column="lat", lon_column="lon", **kwargs):
+        """Load a gazetteer from a CSV file with address, latitude and longitude columns."""
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            rows = csv.DictReader(f)
+            entries = [
+                (row[address_column], row[lat_column], row[lon_column])
+                for row in rows
+                if row.get(address_column) and row.get(lat_column) and row.get(lon_column)
+            ]
+        return cls(entries, **kwargs)
+
+    def __len__(self):
+        return len(self.normalized)
+
+    def _prefix_match(self, key):
+        if len(key) < MIN_PREFIX_LENGTH:
+            return None
+        # Entries starting with the key form one contiguous run in the sorted key list
+        start = bisect.bisect_left(self.keys, key)
+        end = bisect.bisect_left(self.keys, key + "\uffff", lo=start)
+        if end - start == 1:
+            return self.normalized[self.keys[start]]
+        return None
+
+    def _longest_prefix_of(self, key):
+        tokens = key.split(" ")
+        for size in range(len(tokens) - 1, 1, -1):
+            coords = self.normalized.get(" ".join(tokens[:size]))
+            if coords is not None:
+                return coords
+        return None
+
+    def lookup(self, address):
+        """Return (lat, lon) for an address, or None when the gazetteer does not know it."""
+        if address is None:
+            return None
+        coords = self.exact.get(str(address))
+        if coords is not None:
+            return coords
+        key = normalize_key(address)
+        if not key:
+            return None
+        coords = self.normalized.get(key) or self._prefix_match(key) or self._longest_prefix_of(key)
+        if coords is None and self.zip_fallback:
+            match = _ZIP.search(str(address))
+            if match:
+                coords = self.normalized.get(match.group(1))
+        return coords
+
+    def geocode(self, address):
+        coords = self.lookup(address)
+        if coords is None:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        return coords
+
+
+def load_default_gazetteer(path=DEFAULT_GAZETTEER_PATH):
+    """Return the gazetteer at ``path``, or None when no gazetteer file is present."""
+    if not path or not os.path.exists(path):
+        return None
+    return GazetteerGeocoder.from_csv(path)
@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import threading
+import time
+
+from addresses import canonicalize
+
+# Default location of the on-disk geocode store, shared by the Streamlit apps and the batch preprocessor
+DEFAULT_CACHE_PATH = os.environ.get("GEOCODE_CACHE_PATH", "geocode_cache.sqlite")
+DEFAULT_TTL_SECONDS = 90 * 24 * 60 * 60  # Venues rarely move, keep results for ~3 months
+DEFAULT_MAX_ENTRIES = 200_000
+EVICT_EVERY = 500  # Run the (table-scanning) eviction pass once per this many writes
+TOUCH_RESOLUTION = 60 * 60  # Access times are only refreshed when older than this; LRU order needs no more
+TOUCH_BATCH = 500  # Refreshed access times are written in one transaction per this many
+SCHEMA_VERSION = 1  # 1: rows are keyed by ``addresses.canonicalize`` instead of the raw address
+
+
+class GeocodeCache:
+    """
+    Persistent address -> (latitude, longitude) store backed by SQLite.
+
+    Entries older than ``ttl_seconds`` are treated as misses and removed. When the store grows past
+    ``max_entries`` the least recently used rows are evicted. ``hits`` and ``misses`` count lookups
+    made through this instance, so a fresh instance per run gives per-run numbers.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS geocodes (
+                address TEXT PRIMARY KEY,
+                lat REAL,
+                lon REAL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_geocodes_accessed ON geocodes (accessed_at)")
+        self._conn.commit()
+        self._migrate()
+
+    def _migrate(self):
+        # Re-key rows written before lookups used canonical addresses, so they keep answering
+        with self._lock:
+            (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+            if version >= SCHEMA_VERSION:
+                return
+            rows = self._conn.execute("SELECT address, lat, lon, created_at, accessed_at FROM geocodes").fetchall()
+            for address, lat, lon, created_at, accessed_at in rows:
+                key = canonicalize(address)
+                if key == address:
+                    continue
+                if key:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO geocodes (address, lat, lon, created_at, accessed_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (key, lat, lon, created_at, accessed_at),
+                    )
+                self._conn.execute("DELETE FROM geocodes WHERE address = ?", (address,))
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn.commit()
+
+    def get(self, address):
+        """
+        Return the cached (lat, lon) for an address, or None when it is missing or expired. A hit queues an
+        access-time refresh instead of writing, so warm runs stay read-only until ``TOUCH_BATCH`` hits.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT lat, lon, created_at, accessed_at FROM geocodes WHERE address = ?", (address,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            lat, lon, created_at, accessed_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM geocodes WHERE address = ?", (address,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            if now - accessed_at > TOUCH_RESOLUTION:
+                self._touched[address] = now
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._flush_touched()
+                    self._conn.commit()
+            self.hits += 1
+            return lat, lon
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany("UPDATE geocodes SET accessed_at = ? WHERE address = ?",
+                                   [(accessed_at, address) for address, accessed_at in self._touched.items()])
+            self._touched = {}
+
+    def set(self, address, lat, lon):
+        """Store the coordinates for an address, evicting old entries if the store is full."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocodes (address, lat, lon, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (address, lat, lon, now, now),
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._flush_touched()
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Drop expired rows first, then the least recently used ones above the size limit
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM geocodes WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        if self.max_entries is not None:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM geocodes WHERE address IN "
+                    "(SELECT address FROM geocodes ORDER BY accessed_at ASC LIMIT ?)",
+                    (excess,),
+                )
+
+    def evict(self):
+        """Apply the TTL and size limits immediately."""
+        with self._lock:
+            self._flush_touched()
+            self._evict()
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()
+        return count
+
+    def stats(self):
+        """Return hit/miss counters for this instance and the number of stored entries."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._evict()
+            self._conn.commit()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,162 @@
+import threading
+import time
+import traceback
+
+import pandas as pd
+
+from addresses import canonicalize_addresses
+from metrics import Metrics
+
+MAX_JOBS = 4  # Jobs kept per process; finished ones beyond this are forgotten, oldest first
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's function once the job has been cancelled."""
+
+
+class GeocodeJob:
+    """
+    Runs a geocoding pipeline in a background thread and exposes its partial results.
+
+    ``function`` is called as ``function(*args, job=self, **kwargs)`` and reports back through the job:
+    ``set_frame`` once the rows are read, ``record`` for every resolved address (a
+    ``geocode_addresses`` result callback), ``progress`` and ``log``. Its return value becomes
+    ``result``; an exception is kept in ``error``. ``partial_frame`` returns the rows with the
+    coordinates resolved so far, so a UI can draw the map while the rest stream in.
+
+    ``cancel`` asks the function to stop: ``progress`` and ``check_cancelled`` then raise
+    ``JobCancelled``. A job started ``after`` another one waits for it to stop before running, so two jobs
+    never write the same journal or artifact at once.
+    """
+
+    def __init__(self, function, *args, after=None, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.after = after
+        self.cancelled = False
+        self.metrics = Metrics()
+        self.messages = []
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished_at = None
+        self.done_count = 0
+        self.total = 0
+        self.group = None
+        self._frame = None
+        self._keys = None
+        self._coords = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            if self.after is not None and not self.after.finished:
+                self.log("Waiting for the previous run of this dataset to stop")
+                self.after.join()
+            self.after = None
+            self.check_cancelled()
+            self.result = self.function(*self.args, job=self, **self.kwargs)
+        except Exception as exc:
+            self.error = exc
+            self.log("".join(traceback.format_exception_only(type(exc), exc)).strip())
+        finally:
+            self.finished_at = time.time()
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled("Superseded by a newer upload of this dataset")
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def set_frame(self, frame, address_column):
+        """Register the rows being geocoded; their canonical keys match the ``record`` calls."""
+        mapping, _ = canonicalize_addresses(pd.unique(frame[address_column]))
+        with self._lock:
+            self._frame = frame
+            self._keys = frame[address_column].map(mapping)
+
+    def record(self, key, lat, lon):
+        if lat is not None and lon is not None:
+            with self._lock:
+                self._coords[key] = (lat, lon)
+
+    def progress(self, done, total):
+        self.done_count, self.total = done, total
+        self.check_cancelled()
+
+    def log(self, message):
+        with self._lock:
+            self.messages.append(message)
+
+    @property
+    def resolved(self):
+        """Number of distinct addresses resolved so far."""
+        return len(self._coords)
+
+    def partial_frame(self):
+        """The rows read so far with every coordinate resolved up to now, or None before the read."""
+        with self._lock:
+            frame, keys, coords = self._frame, self._keys, dict(self._coords)
+        if frame is None:
+            return None
+        frame = frame.copy()
+        for column, position in (("Latitude", 0), ("Longitude", 1)):
+            lookup = pd.Series({key: value[position] for key, value in coords.items()}, dtype=float)
+            resolved = keys.map(lookup).astype(float)
+            if column in frame.columns:
+                resolved = pd.to_numeric(frame[column], errors="coerce").fillna(resolved)
+            frame[column] = resolved
+        return frame
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def get_job(key, function, *args, group=None, **kwargs):
+    """
+    Return the process-wide job for ``key``, starting ``function`` in the background if there is none,
+    so reruns, reconnects and other sessions with the same upload attach to the running job.
+
+    ``key`` should identify the upload's content. Jobs sharing a ``group`` (e.g. the artifact name that
+    keys the journal and artifact) run one at a time: a new job cancels the group's running one and
+    starts once it has stopped, resuming from its journal.
+    """
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is None:
+            previous = None
+            for other in _jobs.values():
+                if group is not None and other.group == group and not other.finished:
+                    other.cancel()
+                    previous = other
+            job = GeocodeJob(function, *args, after=previous, **kwargs)
+            job.group = group
+            _jobs[key] = job.start()
+            finished = sorted((other.finished_at, name) for name, other in _jobs.items() if other.finished)
+            for _, name in finished[:max(0, len(_jobs) - MAX_JOBS)]:
+                del _jobs[name]
+        return job
+
+
+def drop_job(key):
+    """Forget the job for ``key``, e.g. after it failed, so the next request starts a fresh one."""
+    with _jobs_lock:
+        _jobs.pop(key, None)
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+
+from addresses import canonicalize
+
+FSYNC_EVERY = 50  # Force results to disk after this many records; a crash loses at most this many
+
+
+class GeocodeJournal:
+    """
+    Append-only JSONL log of geocoding results for one run.
+
+    Every definitive remote result (coordinates or "not found") is appended as soon as it arrives, so a run that is
+    interrupted can be restarted and will only look up the addresses that are not in the journal
+    yet. A torn last line from a crash is discarded on load. Call ``complete`` once the run's output has
+    been saved to remove the journal. Addresses are matched by ``addresses.canonicalize``, so journals
+    written with raw addresses still resume into canonical keys.
+
+    Parameters:
+        path (str): Journal file, created if missing and appended to otherwise.
+        retry_failed (bool): Ignore journaled "not found" results on load so those addresses are looked
+            up again. Failed lookups (errors, an open circuit) are never journaled, so they always are.
+    """
+
+    def __init__(self, path, retry_failed=False):
+        self.path = path
+        self.retry_failed = retry_failed
+        self.results = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._load()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        valid_end = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                valid_end += len(line)
+                if self.retry_failed and record["lat"] is None:
+                    continue
+                self.results[canonicalize(record["address"])] = (record["lat"], record["lon"])
+        # Drop a torn write left by a crash so new records start on a fresh line
+        if valid_end < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_end)
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, address):
+        """Return the journaled (lat, lon) for an address, or None if it has not been looked up yet."""
+        return self.results.get(canonicalize(address))
+
+    def record(self, address, lat, lon):
+        """Append a result and flush it to the OS; fsync every ``FSYNC_EVERY`` records."""
+        line = json.dumps({"address": address, "lat": lat, "lon": lon}) + "\n"
+        with self._lock:
+            self.results[canonicalize(address)] = (lat, lon)
+            self._file.write(line)
+            self._file.flush()
+            self._pending += 1
+            if self._pending >= FSYNC_EVERY:
+                os.fsync(self._file.fileno())
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    def complete(self):
+        """Close and delete the journal after the run's results have been saved elsewhere."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,420 @@
+import abc
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from addresses import DEFAULT_SIMILARITY, canonicalize_addresses
+
+# LocationIQ's free plan allows 2 requests/second; paid plans can raise this via the environment
+DEFAULT_REQUESTS_PER_SECOND = float(os.environ.get("LOCATIONIQ_RPS", "2"))
+DEFAULT_MAX_WORKERS = int(os.environ.get("GEOCODE_WORKERS", "8"))
+
+# Overridable so benchmarks can point the client at a local stand-in server
+LOCATIONIQ_SEARCH_URL = os.environ.get("LOCATIONIQ_SEARCH_URL", "https://us1.locationiq.com/v1/search.php")
+
+
+class TokenBucket:
+    """Thread-safe token bucket that limits how often ``acquire`` returns."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = float(rate)
+            self.capacity = max(1.0, self.rate)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeocoderBackend(abc.ABC):
+    """
+    Interface for geocoder backends.
+
+    ``geocode`` returns (lat, lon) as floats, or (None, None) when the backend has no answer. Local
+    backends (``is_local = True``) are consulted before the persistent cache and the rate-limited
+    remote tier, since answering them costs nothing.
+    """
+
+    name = "backend"
+    is_local = False
+
+    @abc.abstractmethod
+    def geocode(self, address):
+        """Return (lat, lon) for ``address``, or (None, None) when there is no answer."""
+
+
+def geocode_addresses(addresses, geocode, cache=None, max_workers=DEFAULT_MAX_WORKERS,
+                      requests_per_second=DEFAULT_REQUESTS_PER_SECOND, progress_callback=None, local=None,
+                      journal=None, keys=None, result_callback=None):
+    """
+    Geocode a list of addresses concurrently while respecting a requests-per-second budget.
+
+    Parameters:
+        addresses (list): Addresses to geocode.
+        geocode (callable): Function taking an address and returning (lat, lon), or (None, None) when the
+            address does not exist. It should raise (e.g. ``GeocodingError``) when the lookup itself
+            failed, so the result is not journaled as final. ``None`` disables the remote tier, e.g. for
+            offline runs.
+        cache (GeocodeCache, optional): Persistent store consulted before calling ``geocode``.
+        max_workers (int): Number of concurrent requests in flight.
+        requests_per_second (float): Rate limit for ``geocode`` calls; ``None`` disables it, e.g. when
+            ``geocode`` goes through a ``GeocoderClient`` that limits every HTTP request itself.
+        progress_callback (callable, optional): Called as ``progress_callback(done, total)`` from the
+            calling thread each time an address completes.
+        local (GeocoderBackend or list, optional): Local backends tried first, in order.
+        journal (GeocodeJournal, optional): Run journal. Addresses it already holds are not looked up
+            again, and every definitive remote result is appended to it as soon as it completes.
+        keys (list, optional): Cache and journal key for each address, e.g. its canonical form.
+            Defaults to the addresses themselves.
+        result_callback (callable, optional): Called as ``result_callback(key, lat, lon)`` for every
+            address as soon as it is resolved, from any tier, so callers can show partial results.
+
+    Returns:
+        list: (lat, lon) tuples in the same order as ``addresses``.
+    """
+    if local is None:
+        local = []
+    elif isinstance(local, GeocoderBackend):
+        local = [local]
+    if keys is None:
+        keys = addresses
+    total = len(addresses)
+    results = [(None, None)] * total
+    done = 0
+    pending = []
+
+    # Answer what we can locally and from the cache without spending any of the rate budget
+    for i, address in enumerate(addresses):
+        found = None
+        for backend in local:
+            lat, lon = backend.geocode(address)
+            if lat is not None and lon is not None:
+                found = (lat, lon)
+                break
+        if found is None and cache is not None:
+            found = cache.get(keys[i])
+        if found is None and journal is not None:
+            found = journal.get(keys[i])
+        if found is not None:
+            results[i] = found
+            done += 1
+            if result_callback is not None:
+                result_callback(keys[i], *found)
+        else:
+            pending.append(i)
+    if progress_callback is not None and done:
+        progress_callback(done, total)
+    if not pending or geocode is None:
+        return results
+
+    bucket = TokenBucket(requests_per_second) if requests_per_second else None
+
+    def worker(address):
+        if bucket is not None:
+            bucket.acquire()
+        return geocode(address)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(worker, addresses[i]): i for i in pending}
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    lat, lon = future.result()
+                    failed = False
+                except Exception:
+                    lat, lon = None, None
+                    failed = True
+                results[i] = (lat, lon)
+                if cache is not None and lat is not None and lon is not None:
+                    cache.set(keys[i], lat, lon)
+                # Only definitive answers are journaled; a failed lookup is tried again when the run resumes
+                if journal is not None and not failed:
+                    journal.record(keys[i], lat, lon)
+                if result_callback is not None:
+                    result_callback(keys[i], lat, lon)
+                done += 1
+                if progress_callback is not None:
+                    progress_callback(done, total)
+        except BaseException:
+            # E.g. a cancelled job raising from a callback: drop the queued lookups instead of waiting for them
+            for future in futures:
+                future.cancel()
+            raise
+
+    return results
+
+
+def geocode_frame(data, address_column, geocode, cache=None, fuzzy=False, similarity=DEFAULT_SIMILARITY, **kwargs):
+    """
+    Geocode each distinct address in ``data`` once and join the coordinates back in one merge.
+
+    Addresses are grouped by their canonical form (see ``addresses.canonicalize``), so spelling variants
+    of one place share a single lookup and cache entry; ``fuzzy`` also merges near-duplicates whose
+    similarity reaches ``similarity``. The first spelling seen is the one sent to the geocoder. Rows that
+    already have a Latitude are left alone. Extra keyword arguments are passed through to
+    ``geocode_addresses``.
+
+    Returns:
+        tuple: (DataFrame with Latitude/Longitude filled, dict of lookup statistics). The statistics
+        report the number of rows needing coordinates, the distinct addresses actually looked up, how
+        many lookups deduplication saved, and how many distinct raw spellings collapsed into how many
+        canonical addresses.
+    """
+    data = data.copy()
+    for column in ("Latitude", "Longitude"):
+        if column not in data.columns:
+            data[column] = float("nan")
+        data[column] = pd.to_numeric(data[column], errors="coerce")
+
+    needs_coords = data[address_column].notna() & data["Latitude"].isna()
+    raw_addresses = pd.unique(data.loc[needs_coords, address_column])
+    canonical, report = canonicalize_addresses(raw_addresses, fuzzy=fuzzy, threshold=similarity)
+    keys = data[address_column].map(canonical)
+    # One representative spelling per canonical key, in order of first appearance
+    representatives = {}
+    for address in raw_addresses:
+        representatives.setdefault(canonical.get(address), address)
+    representatives.pop(None, None)
+    unique_keys = list(representatives)
+    coords = geocode_addresses(list(representatives.values()), geocode, cache=cache, keys=unique_keys, **kwargs)
+
+    lookup = pd.DataFrame(coords, columns=["_lat", "_lon"], dtype=float)
+    lookup["_key"] = unique_keys
+    merged = pd.DataFrame({"_key": keys}).merge(lookup, on="_key", how="left", validate="many_to_one")
+    data["Latitude"] = data["Latitude"].fillna(pd.Series(merged["_lat"].to_numpy(), index=data.index))
+    data["Longitude"] = data["Longitude"].fillna(pd.Series(merged["_lon"].to_numpy(), index=data.index))
+
+    rows = int(needs_coords.sum())
+    stats = {"rows": rows, "unique_addresses": len(unique_keys), "lookups_saved": rows - len(unique_keys)}
+    stats.update(report)
+    return data, stats
+
+
+class GeocodingError(Exception):
+    """Raised when a lookup failed (network, server, quota or request errors) rather than finding nothing."""
+
+
+class CircuitOpenError(GeocodingError):
+    """Raised when the geocoder has seen too many recent failures and is refusing new requests."""
+
+
+class GeocoderClient(GeocoderBackend):
+    """
+    LocationIQ client with a pooled keep-alive session, timeouts, retries and a circuit breaker.
+
+    Transient failures (timeouts, connection errors, 5xx) are retried with exponential backoff and
+    full jitter. HTTP 429 responses wait for the server's ``Retry-After`` before retrying. When the
+    share of failed requests in the last ``breaker_window`` calls reaches ``breaker_threshold`` the
+    circuit opens and ``geocode`` returns (None, None) without calling the API for
+    ``breaker_cooldown`` seconds. With a ``limiter`` (see ``get_rate_limiter``) every HTTP request,
+    retries included, first takes a token from it.
+    """
+
+    name = "locationiq"
+
+    def __init__(self, api_key, base_url=LOCATIONIQ_SEARCH_URL, retries=3, connect_timeout=3.05, read_timeout=10,
+                 backoff_base=0.5, backoff_max=30, max_retry_after=60, pool_size=DEFAULT_MAX_WORKERS,
+                 breaker_window=50, breaker_threshold=0.5, breaker_min_calls=10, breaker_cooldown=60, limiter=None):
+        self.api_key = api_key
+        self.limiter = limiter
+        self.base_url = base_url
+        self.retries = retries
+        self.timeout = (connect_timeout, read_timeout)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.breaker_threshold = breaker_threshold
+        self.breaker_min_calls = breaker_min_calls
+        self.breaker_cooldown = breaker_cooldown
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._outcomes = deque(maxlen=breaker_window)
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "errors": 0, "rate_limited": 0, "short_circuited": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _record(self, ok):
+        with self._lock:
+            self._outcomes.append(ok)
+            if len(self._outcomes) >= self.breaker_min_calls:
+                error_rate = self._outcomes.count(False) / len(self._outcomes)
+                if error_rate >= self.breaker_threshold:
+                    self._open_until = time.monotonic() + self.breaker_cooldown
+                    self._outcomes.clear()
+
+    def circuit_open(self):
+        """Return True while the circuit breaker is refusing requests."""
+        return time.monotonic() < self._open_until
+
+    def _backoff(self, attempt):
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        try:
+            return min(self.max_retry_after, max(0.0, float(value)))
+        except (TypeError, ValueError):
+            return None
+
+    def _request(self, params, timings, sent):
+        # The wait for a rate-limit token is timed apart from the round trip, so latency stays the provider's
+        start = time.perf_counter()
+        if self.limiter is not None:
+            self.limiter.acquire()
+        if sent is not None:
+            sent.set()
+        sent_at = time.perf_counter()
+        self._count("requests")
+        try:
+            return self.session.get(self.base_url, params=params, timeout=self.timeout)
+        finally:
+            timings["queued_seconds"] = timings.get("queued_seconds", 0.0) + sent_at - start
+            timings["request_seconds"] = timings.get("request_seconds", 0.0) + time.perf_counter() - sent_at
+
+    def search(self, address, retries=None, timings=None, sent=None):
+        """
+        Geocode an address, raising ``GeocodingError`` when the lookup fails after all retries and
+        ``CircuitOpenError`` if the breaker is open.
+
+        Parameters:
+            address (str): Address to look up.
+            retries (int, optional): Attempts before giving up. Defaults to the client's ``retries``.
+            timings (dict, optional): Receives ``request_seconds``, the time spent in HTTP requests, and
+                ``queued_seconds``, the time spent waiting for the rate limiter, summed over all attempts.
+                Neither is set when no request was sent.
+            sent (threading.Event, optional): Set when the first request goes out, i.e. after the wait for
+                the rate limiter.
+
+        Returns:
+            tuple: (lat, lon) as floats, or (None, None) if LocationIQ has no match for the address.
+        """
+        timings = {} if timings is None else timings
+        if self.circuit_open():
+            self._count("short_circuited")
+            raise CircuitOpenError("Geocoder circuit breaker is open")
+
+        retries = self.retries if retries is None else retries
+        params = {"key": self.api_key, "q": address, "format": "json"}
+        for attempt in range(retries):
+            if attempt:
+                self._count("retries")
+            delay = None
+            try:
+                response = self._request(params, timings, sent)
+            except requests.RequestException:
+                self._record(False)
+                self._count("errors")
+                delay = self._backoff(attempt)
+            else:
+                if response.status_code == 404:
+                    # LocationIQ answers 404 for addresses it cannot find, which is not a failure
+                    self._record(True)
+                    return None, None
+                if response.status_code == 429:
+                    self._count("rate_limited")
+                    self._record(False)
+                    delay = self._retry_after(response)
+                    if delay is None:
+                        delay = self._backoff(attempt)
+                elif response.status_code >= 500:
+                    self._record(False)
+                    self._count("errors")
+                    delay = self._backoff(attempt)
+                elif response.status_code >= 400:
+                    # Bad key or malformed request: retrying will not help
+                    self._record(False)
+                    self._count("errors")
+                    raise GeocodingError(f"LocationIQ answered HTTP {response.status_code}")
+                else:
+                    self._record(True)
+                    try:
+                        data = response.json()
+                    except ValueError:
+                        data = []
+                    if len(data) > 0:
+                        return float(data[0]["lat"]), float(data[0]["lon"])
+                    return None, None
+
+            if self.circuit_open():
+                self._count("short_circuited")
+                raise CircuitOpenError("Geocoder circuit breaker is open")
+            if attempt < retries - 1:
+                time.sleep(delay)
+        raise GeocodingError(f"Geocoding failed after {retries} attempts")
+
+    def geocode(self, address, retries=None):
+        """Geocode an address, returning (None, None) on any failure including an open circuit."""
+        try:
+            return self.search(address, retries=retries)
+        except GeocodingError:
+            return None, None
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_limiters = {}
+_clients_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key, requests_per_second=None):
+    """
+    Return the process-wide token bucket for an API key, shared by every client, region and run using
+    it, since LocationIQ enforces the quota per key. ``requests_per_second`` changes its rate; it starts
+    at ``DEFAULT_REQUESTS_PER_SECOND``.
+    """
+    with _clients_lock:
+        limiter = _limiters.get(api_key)
+        if limiter is None:
+            limiter = _limiters[api_key] = TokenBucket(requests_per_second or DEFAULT_REQUESTS_PER_SECOND)
+    if requests_per_second and requests_per_second != limiter.rate:
+        limiter.set_rate(requests_per_second)
+    return limiter
+
+
+def get_client(api_key):
+    """
+    Return a process-wide GeocoderClient for the API key so its connection pool is reused. Its requests
+    are limited by the key's ``get_rate_limiter`` bucket.
+    """
+    limiter = get_rate_limiter(api_key)
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = GeocoderClient(api_key, limiter=limiter)
+        return client
@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+import numpy as np
+
+from geocoding import GeocoderBackend, GeocoderClient, GeocodingError, get_client, get_rate_limiter
+
+# Secondary endpoint for hedged requests, e.g. LocationIQ's EU region https://eu1.locationiq.com/v1/search.php
+LOCATIONIQ_HEDGE_URL = os.environ.get("LOCATIONIQ_HEDGE_URL")
+DEFAULT_HEDGE_PERCENTILE = 95  # Hedge once the primary is slower than this share of its recent answers
+DEFAULT_HEDGE_BUDGET = 0.1  # At most this share of calls may send a hedge, so a slow primary cannot double the load
+LATENCY_WINDOW = 200  # Recent primary latencies the hedge delay is computed from
+MIN_SAMPLES = 20  # Below this many samples ``initial_delay`` is used
+DEFAULT_INITIAL_DELAY = 1.0
+MIN_DELAY = 0.05
+
+
+class ProviderStats:
+    """Request outcomes and recent latencies of one provider."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.counts = {"requests": 0, "ok": 0, "empty": 0, "errors": 0, "wins": 0}
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, outcome, latency):
+        with self._lock:
+            self.counts["requests"] += 1
+            self.counts[outcome] += 1
+            self.latencies.append(latency)
+
+    def win(self):
+        with self._lock:
+            self.counts["wins"] += 1
+
+    def percentile(self, q):
+        with self._lock:
+            latencies = list(self.latencies)
+        return float(np.percentile(latencies, q)) if latencies else None
+
+    def summary(self):
+        summary = dict(self.counts)
+        for q in (50, 95, 99):
+            value = self.percentile(q)
+            summary[f"p{q}_seconds"] = round(value, 4) if value is not None else None
+        return summary
+
+
+class HedgedGeocoder(GeocoderBackend):
+    """
+    Geocoder that hedges slow requests to a secondary provider.
+
+    Each address goes to the primary first. If it has not answered within the ``percentile`` of its
+    recent latencies, the same address is also sent to the secondary and the first answer with
+    coordinates wins; an empty answer from one provider waits for the other. The losing request is
+    not cancelled, but its result is only used for the statistics. Hedges are limited to ``budget``
+    of all calls. Each provider request runs on its own thread, so abandoned slow requests never delay
+    later calls; rate limits are left to the providers (``GeocoderClient``'s ``limiter``). For a
+    ``GeocoderClient`` both the recorded latency and the hedge delay leave out the wait for the limiter.
+
+    Parameters:
+        primary, secondary (GeocoderBackend): Providers, e.g. two ``GeocoderClient`` endpoints.
+        percentile (float): Primary latency percentile after which a hedge is sent.
+        budget (float): Largest share of calls allowed to send a hedge.
+        initial_delay (float): Hedge delay used until ``MIN_SAMPLES`` primary latencies are known.
+        min_delay (float): Lower bound of the hedge delay.
+    """
+
+    name = "hedged"
+
+    def __init__(self, primary, secondary, percentile=DEFAULT_HEDGE_PERCENTILE, budget=DEFAULT_HEDGE_BUDGET,
+                 initial_delay=DEFAULT_INITIAL_DELAY, min_delay=MIN_DELAY):
+        self.providers = [primary, secondary]
+        self.percentile = percentile
+        self.budget = budget
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.provider_stats = {self._label(0): ProviderStats(), self._label(1): ProviderStats()}
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "over_budget": 0, "abandoned": 0}
+        self._lock = threading.Lock()
+
+    def _label(self, position):
+        return f"{'primary' if position == 0 else 'secondary'}_{getattr(self.providers[position], 'name', 'backend')}"
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def hedge_delay(self):
+        """Seconds to wait for the primary before hedging."""
+        primary = self.provider_stats[self._label(0)]
+        if len(primary.latencies) < MIN_SAMPLES:
+            return self.initial_delay
+        return max(self.min_delay, primary.percentile(self.percentile))
+
+    def _call(self, position, address, sent):
+        # (lat, lon, failed, latency); providers with ``search`` raise on failure, plain backends cannot tell
+        provider = self.providers[position]
+        stats = self.provider_stats[self._label(position)]
+        timings = {}
+        start = time.perf_counter()
+        try:
+            if isinstance(provider, GeocoderClient):
+                # Only the HTTP round trips count; waiting for the key's shared rate limiter is not the
+                # provider being slow, and a hedge would wait for the same limiter
+                lat, lon = provider.search(address, timings=timings, sent=sent)
+            else:
+                # Other providers give no signal of when their request goes out, so time them from the call
+                sent.set()
+                lat, lon = provider.search(address) if hasattr(provider, "search") else provider.geocode(address)
+            outcome = "ok" if lat is not None and lon is not None else "empty"
+        except Exception:
+            lat, lon, outcome = None, None, "errors"
+        finally:
+            # Also when the client failed before sending anything, so ``search`` does not wait forever
+            sent.set()
+        latency = timings.get("request_seconds", time.perf_counter() - start)
+        stats.record(outcome, latency)
+        return lat, lon, outcome == "errors", latency
+
+    def _start(self, position, address, sent=None):
+        # A thread rather than a pool slot: a primary abandoned for a hedge must not block later calls
+        future = Future()
+        future.set_running_or_notify_cancel()
+        sent = threading.Event() if sent is None else sent
+        threading.Thread(target=lambda: future.set_result(self._call(position, address, sent)), daemon=True).start()
+        return future
+
+    def _may_hedge(self):
+        with self._lock:
+            # Plus one, so a slow first call may hedge too
+            if self.stats["hedged"] >= self.budget * self.stats["calls"] + 1:
+                self.stats["over_budget"] += 1
+                return False
+            self.stats["hedged"] += 1
+            return True
+
+    def search(self, address, timings=None):
+        """
+        Geocode an address, returning (None, None) when a provider has no match and raising
+        ``GeocodingError`` when every provider asked failed. ``timings`` receives the
+        ``request_seconds`` of the answer used.
+        """
+        timings = {} if timings is None else timings
+        self._count("calls")
+        # The hedge delay runs from when the primary's request goes out, not while it waits for the limiter
+        sent = threading.Event()
+        pending = {self._start(0, address, sent): 0}
+        sent.wait()
+        done, _ = wait(pending, timeout=self.hedge_delay())
+        if not done and self._may_hedge():
+            pending[self._start(1, address)] = 1
+        answered = False
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                position = pending.pop(future)
+                lat, lon, failed, timings["request_seconds"] = future.result()
+                if lat is not None and lon is not None:
+                    self.provider_stats[self._label(position)].win()
+                    if position == 1:
+                        self._count("hedge_wins")
+                    if pending:
+                        self._count("abandoned")
+                    return lat, lon
+                answered = answered or not failed
+        if not answered:
+            raise GeocodingError(f"Every provider failed for {address!r}")
+        return None, None
+
+    def geocode(self, address):
+        try:
+            return self.search(address)
+        except GeocodingError:
+            return None, None
+
+    def summary(self):
+        """Hedging counters plus each provider's outcomes and latency percentiles."""
+        summary = dict(self.stats)
+        summary["hedge_delay_seconds"] = round(self.hedge_delay(), 4)
+        summary["providers"] = {label: stats.summary() for label, stats in self.provider_stats.items()}
+        return summary
+
+
+_hedged = {}
+_hedged_lock = threading.Lock()
+
+
+def get_hedged_client(api_key, hedge_url=LOCATIONIQ_HEDGE_URL, percentile=DEFAULT_HEDGE_PERCENTILE, **kwargs):
+    """
+    Return a process-wide ``HedgedGeocoder`` backed by the shared LocationIQ client and a client for
+    ``hedge_url``, so latency history and connection pools survive between runs.
+    """
+    key = (api_key, hedge_url, percentile, tuple(sorted(kwargs.items())))
+    with _hedged_lock:
+        client = _hedged.get(key)
+        if client is None:
+            # Same key on another region, so it draws from the same quota as the primary
+            secondary = GeocoderClient(api_key, base_url=hedge_url, limiter=get_rate_limiter(api_key))
+            client = _hedged[key] = HedgedGeocoder(get_client(api_key), secondary, percentile, **kwargs)
+        return client
@@ -0,0 +1,300 @@
+import datetime
+import hashlib
+import numbers
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ingest import detect_format, iter_chunks, sheet_names
+
+# Directory holding one geocoded Parquet artifact per dataset name
+DEFAULT_ARTIFACT_DIR = os.environ.get("GEOCODE_ARTIFACT_DIR", "geocoded_artifacts")
+
+SHEET_COLUMN = "_sheet"
+SHEET_FINGERPRINT_COLUMN = "_sheet_fingerprint"
+ROW_HASH_COLUMN = "_row_hash"
+INTERNAL_COLUMNS = [SHEET_COLUMN, SHEET_FINGERPRINT_COLUMN, ROW_HASH_COLUMN]
+# Artifact column recording each value's type for a mixed column stored as text
+TYPE_COLUMN_PREFIX = "_type:"
+
+# Types a stringified value is restored to on load; anything else stays text
+_PARSERS = {
+    "bool": lambda text: text == "True",
+    "int": int,
+    "float": float,
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+}
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _xlsx_fingerprints(source, salt):
+    # The zip directory already stores a CRC for every worksheet part, so a sheet can be recognised as
+    # unchanged without decompressing or parsing it. Shared strings are included because cells refer to
+    # them by index.
+    fingerprints = {}
+    with zipfile.ZipFile(source) as archive:
+        names = set(archive.namelist())
+        shared = archive.getinfo("xl/sharedStrings.xml").CRC if "xl/sharedStrings.xml" in names else 0
+        relationships = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {rel.get("Id"): rel.get("Target") for rel in relationships}
+        workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+        for sheet in workbook.iter():
+            if _local_name(sheet.tag) != "sheet":
+                continue
+            rel_id = next((value for key, value in sheet.attrib.items() if _local_name(key) == "id"), None)
+            target = targets.get(rel_id)
+            if target is None:
+                continue
+            part = target.lstrip("/") if target.startswith("/") else "xl/" + target
+            if part not in names:
+                continue
+            info = archive.getinfo(part)
+            fingerprints[sheet.get("name")] = f"{info.CRC:08x}-{info.file_size}-{shared:08x}-{salt}"
+    return fingerprints
+
+
+def _file_fingerprint(source, salt):
+    digest = hashlib.sha1()
+    if hasattr(source, "read"):
+        source.seek(0)
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+        source.seek(0)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return f"{digest.hexdigest()}-{salt}"
+
+
+def sheet_fingerprints(source, columns):
+    """
+    Return a {sheet name: fingerprint} mapping that changes whenever a sheet's content changes.
+
+    CSV and Parquet files are treated as a single sheet named after their format. An empty mapping
+    means the file could not be fingerprinted and every sheet should be read.
+    """
+    salt = hashlib.sha1("|".join(map(str, columns)).encode()).hexdigest()[:8]
+    file_format = detect_format(source)
+    try:
+        if file_format == "xlsx":
+            return _xlsx_fingerprints(source, salt)
+        return {file_format: _file_fingerprint(source, salt)}
+    except (zipfile.BadZipFile, KeyError, ET.ParseError, OSError):
+        return {}
+    finally:
+        if hasattr(source, "seek"):
+            source.seek(0)
+
+
+def hash_rows(data, columns):
+    """Return a uint64 content hash per row over the given columns."""
+    columns = [column for column in columns if column in data.columns]
+    return pd.util.hash_pandas_object(data[columns].astype(str), index=False)
+
+
+def artifact_name(source):
+    """Name an artifact after the uploaded file, so weekly re-uploads of a workbook share one."""
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "upload")
+    return os.path.splitext(os.path.basename(str(name)))[0] or "upload"
+
+
+def mixed_columns(data):
+    """Return the object columns that mix value types, e.g. attendance numbers and "N/A"."""
+    return [column for column in data.columns if data[column].dtype == object
+            and pd.api.types.infer_dtype(data[column], skipna=True).startswith("mixed")]
+
+
+def stringify_mixed_columns(data):
+    """
+    Return ``data`` with its mixed columns as strings (missing values stay missing), since Parquet needs
+    one type per column. ``data`` itself is not modified.
+    """
+    columns = mixed_columns(data)
+    if not columns:
+        return data
+    data = data.copy()
+    for column in columns:
+        data[column] = data[column].map(lambda value: None if pd.isna(value) else str(value))
+    return data
+
+
+def _type_tag(value):
+    if pd.isna(value):
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return "bool"
+    if isinstance(value, numbers.Integral):
+        return "int"
+    if isinstance(value, numbers.Real):
+        return "float"
+    for tag, value_type in (("datetime", datetime.datetime), ("date", datetime.date), ("time", datetime.time)):
+        if isinstance(value, value_type):
+            return tag
+    return "str"
+
+
+def _restore_types(data):
+    # Undo stringify_mixed_columns, so a reused artifact holds the same values as a fresh read
+    type_columns = [column for column in data.columns if column.startswith(TYPE_COLUMN_PREFIX)]
+    for type_column in type_columns:
+        column = type_column[len(TYPE_COLUMN_PREFIX):]
+        values = [value if tag is None or pd.isna(value) else _PARSERS.get(tag, str)(value)
+                  for value, tag in zip(data[column], data[type_column])]
+        data[column] = pd.Series(values, index=data.index, dtype=object)
+    return data.drop(columns=type_columns)
+
+
+class ArtifactStore:
+    """Directory of geocoded Parquet artifacts keyed by dataset name."""
+
+    def __init__(self, directory=DEFAULT_ARTIFACT_DIR):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.parquet")
+
+    def journal_path(self, name):
+        """Path of the geocoding journal for a dataset's in-progress run."""
+        return os.path.join(self.directory, f"{name}.journal.jsonl")
+
+    def load(self, name):
+        """Return the previous artifact for a dataset, or None if there is none."""
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            return _restore_types(pd.read_parquet(path))
+        except (OSError, ValueError):
+            return None
+
+    def save(self, name, data):
+        """
+        Write a dataset's artifact atomically so a crash never leaves a truncated file.
+
+        Mixed columns are stored as text next to a ``_type:<column>`` column naming each value's type,
+        which ``load`` uses to give back the original numbers, dates and text.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        types = {TYPE_COLUMN_PREFIX + column: data[column].map(_type_tag) for column in mixed_columns(data)}
+        data = stringify_mixed_columns(data).assign(**types)
+        path = self.path(name)
+        tmp_path = path + ".tmp"
+        data.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+
+def _read_sheet(path, columns, sheet_name):
+    # Runs in a worker process: parse one sheet and return its projected rows as a single frame
+    chunks = []
+    for _, chunk in iter_chunks(path, columns, sheets=[sheet_name]):
+        if chunk is None:
+            return sheet_name, None
+        chunks.append(chunk)
+    return sheet_name, pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+def _iter_sheets_parallel(path, columns, skip_sheets, processes):
+    sheets = [sheet for sheet in sheet_names(path) if sheet not in skip_sheets]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(_read_sheet, path, columns, sheet) for sheet in sheets]
+        for future in futures:
+            sheet_name, frame = future.result()
+            if frame is None or not frame.empty:
+                yield sheet_name, frame
+
+
+def read_incremental(source, columns, store=None, name=None, processes=1):
+    """
+    Read a dataset, reusing the previous run's geocoded artifact wherever possible.
+
+    Sheets whose fingerprint matches the previous run are taken straight from the artifact without
+    being read. Rows of changed sheets get Latitude/Longitude from the artifact when an identical
+    row (same content hash) was geocoded before, so only new or modified rows still need geocoding.
+    Sheets are parsed chunk by chunk, but the projected rows are returned as one frame so addresses can
+    be deduplicated across every sheet before geocoding.
+
+    Parameters:
+        source (str or file-like): Path or uploaded file (xlsx, csv or parquet).
+        columns (list): Required columns, passed to ``ingest.iter_chunks``.
+        store (ArtifactStore, optional): Artifact directory. Defaults to ``DEFAULT_ARTIFACT_DIR``.
+        name (str, optional): Dataset name. Defaults to the file name.
+        processes (int): Worker processes used to parse workbook sheets in parallel. Only applies to
+            Excel files given as a path; uploads and CSV/Parquet files are read in this process.
+
+    Returns:
+        tuple: (DataFrame including the internal ``_sheet``/``_sheet_fingerprint``/``_row_hash``
+        columns, dict describing which sheets were reused, read or skipped and how many rows were reused).
+    """
+    store = store or ArtifactStore()
+    name = name or artifact_name(source)
+    fingerprints = sheet_fingerprints(source, columns)
+    previous = store.load(name)
+
+    reused_sheets = []
+    frames = []
+    if previous is not None and fingerprints:
+        previous_fingerprints = previous.groupby(SHEET_COLUMN, sort=False)[SHEET_FINGERPRINT_COLUMN].first()
+        for sheet_name, fingerprint in fingerprints.items():
+            if previous_fingerprints.get(sheet_name) == fingerprint:
+                reused_sheets.append(sheet_name)
+        if reused_sheets:
+            frames.append(previous[previous[SHEET_COLUMN].isin(reused_sheets)])
+
+    read_sheets = []
+    skipped_sheets = []
+    parallel = processes > 1 and isinstance(source, (str, os.PathLike)) and detect_format(source) == "xlsx"
+    if parallel:
+        chunks = _iter_sheets_parallel(source, columns, set(reused_sheets), processes)
+    else:
+        chunks = iter_chunks(source, columns, skip_sheets=reused_sheets)
+    for sheet_name, chunk in chunks:
+        if chunk is None:
+            skipped_sheets.append(sheet_name)
+            continue
+        if sheet_name not in read_sheets:
+            read_sheets.append(sheet_name)
+        chunk = chunk.copy()
+        chunk[SHEET_COLUMN] = sheet_name
+        chunk[SHEET_FINGERPRINT_COLUMN] = fingerprints.get(sheet_name, "")
+        chunk[ROW_HASH_COLUMN] = hash_rows(chunk, [c for c in chunk.columns if c not in ("Latitude", "Longitude")
+                                                   and c not in INTERNAL_COLUMNS]).to_numpy()
+        frames.append(chunk)
+
+    data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(columns) + INTERNAL_COLUMNS)
+
+    # Carry coordinates over from identical rows geocoded in the previous run
+    rows_reused = int(data[SHEET_COLUMN].isin(reused_sheets).sum())
+    if previous is not None and "Latitude" in previous.columns:
+        known = previous.dropna(subset=["Latitude", "Longitude"]).drop_duplicates(ROW_HASH_COLUMN).set_index(ROW_HASH_COLUMN)
+        fresh = ~data[SHEET_COLUMN].isin(reused_sheets)
+        for column in ("Latitude", "Longitude"):
+            if column not in data.columns:
+                data[column] = float("nan")
+            data[column] = pd.to_numeric(data[column], errors="coerce")
+            data.loc[fresh, column] = data.loc[fresh, column].fillna(data.loc[fresh, ROW_HASH_COLUMN].map(known[column]))
+        rows_reused += int((fresh & data[ROW_HASH_COLUMN].isin(known.index)).sum())
+
+    info = {"sheets_reused": reused_sheets, "sheets_read": read_sheets, "sheets_skipped": skipped_sheets,
+            "rows_reused": rows_reused}
+    return data, info
+
+
+def save_incremental(data, source, store=None, name=None):
+    """Persist a geocoded frame returned by ``read_incremental`` as the dataset's new artifact."""
+    store = store or ArtifactStore()
+    store.save(name or artifact_name(source), data)
+
+
+def drop_internal_columns(data):
+    """Remove the bookkeeping columns added by ``read_incremental``."""
+    return data.drop(columns=[column for column in INTERNAL_COLUMNS if column in data.columns])
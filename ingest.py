@@ -0,0 +1,133 @@
+import os
+
+import openpyxl
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Columns picked up when present, in addition to the ones a caller requires
+OPTIONAL_COLUMNS = ["Year", "name", "Latitude", "Longitude"]
+
+
+def detect_format(source):
+    """Return 'xlsx', 'csv' or 'parquet' based on the path or uploaded file name."""
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+    extension = os.path.splitext(str(name))[1].lower()
+    if extension in (".csv", ".txt"):
+        return "csv"
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    return "xlsx"
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def sheet_names(source):
+    """Return the sheet names of a workbook, or the single pseudo-sheet of a CSV/Parquet file."""
+    file_format = detect_format(source)
+    if file_format != "xlsx":
+        return [file_format]
+    _rewind(source)
+    workbook = openpyxl.load_workbook(source, read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+        _rewind(source)
+
+
+def _iter_excel(source, columns, optional_columns, chunk_size, skip_sheets, sheets):
+    # Read-only mode streams rows from the sheet XML instead of building the whole workbook in memory
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            if worksheet.title in skip_sheets or (sheets is not None and worksheet.title not in sheets):
+                continue
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            header = [str(value).strip() if value is not None else None for value in header]
+            if any(column not in header for column in columns):
+                yield worksheet.title, None
+                continue
+            wanted = columns + [column for column in optional_columns if column in header and column not in columns]
+            positions = [header.index(column) for column in wanted]
+
+            batch = []
+            for row in rows:
+                values = [row[i] if i < len(row) else None for i in positions]
+                if all(value is None for value in values):
+                    continue
+                batch.append(values)
+                if len(batch) >= chunk_size:
+                    yield worksheet.title, pd.DataFrame(batch, columns=wanted)
+                    batch = []
+            if batch:
+                yield worksheet.title, pd.DataFrame(batch, columns=wanted)
+    finally:
+        workbook.close()
+
+
+def _iter_csv(source, columns, optional_columns, chunk_size):
+    wanted = set(columns) | set(optional_columns)
+    reader = pd.read_csv(source, usecols=lambda column: column in wanted, chunksize=chunk_size)
+    for chunk in reader:
+        if any(column not in chunk.columns for column in columns):
+            yield "csv", None
+            return
+        yield "csv", chunk
+
+
+def _iter_parquet(source, columns, optional_columns, chunk_size):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Reading Parquet files requires the 'pyarrow' package") from e
+
+    parquet_file = pq.ParquetFile(source)
+    available = parquet_file.schema_arrow.names
+    if any(column not in available for column in columns):
+        yield "parquet", None
+        return
+    wanted = columns + [column for column in optional_columns if column in available and column not in columns]
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=wanted):
+        yield "parquet", batch.to_pandas()
+
+
+def iter_chunks(source, columns, optional_columns=OPTIONAL_COLUMNS, chunk_size=DEFAULT_CHUNK_SIZE, file_format=None,
+                skip_sheets=(), sheets=None):
+    """
+    Stream a workbook, CSV or Parquet file as column-projected DataFrame chunks.
+
+    Only ``columns`` (required) and whichever of ``optional_columns`` exist are read. At most
+    ``chunk_size`` rows are held per chunk, so memory stays bounded regardless of the file size.
+
+    Parameters:
+        source (str or file-like): Path or uploaded file.
+        columns (list): Columns that must be present.
+        optional_columns (list): Columns kept when present.
+        chunk_size (int): Maximum number of rows per yielded chunk.
+        file_format (str, optional): 'xlsx', 'csv' or 'parquet'. Detected from the name if omitted.
+        skip_sheets (collection): Workbook sheet names that should not be read at all.
+        sheets (collection, optional): Only read these workbook sheets.
+
+    Yields:
+        tuple: (sheet name, DataFrame chunk). The chunk is None for a sheet missing required columns.
+    """
+    columns = list(columns)
+    file_format = file_format or detect_format(source)
+    _rewind(source)
+    if file_format != "xlsx" and (file_format in skip_sheets or (sheets is not None and file_format not in sheets)):
+        # CSV and Parquet files are a single "sheet" named after their format
+        return
+    if file_format == "csv":
+        yield from _iter_csv(source, columns, optional_columns, chunk_size)
+    elif file_format == "parquet":
+        yield from _iter_parquet(source, columns, optional_columns, chunk_size)
+    else:
+        yield from _iter_excel(source, columns, optional_columns, chunk_size, set(skip_sheets),
+                               set(sheets) if sheets is not None else None)
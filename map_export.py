@@ -0,0 +1,124 @@
+import gzip
+import re
+from collections import Counter
+
+import streamlit as st
+
+from filter_cache import LRUCache
+
+# String literals and comments inside inline scripts. Comments are matched so quotes inside them are
+# not mistaken for the start of a string.
+_LITERAL = re.compile(r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|`(?:[^`\\]|\\.)*`|//[^\n]*|/\*.*?\*/', re.S)
+_SCRIPT = re.compile(r"(<script\b[^>]*>)(.*?)(</script>)", re.S | re.I)
+_KEY_CONTEXT = re.compile(r"\s*:")
+DEDUPE_MIN_LENGTH = 64  # Shorter literals are not worth an indirection
+SHARED_NAME = "__shared"
+EXPORT_CACHE_SIZE = 8  # Rendered exports kept per session
+
+
+def render_html(m):
+    """Render a folium map to an HTML string in memory."""
+    return m.get_root().render()
+
+
+def minify_html(html):
+    """
+    Strip indentation and blank lines.
+
+    Line breaks are kept, so scripts relying on automatic semicolon insertion still parse. Whitespace
+    inside multi-line template literals (folium's tooltip and popup markup) is collapsed the same way,
+    which does not change how the markup renders.
+    """
+    return "\n".join(stripped for stripped in (line.strip() for line in html.splitlines()) if stripped)
+
+
+def _hoistable(match, min_length):
+    text = match.group(0)
+    if len(text) < min_length or text[0] not in "\"'`" or "${" in text:
+        return False
+    # Object keys cannot be replaced by a variable reference
+    return not _KEY_CONTEXT.match(match.string, match.end())
+
+
+def dedupe_literals(html, min_length=DEDUPE_MIN_LENGTH):
+    """
+    Define each long string literal that occurs more than once in the inline scripts only once.
+
+    Repeated literals, e.g. identical per-marker tooltip markup or the same inlined thumbnail for every
+    row of a venue, are moved into one shared array in a script placed before the first script of the
+    page, and every occurrence becomes an index into it.
+    """
+    counts = Counter()
+    for script in _SCRIPT.finditer(html):
+        for literal in _LITERAL.finditer(script.group(2)):
+            if _hoistable(literal, min_length):
+                counts[literal.group(0)] += 1
+    shared = [text for text, count in counts.items() if count > 1]
+    if not shared:
+        return html
+    names = {text: f"{SHARED_NAME}[{i}]" for i, text in enumerate(shared)}
+
+    def replace_literal(match):
+        text = match.group(0)
+        if text in names and _hoistable(match, min_length):
+            return names[text]
+        return text
+
+    def replace_script(match):
+        return match.group(1) + _LITERAL.sub(replace_literal, match.group(2)) + match.group(3)
+
+    html = _SCRIPT.sub(replace_script, html)
+    table = f"<script>var {SHARED_NAME} = [{','.join(shared)}];</script>\n"
+    first_script = html.lower().find("<script")
+    return html[:first_script] + table + html[first_script:]
+
+
+def export_map_html(m, minify=True, dedupe=True):
+    """
+    Render a folium map to standalone HTML bytes without touching the disk.
+
+    Parameters:
+        m (folium.Map): Map to export.
+        minify (bool): Strip indentation and blank lines.
+        dedupe (bool): Define repeated long string literals (tooltip markup, inlined images) once.
+
+    Returns:
+        bytes: UTF-8 encoded HTML document.
+    """
+    html = render_html(m)
+    if minify:
+        html = minify_html(html)
+    if dedupe:
+        html = dedupe_literals(html)
+    return html.encode("utf-8")
+
+
+def gzip_bytes(data):
+    """Gzip exported HTML for download; the repetitive map markup usually shrinks several times over."""
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def map_download_button(m, key, file_name="Principles_Map.html", label="Download Map as HTML"):
+    """
+    Offer a map for download, rendered in memory on the first click and reused for the rest of the session.
+
+    ``key`` identifies the map's content (e.g. the upload and filter selection); exports are kept in a
+    small per-session LRU cache under it, so concurrent users never share or overwrite a file.
+    """
+    exports = st.session_state.setdefault("map_exports", LRUCache(EXPORT_CACHE_SIZE))
+    compress = st.checkbox("Compress download (gzip)", key=f"gzip-{file_name}")
+
+    def render():
+        # Runs when the button is clicked, outside the script run
+        html = exports.get(key)
+        if html is None:
+            html = export_map_html(m)
+            exports.put(key, html)
+        return gzip_bytes(html) if compress else html
+
+    st.download_button(
+        label=label,
+        data=render,
+        file_name=file_name + ".gz" if compress else file_name,
+        mime="application/gzip" if compress else "text/html",
+    )
@@ -0,0 +1,456 @@
+import json
+import math
+
+from branca.element import MacroElement, Template
+from folium.elements import JSCSSMixin
+from folium.map import FeatureGroup
+from folium.plugins import MarkerCluster
+
+from clustering import DEFAULT_MAX_ZOOM, DEFAULT_MIN_ZOOM, DEFAULT_RADIUS, build_cluster_hierarchy
+
+# Above this many points the per-marker folium path gets slow to build and heavy for the browser
+HIGH_VOLUME_THRESHOLD = 5000
+
+DEFAULT_TOOLTIP_TEMPLATE = """
+<div style="width:150px; text-align:center;">
+    <p>{people} people Attended</p>
+    <img src="{img}" width="150px">
+</div>
+"""
+
+
+def _clean(value):
+    # JSON has no NaN; send missing values as null
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    return value
+
+
+def _to_js(value):
+    # Compact JSON with "</" escaped so values like "</script>" cannot close the inline script block
+    return json.dumps(value, separators=(",", ":")).replace("</", "<\\/")
+
+
+def _compact(html):
+    return " ".join(html.split())
+
+
+def build_columns(data, lat_key, lon_key, fields, precision=5):
+    """
+    Turn a list of records into a columnar payload, skipping rows without coordinates.
+
+    Parameters:
+        data (list): Records as produced by ``df.to_dict(orient="records")``.
+        lat_key (str): Key holding the latitude.
+        lon_key (str): Key holding the longitude.
+        fields (dict): Payload name -> record key, for the values the tooltip and styling use.
+        precision (int): Decimal places kept for coordinates (5 is ~1 m).
+
+    Returns:
+        dict: {"lat": [...], "lon": [...], <field>: [...]} with one entry per drawable point.
+    """
+    columns = {"lat": [], "lon": []}
+    columns.update({name: [] for name in fields})
+    for entry in data:
+        lat, lon = _clean(entry.get(lat_key)), _clean(entry.get(lon_key))
+        if lat is None or lon is None:
+            continue
+        columns["lat"].append(round(float(lat), precision))
+        columns["lon"].append(round(float(lon), precision))
+        for name, key in fields.items():
+            columns[name].append(_clean(entry.get(key)))
+    return columns
+
+
+class PointLayer(FeatureGroup):
+    """
+    Feature group that draws many circle markers on a shared canvas from one columnar JSON payload.
+
+    Instead of one ``folium.CircleMarker`` with its own tooltip/popup HTML per row, every point is
+    described by a few numbers in column arrays and the tooltip is rendered in the browser from a
+    single shared template whose ``{field}`` placeholders refer to payload columns.
+
+    Parameters:
+        columns (dict): Columnar payload, usually from ``build_columns``. Must contain "lat" and "lon".
+        tooltip_template (str): HTML with ``{field}`` placeholders. Values are HTML-escaped.
+        radius_field (str, optional): Payload column used to size the circles.
+        radius_scale (float): Multiplier applied to ``radius_field``.
+        min_radius (float): Smallest radius drawn, so tiny values stay visible.
+        color (str): Stroke and fill colour.
+        fill_opacity (float): Fill opacity of the circles.
+        name (str, optional): Layer name shown in a LayerControl.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup({{ this.options|tojson }});
+            (function(group) {
+                var d = {{ this.payload }};
+                var tpl = {{ this.tooltip_template }};
+                var renderer = L.canvas({padding: 0.5});
+                var esc = function(v) {
+                    return String(v === null || v === undefined ? '' : v).replace(/[&<>"']/g, function(c) {
+                        return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                    });
+                };
+                for (var i = 0; i < d.lat.length; i++) {
+                    {%- if this.radius_field %}
+                    var r = Math.max({{ this.min_radius }}, (+d[{{ this.radius_field|tojson }}][i] || 0) * {{ this.radius_scale }});
+                    {%- else %}
+                    var r = {{ this.min_radius }};
+                    {%- endif %}
+                    var marker = L.circleMarker([d.lat[i], d.lon[i]], {
+                        renderer: renderer,
+                        radius: r,
+                        color: {{ this.color|tojson }},
+                        fillColor: {{ this.color|tojson }},
+                        fillOpacity: {{ this.fill_opacity }},
+                        weight: 1
+                    });
+                    marker._pointIndex = i;
+                    group.addLayer(marker);
+                }
+                group.bindTooltip(function(layer) {
+                    var i = layer._pointIndex;
+                    return tpl.replace(/\\{(\\w+)\\}/g, function(m, key) {
+                        return d[key] ? esc(d[key][i]) : m;
+                    });
+                }, {sticky: true});
+            })({{ this.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, columns, tooltip_template=DEFAULT_TOOLTIP_TEMPLATE, radius_field=None, radius_scale=1.0,
+                 min_radius=2, color="yellow", fill_opacity=0.7, name=None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self._name = "PointLayer"
+        self.payload = _to_js(columns)
+        self.tooltip_template = _to_js(_compact(tooltip_template))
+        self.radius_field = radius_field
+        self.radius_scale = radius_scale
+        self.min_radius = min_radius
+        self.color = color
+        self.fill_opacity = fill_opacity
+        self.count = len(columns["lat"])
+
+
+class FilteredPointLayer(JSCSSMixin):
+    """
+    Clustered circle markers driven by ``<select>`` filters, from one indexed columnar payload.
+
+    The payload comes from ``PointSet.indexed_columns``. Each filter is a ``<select>`` element whose
+    options are filled from the payload labels; changing one looks up the precomputed row index of
+    the selected label, so only matching rows are touched. Markers are created lazily on first use
+    and reused across filter changes. An optional element shows the total of ``sum_field`` and the
+    number of rows for the current selection.
+
+    Parameters:
+        columns (dict): Payload from ``PointSet.indexed_columns``.
+        filters (dict): Index field name -> id of the ``<select>`` element controlling it.
+        selected (dict, optional): Index field name -> label selected initially.
+        tooltip_template (str): HTML with ``{field}`` placeholders, as for ``PointLayer``.
+        radius_field, radius_scale, min_radius, color, fill_opacity: Marker styling, as for ``PointLayer``.
+        sum_field (str, optional): Payload column summed for the totals element.
+        totals_id (str, optional): Id of the element receiving the totals.
+        totals_template (str): Text with ``{total}`` and ``{count}`` placeholders.
+    """
+
+    default_js = MarkerCluster.default_js
+    default_css = MarkerCluster.default_css
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.markerClusterGroup({chunkedLoading: true});
+            {{ this._parent.get_name() }}.addLayer({{ this.get_name() }});
+            (function(group) {
+                var d = {{ this.payload }};
+                var filters = {{ this.filters }};
+                var selected = {{ this.selected }};
+                var tpl = {{ this.tooltip_template }};
+                var renderer = L.canvas({padding: 0.5});
+                var cache = new Array(d.lat.length);
+                var esc = function(v) {
+                    return String(v === null || v === undefined ? '' : v).replace(/[&<>"']/g, function(c) {
+                        return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                    });
+                };
+                var value = function(key, i) {
+                    return d.labels[key] ? d.labels[key][d[key][i]] : d[key][i];
+                };
+                var marker = function(i) {
+                    if (!cache[i]) {
+                        {%- if this.radius_field %}
+                        var r = Math.max({{ this.min_radius }}, (+d[{{ this.radius_field|tojson }}][i] || 0) * {{ this.radius_scale }});
+                        {%- else %}
+                        var r = {{ this.min_radius }};
+                        {%- endif %}
+                        cache[i] = L.circleMarker([d.lat[i], d.lon[i]], {
+                            renderer: renderer,
+                            radius: r,
+                            color: {{ this.color|tojson }},
+                            fillColor: {{ this.color|tojson }},
+                            fillOpacity: {{ this.fill_opacity }},
+                            weight: 1
+                        });
+                        cache[i].bindTooltip(function() {
+                            return tpl.replace(/\\{(\\w+)\\}/g, function(m, key) {
+                                return d[key] ? esc(value(key, i)) : m;
+                            });
+                        });
+                    }
+                    return cache[i];
+                };
+
+                // Fill each dropdown from the payload labels
+                Object.keys(filters).forEach(function(key) {
+                    var select = document.getElementById(filters[key]);
+                    if (!select) { return; }
+                    d.labels[key].forEach(function(label, code) {
+                        var option = document.createElement('option');
+                        option.value = code;
+                        option.textContent = label;
+                        if (selected[key] === label) { option.selected = true; }
+                        select.appendChild(option);
+                    });
+                    select.addEventListener('change', update);
+                });
+
+                function selectedRows() {
+                    // Start from the smallest active index and check the remaining filters per row
+                    var active = [];
+                    Object.keys(filters).forEach(function(key) {
+                        var select = document.getElementById(filters[key]);
+                        if (select && select.value !== '') {
+                            active.push({key: key, code: +select.value, rows: d.index[key][+select.value]});
+                        }
+                    });
+                    if (!active.length) {
+                        var all = new Array(d.lat.length);
+                        for (var i = 0; i < all.length; i++) { all[i] = i; }
+                        return all;
+                    }
+                    active.sort(function(a, b) { return a.rows.length - b.rows.length; });
+                    var rest = active.slice(1);
+                    return active[0].rows.filter(function(i) {
+                        return rest.every(function(f) { return d[f.key][i] === f.code; });
+                    });
+                }
+
+                function update() {
+                    var rows = selectedRows();
+                    group.clearLayers();
+                    group.addLayers(rows.map(marker));
+                    {%- if this.totals_id %}
+                    var totals = document.getElementById({{ this.totals_id|tojson }});
+                    if (totals) {
+                        var total = 0;
+                        {%- if this.sum_field %}
+                        for (var k = 0; k < rows.length; k++) { total += (+d[{{ this.sum_field|tojson }}][rows[k]] || 0); }
+                        {%- endif %}
+                        totals.innerHTML = {{ this.totals_template }}
+                            .replace('{total}', total.toLocaleString())
+                            .replace('{count}', rows.length.toLocaleString());
+                    }
+                    {%- endif %}
+                }
+
+                update();
+            })({{ this.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, columns, filters, selected=None, tooltip_template=DEFAULT_TOOLTIP_TEMPLATE, radius_field=None,
+                 radius_scale=1.0, min_radius=2, color="yellow", fill_opacity=0.7, sum_field=None, totals_id=None,
+                 totals_template="{total} | {count}"):
+        super().__init__()
+        self._name = "FilteredPointLayer"
+        self.payload = _to_js(columns)
+        self.filters = _to_js(filters)
+        self.selected = _to_js({key: _clean(value) for key, value in (selected or {}).items()})
+        self.tooltip_template = _to_js(_compact(tooltip_template))
+        self.radius_field = radius_field
+        self.radius_scale = radius_scale
+        self.min_radius = min_radius
+        self.color = color
+        self.fill_opacity = fill_opacity
+        self.sum_field = sum_field
+        self.totals_id = totals_id
+        self.totals_template = _to_js(totals_template)
+        self.count = len(columns["lat"])
+
+
+def build_cluster_levels(columns, weight_field, min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM,
+                         radius=DEFAULT_RADIUS, precision=5):
+    """
+    Precompute per-zoom clusters for a columnar payload from ``build_columns``.
+
+    Returns:
+        dict: {zoom: {"lat", "lon", "weight", "count": multi-point clusters, "single": point indexes}}
+    """
+    hierarchy = build_cluster_hierarchy(columns["lat"], columns["lon"], columns[weight_field],
+                                        min_zoom=min_zoom, max_zoom=max_zoom, radius=radius)
+    levels = {}
+    for zoom, level in hierarchy.items():
+        clusters = level[level["count"] > 1]
+        levels[zoom] = {
+            "lat": clusters["lat"].round(precision).tolist(),
+            "lon": clusters["lon"].round(precision).tolist(),
+            "weight": clusters["weight"].tolist(),
+            "count": clusters["count"].tolist(),
+            "single": level.loc[level["count"] == 1, "point"].tolist(),
+        }
+    return levels
+
+
+class ClusterLayer(JSCSSMixin):
+    """
+    Circle markers grouped by clusters that were computed in Python for every zoom level.
+
+    The browser never inspects child markers: on each zoom it draws the ready-made clusters of that
+    level (centroid, total ``weight`` and point count) plus the single points, and above ``max_zoom``
+    it draws every point. Cluster icons reuse the Leaflet.markercluster styles.
+
+    Parameters:
+        columns (dict): Payload from ``build_columns``.
+        levels (dict): Output of ``build_cluster_levels`` for the same payload.
+        tooltip_template (str): HTML with ``{field}`` placeholders for single points.
+        popup_template (str, optional): HTML with ``{field}`` placeholders shown on click.
+        radius_field, radius_scale, min_radius, color, fill_opacity: Marker styling, as for ``PointLayer``.
+        small, large (int): Cluster totals below ``small`` are drawn small, from ``large`` up large.
+    """
+
+    default_css = MarkerCluster.default_css
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.layerGroup().addTo({{ this._parent.get_name() }});
+            (function(map, group) {
+                var d = {{ this.payload }};
+                var levels = {{ this.levels }};
+                var tpl = {{ this.tooltip_template }};
+                var popupTpl = {{ this.popup_template }};
+                var minZoom = {{ this.min_zoom }}, maxZoom = {{ this.max_zoom }};
+                var renderer = L.canvas({padding: 0.5});
+                var points = new Array(d.lat.length);
+                var clusters = {};
+                var esc = function(v) {
+                    return String(v === null || v === undefined ? '' : v).replace(/[&<>"']/g, function(c) {
+                        return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                    });
+                };
+                var fill = function(template, i) {
+                    return template.replace(/\\{(\\w+)\\}/g, function(m, key) {
+                        return d[key] ? esc(d[key][i]) : m;
+                    });
+                };
+                var point = function(i) {
+                    if (!points[i]) {
+                        {%- if this.radius_field %}
+                        var r = Math.max({{ this.min_radius }}, (+d[{{ this.radius_field|tojson }}][i] || 0) * {{ this.radius_scale }});
+                        {%- else %}
+                        var r = {{ this.min_radius }};
+                        {%- endif %}
+                        points[i] = L.circleMarker([d.lat[i], d.lon[i]], {
+                            renderer: renderer,
+                            radius: r,
+                            color: {{ this.color|tojson }},
+                            fillColor: {{ this.color|tojson }},
+                            fillOpacity: {{ this.fill_opacity }},
+                            weight: 1
+                        });
+                        points[i].bindTooltip(function() { return fill(tpl, i); }, {sticky: true});
+                        if (popupTpl) {
+                            points[i].bindPopup(function() { return fill(popupTpl, i); }, {maxWidth: 300});
+                        }
+                    }
+                    return points[i];
+                };
+                var cluster = function(z, j) {
+                    clusters[z] = clusters[z] || [];
+                    if (!clusters[z][j]) {
+                        var level = levels[z];
+                        var total = level.weight[j];
+                        var size = total < {{ this.small }} ? 'small' : (total < {{ this.large }} ? 'medium' : 'large');
+                        var latlng = L.latLng(level.lat[j], level.lon[j]);
+                        clusters[z][j] = L.marker(latlng, {
+                            icon: L.divIcon({
+                                html: '<div><span>' + Math.round(total).toLocaleString() + '</span></div>',
+                                className: 'marker-cluster marker-cluster-' + size,
+                                iconSize: L.point(40, 40)
+                            })
+                        }).bindTooltip(level.count[j] + ' locations').on('click', function() {
+                            map.setView(latlng, Math.min(z + 2, maxZoom + 1));
+                        });
+                    }
+                    return clusters[z][j];
+                };
+                function draw() {
+                    var z = Math.round(map.getZoom());
+                    group.clearLayers();
+                    if (z > maxZoom) {
+                        for (var i = 0; i < d.lat.length; i++) { group.addLayer(point(i)); }
+                        return;
+                    }
+                    z = Math.max(minZoom, z);
+                    var level = levels[z];
+                    for (var j = 0; j < level.count.length; j++) { group.addLayer(cluster(z, j)); }
+                    for (var k = 0; k < level.single.length; k++) { group.addLayer(point(level.single[k])); }
+                }
+                map.on('zoomend', draw);
+                draw();
+            })({{ this._parent.get_name() }}, {{ this.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, columns, levels, tooltip_template=DEFAULT_TOOLTIP_TEMPLATE, popup_template=None,
+                 radius_field=None, radius_scale=1.0, min_radius=2, color="yellow", fill_opacity=0.7,
+                 small=10, large=100):
+        super().__init__()
+        self._name = "ClusterLayer"
+        self.payload = _to_js(columns)
+        self.levels = _to_js(levels)
+        self.min_zoom = min(levels)
+        self.max_zoom = max(levels)
+        self.tooltip_template = _to_js(_compact(tooltip_template))
+        self.popup_template = _to_js(_compact(popup_template) if popup_template else None)
+        self.radius_field = radius_field
+        self.radius_scale = radius_scale
+        self.min_radius = min_radius
+        self.color = color
+        self.fill_opacity = fill_opacity
+        self.small = small
+        self.large = large
+        self.count = len(columns["lat"])
+
+
+class ElementText(MacroElement):
+    """
+    Sets the text of a page element when its parent layer is added, e.g. a totals banner that has to
+    follow a data layer swapped in by ``st_folium(feature_group_to_add=...)``.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            (function(el) {
+                if (el) { el.textContent = {{ this.text|tojson }}; }
+            })(document.getElementById({{ this.element_id|tojson }}));
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, element_id, text):
+        super().__init__()
+        self._name = "ElementText"
+        self.element_id = element_id
+        self.text = text
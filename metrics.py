@@ -0,0 +1,224 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+# Upper bounds in seconds for the geocode latency histogram
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# When set, every run writes its snapshot here (Prometheus text for .prom/.txt, JSON otherwise)
+METRICS_PATH = os.environ.get("PJI_METRICS_PATH")
+METRIC_PREFIX = "pji_"
+
+_INVALID_NAME = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        """Add another histogram's observations; both must use the same buckets."""
+        if other.buckets != self.buckets:
+            raise ValueError(f"Cannot merge histograms with buckets {other.buckets} into {self.buckets}")
+        self.counts = [count + extra for count, extra in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def cumulative(self):
+        """Return [(upper bound, observations <= bound)], ending with ("+Inf", count)."""
+        total = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {"buckets": [[bound, count] for bound, count in self.cumulative()], "sum": round(self.sum, 6),
+                "count": self.count}
+
+
+class Metrics:
+    """
+    Per-run stage timers, counters and histograms, safe to update from worker threads.
+
+    ``stage`` times a block and accumulates the seconds under its name; ``incr`` and ``set`` maintain
+    counters and gauges; ``observe`` feeds a histogram. ``snapshot`` returns everything as a dict,
+    ``to_prometheus`` as Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = set()  # Names in ``counters`` holding a current value rather than a running count
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self._lock:
+            self.counters[name] = value
+            self.gauges.add(name)
+
+    def update(self, values, prefix=""):
+        """Set several gauges at once, e.g. from a component's ``stats`` dict."""
+        for key, value in values.items():
+            if isinstance(value, (int, float)):
+                self.set(prefix + key, value)
+
+    def observe(self, name, value, buckets=DEFAULT_LATENCY_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def timed(self, function, name):
+        """Wrap ``function`` so the duration of every call is observed into the ``name`` histogram."""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.observe(name, time.perf_counter() - start)
+        return wrapper
+
+    def merge(self, other):
+        """
+        Add another run's stages, counters and histograms, e.g. those of a background job.
+
+        Counters from ``incr`` are summed; gauges from ``set`` and ``update`` (e.g. ``rows``) and
+        non-numeric values take ``other``'s value, as the latest one.
+        """
+        with other._lock:
+            stages = dict(other.stages)
+            counters = dict(other.counters)
+            gauges = set(other.gauges)
+            histograms = {}
+            for name, histogram in other.histograms.items():
+                # Copied under the lock, so observations made meanwhile are not half counted
+                histograms[name] = Histogram(histogram.buckets)
+                histograms[name].merge(histogram)
+        with self._lock:
+            for name, seconds in stages.items():
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+            for name, value in counters.items():
+                current = self.counters.get(name, 0)
+                numeric = all(isinstance(v, (int, float)) for v in (current, value))
+                if name in gauges or name in self.gauges or not numeric:
+                    self.counters[name] = value
+                    self.gauges.add(name)
+                else:
+                    self.counters[name] = current + value
+            for name, histogram in histograms.items():
+                if name in self.histograms:
+                    self.histograms[name].merge(histogram)
+                else:
+                    self.histograms[name] = histogram
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "stages_seconds": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {prefix}stage_seconds gauge"]
+        for name, seconds in snapshot["stages_seconds"].items():
+            lines.append(f'{prefix}stage_seconds{{stage="{name}"}} {seconds}')
+        for name, value in snapshot["counters"].items():
+            metric = prefix + _INVALID_NAME.sub("_", name)
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        for name, histogram in snapshot["histograms"].items():
+            metric = prefix + _INVALID_NAME.sub("_", name)
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, count in histogram["buckets"]:
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines.append(f"{metric}_sum {histogram['sum']}")
+            lines.append(f"{metric}_count {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write a snapshot atomically; ``.prom`` and ``.txt`` paths get Prometheus text, others JSON."""
+        text = self.to_prometheus() if os.path.splitext(path)[1].lower() in (".prom", ".txt") else self.to_json()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+def diagnostics_panel(metrics, map_object=None):
+    """
+    Optional sidebar panel with the run's stage timings, counters and latency histograms, plus JSON and
+    Prometheus snapshot downloads. Also writes the snapshot to ``$PJI_METRICS_PATH`` when that is set.
+
+    When the panel is open and ``map_object`` is given, the map is serialized once more to report the
+    HTML size and serialization time; that cost is only paid while diagnostics are shown.
+    """
+    show = st.sidebar.checkbox("Show diagnostics")
+    if show and map_object is not None:
+        with metrics.stage("serialize_html"):
+            html = map_object.get_root().render()
+        metrics.set("html_bytes", len(html.encode("utf-8")))
+    if METRICS_PATH:
+        metrics.write(METRICS_PATH)
+    if not show:
+        return
+    snapshot = metrics.snapshot()
+    st.sidebar.subheader("Diagnostics")
+    stages = pd.Series(snapshot["stages_seconds"], name="seconds", dtype=float)
+    if not stages.empty:
+        st.sidebar.caption(f"Stage timings (total {stages.sum():.2f} s)")
+        st.sidebar.dataframe(stages.round(3).to_frame())
+    if snapshot["counters"]:
+        st.sidebar.caption("Counters")
+        st.sidebar.dataframe(pd.Series(snapshot["counters"], name="value").astype(str).to_frame())
+    for name, histogram in snapshot["histograms"].items():
+        st.sidebar.caption(f"{name} ({histogram['count']} calls, {histogram['sum']:.2f} s total)")
+        # Per-bucket counts are easier to read than the cumulative ones
+        bounds = [f"<= {bound}" for bound, _ in histogram["buckets"]]
+        cumulative = [count for _, count in histogram["buckets"]]
+        counts = [count - previous for count, previous in zip(cumulative, [0] + cumulative[:-1])]
+        st.sidebar.bar_chart(pd.Series(counts, index=bounds, name="calls"), sort=False)
+    st.sidebar.download_button("Metrics (JSON)", metrics.to_json(), file_name="metrics.json",
+                               mime="application/json")
+    st.sidebar.download_button("Metrics (Prometheus)", metrics.to_prometheus(), file_name="metrics.prom",
+                               mime="text/plain")
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+
+from filter_cache import ALL_WORKSHOPS, ALL_YEARS, label_sort_key
+
+NO_FILTER = (None, ALL_YEARS, ALL_WORKSHOPS)
+# Map center used when no point has coordinates (central Florida)
+DEFAULT_CENTER = (28, -82)
+
+
+def _categorical(values):
+    # Numbers sort numerically and text alphabetically, the order the filter dropdowns show
+    series = pd.Series(values)
+    categories = sorted(series.dropna().unique().tolist(), key=label_sort_key)
+    return pd.Categorical(series, categories=categories)
+
+
+def _python_list(values):
+    """Plain Python values with missing entries as None, ready for JSON."""
+    if isinstance(values, pd.Categorical):
+        categories = [value.item() if hasattr(value, "item") else value for value in values.categories]
+        return [categories[code] if code >= 0 else None for code in values.codes.tolist()]
+    if values.dtype.kind == "f":
+        return [None if value != value else value for value in values.tolist()]
+    return values.tolist()
+
+
+class PointSet:
+    """
+    Columnar container for map points.
+
+    Coordinates are float32, attendance is int64, Year and workshop name are categoricals, and any
+    extra tooltip fields (image, address) are categoricals as well, since they repeat per venue.
+    Centroid, bounds, totals, distinct locations and filter masks are computed with numpy instead of
+    looping over records.
+
+    Parameters:
+        lat, lon (array-like): Coordinates; missing or non-numeric values mark a point as not drawable.
+        people (array-like, optional): Attendance per row.
+        year, name (array-like, optional): Filter values per row.
+        fields (dict, optional): Payload name -> values, for additional tooltip fields.
+    """
+
+    def __init__(self, lat, lon, people=None, year=None, name=None, fields=None):
+        self.lat = pd.to_numeric(pd.Series(lat), errors="coerce").to_numpy(dtype=np.float32)
+        self.lon = pd.to_numeric(pd.Series(lon), errors="coerce").to_numpy(dtype=np.float32)
+        size = len(self.lat)
+        if people is None:
+            self.people = np.zeros(size, dtype=np.int64)
+        else:
+            self.people = pd.to_numeric(pd.Series(people), errors="coerce").fillna(0).round().to_numpy(dtype=np.int64)
+        self.year = _categorical(year) if year is not None else None
+        self.name = _categorical(name) if name is not None else None
+        self.fields = {key: _categorical(values) for key, values in (fields or {}).items()}
+        self.valid = np.isfinite(self.lat) & np.isfinite(self.lon)
+
+    @classmethod
+    def from_frame(cls, df, lat="Latitude", lon="Longitude", people="People Attended", year=None, name=None,
+                   fields=None):
+        """Build a PointSet from DataFrame columns; ``fields`` maps payload names to column names."""
+        def column(key):
+            return df[key].to_numpy() if key is not None and key in df.columns else None
+
+        extra = {key: column(value) for key, value in (fields or {}).items() if value in df.columns}
+        return cls(column(lat), column(lon), people=column(people), year=column(year), name=column(name),
+                   fields=extra)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _rows(self, mask):
+        return np.ones(len(self), dtype=bool) if mask is None else mask
+
+    def _category_mask(self, values, selected):
+        if values is None or selected in NO_FILTER:
+            return np.ones(len(self), dtype=bool)
+        matches = np.flatnonzero(np.asarray(values.categories == selected))
+        if not len(matches):
+            return np.zeros(len(self), dtype=bool)
+        return values.codes == matches[0]
+
+    def mask(self, year=None, name=None):
+        """Boolean mask of the rows matching a Year / workshop selection; "All" or None means no filter."""
+        return self._category_mask(self.year, year) & self._category_mask(self.name, name)
+
+    def count(self, mask=None):
+        return int(self._rows(mask).sum())
+
+    def total(self, mask=None):
+        """Summed attendance of the selected rows, including rows without coordinates."""
+        return int(self.people[self._rows(mask)].sum())
+
+    def centroid(self, mask=None):
+        """Mean (lat, lon) of the drawable selected points, or None when there are none."""
+        rows = self._rows(mask) & self.valid
+        if not rows.any():
+            return None
+        return float(self.lat[rows].mean(dtype=np.float64)), float(self.lon[rows].mean(dtype=np.float64))
+
+    def bounds(self, mask=None):
+        """[[south, west], [north, east]] of the drawable selected points, or None when there are none."""
+        rows = self._rows(mask) & self.valid
+        if not rows.any():
+            return None
+        lat, lon = self.lat[rows], self.lon[rows]
+        return [[float(lat.min()), float(lon.min())], [float(lat.max()), float(lon.max())]]
+
+    def distinct_locations(self, mask=None, field="address"):
+        """Number of distinct values of ``field`` among the selected rows, or of distinct coordinates without it."""
+        rows = self._rows(mask)
+        if field in self.fields:
+            codes = self.fields[field].codes[rows]
+            return int(len(np.unique(codes[codes >= 0])))
+        rows = rows & self.valid
+        return int(len(np.unique(np.stack([self.lat[rows], self.lon[rows]], axis=1), axis=0)))
+
+    def aggregate(self, year=None, name=None):
+        """Totals for a filter selection: {"people": int, "workshops": int, "bounds": see ``bounds``}."""
+        mask = self.mask(year, name)
+        return {"people": self.total(mask), "workshops": self.count(mask), "bounds": self.bounds(mask)}
+
+    def aggregates(self):
+        """
+        Precompute ``aggregate`` for every (Year, workshop) selection that has rows, including the "All"
+        choices, in one grouped pass instead of one mask per selection.
+
+        Returns:
+            dict: {(year, name): aggregate} where ``year`` may be ``ALL_YEARS`` and ``name`` may be
+            ``ALL_WORKSHOPS``.
+        """
+        frame = pd.DataFrame({"people": self.people, "workshops": 1,
+                              "lat": np.where(self.valid, self.lat, np.nan).astype(np.float64),
+                              "lon": np.where(self.valid, self.lon, np.nan).astype(np.float64)})
+        labels = {}
+        for key in ("year", "name"):
+            if self._values(key) is not None:
+                frame[key] = self._values(key).codes
+                labels[key] = self.labels(key)
+        named = {"people": ("people", "sum"), "workshops": ("workshops", "sum"), "south": ("lat", "min"),
+                 "north": ("lat", "max"), "west": ("lon", "min"), "east": ("lon", "max")}
+
+        aggregates = {(ALL_YEARS, ALL_WORKSHOPS): self.aggregate()}
+        for keys in (["year", "name"], ["year"], ["name"]):
+            if any(key not in labels for key in keys):
+                continue
+            for codes, row in frame.groupby(keys).agg(**named).iterrows():
+                codes = codes if isinstance(codes, tuple) else (codes,)
+                if min(codes) < 0:
+                    # Rows without a Year or workshop only count towards "All"
+                    continue
+                selection = {key: labels[key][code] for key, code in zip(keys, codes)}
+                bounds = None
+                if pd.notna(row["south"]):
+                    bounds = [[float(row["south"]), float(row["west"])], [float(row["north"]), float(row["east"])]]
+                aggregates[(selection.get("year", ALL_YEARS), selection.get("name", ALL_WORKSHOPS))] = {
+                    "people": int(row["people"]), "workshops": int(row["workshops"]), "bounds": bounds}
+        return aggregates
+
+    def labels(self, key):
+        """Sorted distinct values of a categorical column ("year", "name" or an extra field)."""
+        return _python_list(pd.Categorical.from_codes(np.arange(len(self._values(key).categories)),
+                                                      self._values(key).categories))
+
+    def _values(self, key):
+        if key == "people":
+            return self.people
+        if key == "year":
+            return self.year
+        if key == "name":
+            return self.name
+        return self.fields[key]
+
+    def columns(self, fields=None, mask=None, precision=5):
+        """
+        Columnar payload for the map layers, like ``map_layers.build_columns`` but without records.
+
+        Parameters:
+            fields (list, optional): Payload names to include ("people", "year", "name" or an extra
+                field). Defaults to "people" plus every extra field.
+            mask (array, optional): Rows to include; rows without coordinates are always skipped.
+            precision (int): Decimal places kept for coordinates.
+        """
+        if fields is None:
+            fields = ["people"] + list(self.fields)
+        rows = self._rows(mask) & self.valid
+        payload = {
+            "lat": np.round(self.lat[rows].astype(np.float64), precision).tolist(),
+            "lon": np.round(self.lon[rows].astype(np.float64), precision).tolist(),
+        }
+        for key in fields:
+            if key in ("people", "year", "name") or key in self.fields:
+                payload[key] = _python_list(self._values(key)[rows])
+            else:
+                # A missing optional column (e.g. no image column) renders as empty tooltip fields
+                payload[key] = [None] * len(payload["lat"])
+        return payload
+
+    def indexed_columns(self, fields=None, index_fields=("year", "name"), mask=None, precision=5):
+        """
+        Payload for ``FilteredPointLayer``: index fields hold codes into ``payload["labels"][field]`` and
+        ``payload["index"][field][code]`` lists their rows, so a filter jumps straight to the matching
+        rows instead of scanning the whole payload.
+        """
+        payload = self.columns(fields, mask=mask, precision=precision)
+        rows = self._rows(mask) & self.valid
+        payload["labels"] = {}
+        payload["index"] = {}
+        for key in index_fields:
+            values = self._values(key)
+            codes = values.codes[rows]
+            # Only labels that occur among the drawn rows, renumbered densely in label order
+            present = np.unique(codes[codes >= 0])
+            remap = np.full(len(values.categories) + 1, -1, dtype=np.int64)
+            remap[present] = np.arange(len(present))
+            encoded = remap[codes]
+            order = np.argsort(encoded, kind="stable")
+            boundaries = np.searchsorted(encoded[order], np.arange(len(present) + 1))
+            payload[key] = encoded.tolist()
+            payload["labels"][key] = _python_list(pd.Categorical.from_codes(present, values.categories))
+            payload["index"][key] = [order[start:end].tolist()
+                                     for start, end in zip(boundaries[:-1].tolist(), boundaries[1:].tolist())]
+        return payload
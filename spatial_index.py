@@ -0,0 +1,151 @@
+import math
+
+import numpy as np
+
+from clustering import DEFAULT_RADIUS, build_cluster_hierarchy
+
+DEFAULT_CELL_DEGREES = 0.25  # Grid cell size; roughly 25 km, a few cells per county
+DEFAULT_MAX_DETAIL = 2000  # Individual markers sent for the visible area before it is clustered too
+VIEW_PADDING = 0.25  # Share of the view added on every side, so small pans stay inside the query
+
+
+class GridIndex:
+    """
+    Uniform latitude/longitude grid over point coordinates, answering bounding-box queries.
+
+    Points are sorted by cell, so the cells of one grid row within a query form one contiguous run
+    found with two binary searches; only the points in those cells are tested against the box.
+    Boxes crossing the antimeridian are not supported.
+
+    Parameters:
+        lat, lon (array-like): Point coordinates; points without coordinates are never returned.
+        cell_degrees (float): Cell size in degrees.
+    """
+
+    def __init__(self, lat, lon, cell_degrees=DEFAULT_CELL_DEGREES):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.cell_degrees = cell_degrees
+        rows = np.flatnonzero(np.isfinite(self.lat) & np.isfinite(self.lon))
+        self.south = float(self.lat[rows].min()) if len(rows) else 0.0
+        self.west = float(self.lon[rows].min()) if len(rows) else 0.0
+        cell_row = np.floor((self.lat[rows] - self.south) / cell_degrees).astype(np.int64)
+        cell_col = np.floor((self.lon[rows] - self.west) / cell_degrees).astype(np.int64)
+        self.n_rows = int(cell_row.max()) + 1 if len(rows) else 0
+        self.n_cols = int(cell_col.max()) + 1 if len(rows) else 0
+        keys = cell_row * self.n_cols + cell_col
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.rows = rows[order]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def snap(self, bounds, padding=VIEW_PADDING):
+        """Pad ``[[south, west], [north, east]]`` on every side and round it outwards to whole cells."""
+        (south, west), (north, east) = bounds
+        pad_lat = (north - south) * padding
+        pad_lon = (east - west) * padding
+        step = self.cell_degrees
+        return [[math.floor((south - pad_lat) / step) * step, math.floor((west - pad_lon) / step) * step],
+                [math.ceil((north + pad_lat) / step) * step, math.ceil((east + pad_lon) / step) * step]]
+
+    def query(self, bounds, mask=None):
+        """
+        Row positions (sorted) of the points inside ``[[south, west], [north, east]]``, optionally only
+        those where the boolean array ``mask`` is set.
+        """
+        (south, west), (north, east) = bounds
+        first_row = max(0, math.floor((south - self.south) / self.cell_degrees))
+        last_row = min(self.n_rows - 1, math.floor((north - self.south) / self.cell_degrees))
+        first_col = max(0, math.floor((west - self.west) / self.cell_degrees))
+        last_col = min(self.n_cols - 1, math.floor((east - self.west) / self.cell_degrees))
+        if first_row > last_row or first_col > last_col:
+            return np.empty(0, dtype=np.int64)
+        grid_rows = np.arange(first_row, last_row + 1) * self.n_cols
+        starts = np.searchsorted(self.keys, grid_rows + first_col, side="left")
+        ends = np.searchsorted(self.keys, grid_rows + last_col, side="right")
+        candidates = np.concatenate([self.rows[start:end] for start, end in zip(starts, ends)])
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        if mask is not None:
+            inside &= mask[candidates]
+        return np.sort(candidates[inside])
+
+
+def fit_zoom(bounds, width, height, tile_size=256, max_zoom=18):
+    """
+    Zoom level Leaflet's ``fitBounds`` picks for ``[[south, west], [north, east]]`` in a map of
+    ``width`` x ``height`` pixels, i.e. the view before the map has reported one.
+    """
+    (south, west), (north, east) = bounds
+
+    def mercator_y(lat):
+        lat = max(min(lat, 85.0511), -85.0511)
+        return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+    zooms = [max_zoom]
+    if east > west:
+        zooms.append(math.log2(width / tile_size * 360 / (east - west)))
+    if north > south:
+        zooms.append(math.log2(height / tile_size * 2 * math.pi / (mercator_y(north) - mercator_y(south))))
+    return max(0, min(max_zoom, math.floor(min(zooms))))
+
+
+def _aggregate_columns(points, rows, zoom, radius, precision=5):
+    # Grid clusters of the given rows at one zoom level, sized by how many points they hold
+    levels = build_cluster_hierarchy(points.lat[rows], points.lon[rows], points.people[rows], min_zoom=zoom,
+                                     max_zoom=zoom, radius=radius)
+    level = levels[zoom]
+    return level, {
+        "lat": level["lat"].round(precision).tolist(),
+        "lon": level["lon"].round(precision).tolist(),
+        "people": level["weight"].astype(np.int64).tolist(),
+        "count": level["count"].tolist(),
+        "size": (6 + 3 * np.log2(level["count"])).round(1).tolist(),
+    }
+
+
+def viewport_columns(points, index, bounds, zoom, mask=None, fields=("people", "img", "name"),
+                     max_detail=DEFAULT_MAX_DETAIL, radius=DEFAULT_RADIUS):
+    """
+    Split a selection into detailed markers for the visible area and aggregates for the rest.
+
+    Parameters:
+        points (PointSet): All points; ``index`` must be built over the same rows.
+        index (GridIndex): Spatial index of ``points``.
+        bounds (list): Visible area as ``[[south, west], [north, east]]``, already padded if wanted.
+        zoom (int): Current map zoom; points outside the view are clustered two levels coarser.
+        mask (array, optional): Selection to draw, e.g. from ``PointSet.mask``.
+        fields (tuple): Payload fields of the detailed markers.
+        max_detail (int): When more points than this are visible, the visible area is clustered at
+            ``zoom`` as well and only its single points are sent individually.
+        radius (int): Cluster cell size in pixels.
+
+    Returns:
+        tuple: (detail payload like ``PointSet.columns``, aggregate payload with lat, lon, people, count
+        and a marker size, dict of counts for diagnostics).
+    """
+    selected = points.valid if mask is None else mask & points.valid
+    inside = index.query(bounds, selected)
+    outside = np.flatnonzero(selected)
+    outside = outside[~np.isin(outside, inside, assume_unique=True)]
+
+    detail_rows = inside
+    aggregates = {"lat": [], "lon": [], "people": [], "count": [], "size": []}
+    if len(inside) > max_detail:
+        level, aggregates = _aggregate_columns(points, inside, zoom, radius)
+        singles = level["point"].to_numpy()
+        detail_rows = inside[singles[singles >= 0]]
+        multi = level["count"].to_numpy() > 1
+        aggregates = {key: [value for value, keep in zip(values, multi) if keep] for key, values in aggregates.items()}
+    if len(outside):
+        _, rest = _aggregate_columns(points, outside, max(int(zoom) - 2, 0), radius)
+        for key in aggregates:
+            aggregates[key] = aggregates[key] + rest[key]
+
+    detail_mask = np.zeros(len(points), dtype=bool)
+    detail_mask[detail_rows] = True
+    stats = {"visible_points": int(len(inside)), "detail_markers": int(len(detail_rows)),
+             "aggregate_markers": len(aggregates["lat"]), "outside_points": int(len(outside))}
+    return points.columns(list(fields), mask=detail_mask), aggregates, stats
@@ -0,0 +1,39 @@
+import pytest
+
+from addresses import canonicalize, canonicalize_addresses
+
+
+@pytest.mark.parametrize("first, second", [
+    ("100 N Main St, Tampa", "100 S Main St, Tampa"),
+    ("100 N Main St, Tampa", "100 Main St, Tampa"),
+    ("100 S Main St, Tampa", "100 Main St, Tampa"),
+    ("200 E 5th St", "200 W 5th St"),
+    ("100 Main St, Tampa", "100 Main Ave, Tampa"),
+    ("123 Main St, Tampa", "125 Main St, Tampa"),
+])
+def test_fuzzy_keeps_different_places_apart(first, second):
+    mapping, report = canonicalize_addresses([first, second], fuzzy=True)
+    assert mapping[first] != mapping[second]
+    assert report["collapsed_addresses"] == 0
+
+
+def test_fuzzy_merges_typos_and_missing_words():
+    addresses = ["100 N Main St, Tampa FL 33602", "100 N Main St, Tamap FL 33602", "100 North Main Street, Tampa, Florida 33602"]
+    mapping, report = canonicalize_addresses(addresses, fuzzy=True)
+    assert len(set(mapping.values())) == 1
+    assert report["collapsed_addresses"] == 2
+
+
+def test_canonicalize_spelling_variants():
+    assert canonicalize("123 Main Street, Tampa") == canonicalize("123 main st. tampa ")
+    assert canonicalize("21st Ave") == "21 ave"
+    assert canonicalize("Tampa, FL 33602-1234") == "tampa fl 33602"
+    assert canonicalize(None) == ""
+    assert canonicalize(float("nan")) == ""
+
+
+def test_canonicalize_is_idempotent():
+    # Cache and journal migration rely on canonical keys mapping to themselves
+    for address in ["100 North Main Street, Tampa, Florida", "1 St. John's Pl & 5th Ave", "Café Ñandú, USA"]:
+        key = canonicalize(address)
+        assert canonicalize(key) == key
@@ -0,0 +1,47 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+from excel_export import save_dataframe_to_excel_with_hyperlinks
+
+
+def test_parquet_copy_types_columns_from_the_whole_frame(tmp_path):
+    # The first chunk has only integers and no notes; later chunks bring text, missing and fractional values
+    data = pd.DataFrame({"People Attended": [3, 4, "N/A", None],
+                         "Notes": [None, None, "rescheduled", None],
+                         "Count": pd.Series([1, 2, None, 4.5], dtype=object),
+                         "Latitude": [25.1, 25.2, 25.3, 25.4]})
+    copy_path = str(tmp_path / "copy.parquet")
+    written = save_dataframe_to_excel_with_hyperlinks(data, str(tmp_path / "out.xlsx"), copy_file=copy_path,
+                                                      chunk_rows=2)
+    assert written == 4
+
+    copy = pd.read_parquet(copy_path)
+    assert copy["People Attended"].tolist()[:3] == ["3", "4", "N/A"]
+    assert copy["Notes"].tolist()[2] == "rescheduled"
+    assert copy["Count"].tolist()[:2] == [1.0, 2.0] and copy["Count"].tolist()[3] == 4.5
+    assert copy["Latitude"].tolist() == [25.1, 25.2, 25.3, 25.4]
+
+
+def test_parquet_copy_from_chunks(tmp_path):
+    chunks = [pd.DataFrame({"People Attended": [3, 4], "Notes": [None, None]}),
+              pd.DataFrame({"People Attended": [5.5, None], "Notes": ["late", None]})]
+    copy_path = str(tmp_path / "copy.parquet")
+    save_dataframe_to_excel_with_hyperlinks(iter(chunks), str(tmp_path / "out.xlsx"), copy_file=copy_path)
+
+    copy = pd.read_parquet(copy_path)
+    assert copy["People Attended"].tolist()[:3] == [3.0, 4.0, 5.5]
+    assert copy["Notes"].tolist()[2] == "late"
+
+
+def test_only_http_links_become_formulas(tmp_path):
+    long_url = "https://example.org/" + "a" * 300
+    inline = "data:image/jpeg;base64," + "A" * 40000
+    data = pd.DataFrame({"Img": ["https://example.org/p.jpg", long_url, inline, "photos/p.jpg", None,
+                                 'http://example.org/say"hi".jpg']})
+    path = str(tmp_path / "out.xlsx")
+    save_dataframe_to_excel_with_hyperlinks(data, path)
+
+    cells = [row[0] for row in load_workbook(path).active.iter_rows(min_row=2, values_only=True)]
+    assert cells == ['=HYPERLINK("https://example.org/p.jpg", "https://example.org/p.jpg")', long_url, None,
+                     "photos/p.jpg", None, '=HYPERLINK("http://example.org/say""hi"".jpg", '
+                                           '"http://example.org/say""hi"".jpg")']
@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+import geocode_jobs
+from geocode_jobs import JobCancelled, get_job
+from geocoding import geocode_addresses
+
+
+@pytest.fixture(autouse=True)
+def job_registry():
+    # get_job keeps jobs process-wide; every test starts and ends with an empty registry
+    geocode_jobs._jobs.clear()
+    yield
+    geocode_jobs._jobs.clear()
+
+
+def _run(tag, log, started, gate, job=None):
+    log.append(("start", tag))
+    started.set()
+
+    def geocode(address):
+        gate.wait()
+        job.check_cancelled()
+        return 1.0, 2.0
+
+    geocode_addresses([f"{tag} {i}" for i in range(500)], geocode, max_workers=4, requests_per_second=None,
+                      progress_callback=job.progress)
+    log.append(("end", tag))
+    return tag
+
+
+def test_same_content_reuses_the_job_and_a_new_one_supersedes_it():
+    log = []
+    first_started, first_gate = threading.Event(), threading.Event()
+    first = get_job("content-a", _run, "a", log, first_started, first_gate, group="workbook")
+    assert get_job("content-a", _run, "a", log, first_started, first_gate, group="workbook") is first
+    assert first_started.wait(timeout=30)
+
+    open_gate = threading.Event()
+    open_gate.set()
+    second = get_job("content-b", _run, "b", log, threading.Event(), open_gate, group="workbook")
+    # The first job's lookups only continue once the second job has cancelled it
+    first_gate.set()
+    first.join(timeout=30)
+    second.join(timeout=30)
+    assert first.finished and second.finished
+    assert isinstance(first.error, JobCancelled)
+    assert second.result == "b"
+    # The superseded job stopped before the new one started, so they never shared the journal
+    assert log == [("start", "a"), ("start", "b"), ("end", "b")]
@@ -0,0 +1,51 @@
+import pytest
+
+from geocode_journal import GeocodeJournal
+from geocoding import GeocoderBackend, GeocoderClient, GeocodingError, geocode_addresses
+from benchmarks.mock_locationiq import MockLocationIQ
+
+
+def test_failed_lookups_are_not_journaled(tmp_path):
+    path = str(tmp_path / "run.journal.jsonl")
+
+    def flaky(address):
+        if address == "down":
+            raise GeocodingError("server error")
+        if address == "nowhere":
+            return None, None
+        return 1.0, 2.0
+
+    with GeocodeJournal(path) as journal:
+        results = geocode_addresses(["found", "nowhere", "down"], flaky, journal=journal, requests_per_second=None)
+    assert results == [(1.0, 2.0), (None, None), (None, None)]
+
+    calls = []
+
+    def recovered(address):
+        calls.append(address)
+        return 3.0, 4.0
+
+    with GeocodeJournal(path) as journal:
+        assert journal.get("down") is None
+        results = geocode_addresses(["found", "nowhere", "down"], recovered, journal=journal, requests_per_second=None)
+    assert calls == ["down"]
+    assert results == [(1.0, 2.0), (None, None), (3.0, 4.0)]
+
+
+def test_client_search_tells_failures_from_misses():
+    with MockLocationIQ(rate_404=1.0) as mock:
+        client = GeocoderClient("key", base_url=mock.url)
+        assert client.search("1 Main St") == (None, None)
+    with MockLocationIQ(rate_500=1.0) as mock:
+        client = GeocoderClient("key", base_url=mock.url, retries=2, backoff_base=0.01)
+        with pytest.raises(GeocodingError):
+            client.search("1 Main St")
+        assert client.geocode("1 Main St") == (None, None)
+
+
+def test_backend_requires_geocode():
+    class Incomplete(GeocoderBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,202 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import geocoding
+import hedging
+from geocoding import GeocoderBackend, GeocoderClient, TokenBucket
+from hedging import MIN_DELAY, MIN_SAMPLES, HedgedGeocoder
+from benchmarks.mock_locationiq import MockLocationIQ, fake_coordinates
+
+
+class CountingBucket(TokenBucket):
+    def __init__(self, rate):
+        super().__init__(rate)
+        self.acquired = 0
+        self._count_lock = threading.Lock()
+
+    def acquire(self):
+        super().acquire()
+        with self._count_lock:
+            self.acquired += 1
+
+
+class GatedGeocoder(GeocoderBackend):
+    """Primary whose answers for ``slow`` addresses (all, by default) wait until ``release`` is called."""
+
+    def __init__(self, slow=None):
+        self.slow = slow
+        self.calls = []
+        self._gates = []
+        self._lock = threading.Lock()
+
+    def geocode(self, address):
+        gate = threading.Event()
+        with self._lock:
+            self.calls.append(address)
+            if self.slow is None or address in self.slow:
+                self._gates.append(gate)
+            else:
+                gate.set()
+        gate.wait()
+        return fake_coordinates(address)
+
+    def release(self):
+        with self._lock:
+            for gate in self._gates:
+                gate.set()
+
+
+class AnsweringGeocoder(GeocoderBackend):
+    def __init__(self):
+        self.calls = []
+
+    def geocode(self, address):
+        self.calls.append(address)
+        return fake_coordinates(address)
+
+
+def test_slow_primary_requests_are_hedged_to_the_secondary():
+    addresses = [f"{i} Main St, Tampa FL" for i in range(40)]
+    slow = set(addresses[::4])
+    primary, secondary = GatedGeocoder(slow), AnsweringGeocoder()
+    geocoder = HedgedGeocoder(primary, secondary, budget=1.0, initial_delay=0.05)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(geocoder.search, addresses))
+    finally:
+        primary.release()
+    assert results == [fake_coordinates(address) for address in addresses]
+    # The slow primaries never answer in time, so each of them was hedged and won by the secondary
+    assert slow <= set(secondary.calls)
+    assert geocoder.stats["hedge_wins"] >= len(slow)
+    assert geocoder.provider_stats["secondary_backend"].counts["wins"] >= len(slow)
+    assert sorted(primary.calls) == sorted(addresses)
+
+
+def test_abandoned_primaries_do_not_block_later_calls():
+    primary = GatedGeocoder()
+    geocoder = HedgedGeocoder(primary, AnsweringGeocoder(), budget=1.0, initial_delay=0.01)
+    try:
+        # Run in a worker so a blocked call fails the test instead of hanging it
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(lambda: [geocoder.search(f"{i} Oak Ave") for i in range(30)]).result(timeout=60)
+    finally:
+        primary.release()
+    assert geocoder.stats["abandoned"] == 30
+    assert geocoder.stats["hedge_wins"] == 30
+
+
+class ReleasingHedgedGeocoder(HedgedGeocoder):
+    # Lets the gated primary answer whenever no hedge may be sent, so over-budget calls finish
+    def _may_hedge(self):
+        allowed = super()._may_hedge()
+        if not allowed:
+            self.providers[0].release()
+        return allowed
+
+
+def test_hedges_respect_the_budget():
+    primary = GatedGeocoder()
+    geocoder = ReleasingHedgedGeocoder(primary, AnsweringGeocoder(), budget=0.1, initial_delay=0.01)
+    try:
+        for i in range(20):
+            assert geocoder.search(f"{i} Pine St") == fake_coordinates(f"{i} Pine St")
+    finally:
+        primary.release()
+    assert geocoder.stats["hedged"] + geocoder.stats["over_budget"] == 20
+    assert geocoder.stats["hedged"] <= 0.1 * 20 + 1
+    assert geocoder.stats["over_budget"] > 0
+
+
+def test_every_request_takes_a_token():
+    limiter = CountingBucket(1000)
+    with MockLocationIQ(rate_500=0.3, seed=3) as flaky:
+        client = GeocoderClient("key", base_url=flaky.url, limiter=limiter, backoff_base=0, retries=5)
+        for i in range(20):
+            client.geocode(f"{i} Elm St")
+        # Retries included
+        assert flaky.stats["errors"] > 0
+        assert limiter.acquired == flaky.stats["requests"] == client.stats["requests"]
+
+    limiter = CountingBucket(1000)
+    with MockLocationIQ(slow_rate=0.5, slow_latency=0.5, seed=1) as slow, MockLocationIQ() as fast:
+        geocoder = HedgedGeocoder(GeocoderClient("key", base_url=slow.url, limiter=limiter),
+                                  GeocoderClient("key", base_url=fast.url, limiter=limiter),
+                                  budget=1.0, initial_delay=0.05)
+        for i in range(10):
+            assert geocoder.search(f"{i} Elm St") == fake_coordinates(f"{i} Elm St")
+        # A hedge is only sent once the primary has its token, so hedges included, each call's requests
+        # have taken theirs by the time it returns
+        assert limiter.acquired == geocoder.stats["calls"] + geocoder.stats["hedged"]
+
+
+class FakeClock:
+    """Stands in for the ``time`` module, so waits and round trips take exactly the seconds a test says."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+    monotonic = perf_counter
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def json(self):
+        return [{"lat": "27.95", "lon": "-82.46"}]
+
+
+class FakeSession:
+    def __init__(self, clock, seconds):
+        self.clock = clock
+        self.seconds = seconds
+
+    def get(self, url, params=None, timeout=None):
+        self.clock.sleep(self.seconds)
+        return FakeResponse()
+
+    def close(self):
+        pass
+
+
+class QueueingLimiter:
+    def __init__(self, clock, seconds):
+        self.clock = clock
+        self.seconds = seconds
+
+    def acquire(self):
+        self.clock.sleep(self.seconds)
+
+
+class FixedGeocoder(GeocoderBackend):
+    def geocode(self, address):
+        return 27.95, -82.46
+
+
+def test_rate_limiter_waits_are_not_provider_latency(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(geocoding, "time", clock)
+    monkeypatch.setattr(hedging, "time", clock)
+    client = GeocoderClient("key", limiter=QueueingLimiter(clock, 5.0))
+    client.session = FakeSession(clock, 0.01)
+
+    timings = {}
+    assert client.search("1 Main St", timings=timings) == (27.95, -82.46)
+    assert timings["queued_seconds"] == pytest.approx(5.0)
+    assert timings["request_seconds"] == pytest.approx(0.01)
+
+    geocoder = HedgedGeocoder(client, FixedGeocoder(), budget=1.0)
+    for i in range(MIN_SAMPLES):
+        geocoder.search(f"{i} Main St")
+    primary = geocoder.summary()["providers"]["primary_locationiq"]
+    assert primary["p95_seconds"] == pytest.approx(0.01)
+    assert geocoder.hedge_delay() == MIN_DELAY
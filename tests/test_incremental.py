@@ -0,0 +1,49 @@
+import datetime
+
+import pandas as pd
+from openpyxl import Workbook
+
+from incremental import ArtifactStore, drop_internal_columns, read_incremental, save_incremental
+
+COLUMNS = ["Address", "People Attended", "Img"]
+
+
+def write_workbook(path, sheets):
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        worksheet = workbook.create_sheet(title)
+        worksheet.append(COLUMNS + ["Year"])
+        for row in rows:
+            worksheet.append(row)
+    workbook.save(path)
+
+
+def run(path, store):
+    # One pipeline run with a stand-in geocoder that fills missing coordinates
+    data, info = read_incremental(path, COLUMNS, store=store, name="workshops")
+    for column in ("Latitude", "Longitude"):
+        if column not in data.columns:
+            data[column] = float("nan")
+        data[column] = data[column].fillna(data["Address"].str.len().astype(float))
+    save_incremental(data, path, store=store, name="workshops")
+    return drop_internal_columns(data), info
+
+
+def test_warm_run_matches_cold_run(tmp_path):
+    unchanged = [["1 Main St", 12, "a.png", 2022], ["2 Main St", "N/A", None, 2022],
+                 ["3 Main St", 4.5, "c.png", datetime.datetime(2022, 5, 1)]]
+    path = str(tmp_path / "workshops.xlsx")
+
+    write_workbook(path, {"2022": unchanged, "2023": [["4 Main St", 7, None, 2023]]})
+    warm_store = ArtifactStore(str(tmp_path / "warm"))
+    run(path, warm_store)
+    write_workbook(path, {"2022": unchanged, "2023": [["4 Main St", 8, None, 2023], ["5 Main St", "TBD", None, 2023]]})
+    warm, info = run(path, warm_store)
+    cold, _ = run(path, ArtifactStore(str(tmp_path / "cold")))
+
+    assert info["sheets_reused"] == ["2022"]
+    pd.testing.assert_frame_equal(warm, cold)
+    for column in ("People Attended", "Year"):
+        assert [type(value) for value in warm[column]] == [type(value) for value in cold[column]]
+    assert warm["People Attended"].tolist()[:3] == [12, "N/A", 4.5]
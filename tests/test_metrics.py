@@ -0,0 +1,40 @@
+import pytest
+
+from metrics import Histogram, Metrics
+
+
+def test_merge_adds_stages_counters_and_histograms_and_keeps_gauges():
+    run, job = Metrics(), Metrics()
+    run.incr("geocode_calls", 3)
+    job.incr("geocode_calls", 2)
+    job.set("backend", "locationiq")
+    run.set("map_cache_hit", 1)
+    run.set("rows", 10)
+    job.set("rows", 40)
+    run.stages["geocode"] = 1.0
+    job.stages["geocode"] = 0.5
+    for value in (0.01, 0.2):
+        run.observe("latency", value)
+    job.observe("latency", 3.0)
+    job.observe("job_latency", 0.3)
+
+    run.merge(job)
+    run.merge(Metrics())
+
+    # Counters add up, gauges keep the latest value
+    assert run.counters == {"geocode_calls": 5, "backend": "locationiq", "map_cache_hit": 1, "rows": 40}
+    assert run.stages["geocode"] == pytest.approx(1.5)
+    latency = run.histograms["latency"]
+    assert latency.count == 3
+    assert latency.sum == pytest.approx(3.21)
+    assert latency.cumulative()[-1] == ("+Inf", 3)
+    assert dict(latency.cumulative())[0.25] == 2
+    assert run.histograms["job_latency"].count == 1
+    # The merged histogram is a copy, later observations in the job do not leak into the run
+    job.observe("job_latency", 0.3)
+    assert run.histograms["job_latency"].count == 1
+
+
+def test_histogram_merge_rejects_different_buckets():
+    with pytest.raises(ValueError):
+        Histogram((1.0,)).merge(Histogram((2.0,)))
@@ -0,0 +1,29 @@
+import math
+
+import pandas as pd
+
+from filter_cache import ALL_WORKSHOPS, ALL_YEARS
+from pointset import PointSet
+
+
+def test_aggregates_match_per_selection_aggregate():
+    df = pd.DataFrame({"lat": [27.1, 27.5, None, 28.0, 26.2],
+                       "lon": [-82.1, -82.6, -81.0, -81.5, -80.9],
+                       "people_served": [10, 5, 7, 3, 1],
+                       "Year": [2022, 2023, 2023, 2022, None],
+                       "name": ["Intro", "Intro", "Advanced", "Advanced", "Intro"]})
+    points = PointSet.from_frame(df, lat="lat", lon="lon", people="people_served", year="Year", name="name")
+    aggregates = points.aggregates()
+
+    assert set(aggregates) == {(ALL_YEARS, ALL_WORKSHOPS), (2022.0, ALL_WORKSHOPS), (2023.0, ALL_WORKSHOPS),
+                               (ALL_YEARS, "Advanced"), (ALL_YEARS, "Intro"), (2022.0, "Intro"),
+                               (2022.0, "Advanced"), (2023.0, "Intro"), (2023.0, "Advanced")}
+    for (year, name), entry in aggregates.items():
+        expected = points.aggregate(year, name)
+        assert entry["people"] == expected["people"] and entry["workshops"] == expected["workshops"]
+        if expected["bounds"] is None:
+            assert entry["bounds"] is None
+        else:
+            assert all(math.isclose(a, b) for pair in zip(entry["bounds"], expected["bounds"]) for a, b in zip(*pair))
+    # The only 2023 Advanced row has no coordinates
+    assert aggregates[(2023.0, "Advanced")] == {"people": 7, "workshops": 1, "bounds": None}
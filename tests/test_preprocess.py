@@ -0,0 +1,18 @@
+import pandas as pd
+
+from Data_Preproccess import save_consolidated_data
+
+
+def test_parquet_output_with_mixed_column(tmp_path):
+    data = pd.DataFrame({"Address": ["1 Main St", "2 Main St", "3 Main St"],
+                         "People Attended": [12, "N/A", None],
+                         "Latitude": [1.0, 2.0, None]})
+    path = str(tmp_path / "out.parquet")
+    save_consolidated_data(data, path)
+
+    written = pd.read_parquet(path)
+    assert written["People Attended"].tolist()[:2] == ["12", "N/A"]
+    assert written["People Attended"].isna().tolist() == [False, False, True]
+    assert written["Latitude"].tolist()[:2] == [1.0, 2.0]
+    # The caller's frame keeps its original values
+    assert data["People Attended"].tolist()[:2] == [12, "N/A"]
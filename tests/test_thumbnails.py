@@ -0,0 +1,93 @@
+import http.server
+import struct
+import threading
+import zlib
+
+import pytest
+from PIL import Image
+
+from thumbnails import DEFAULT_MAX_DIMENSION, DEFAULT_QUALITY, ThumbnailCache, build_thumbnails, fetch_image, source_key
+
+
+def _png(width=4, height=4):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    rows = b"".join(b"\x00" + b"\xff\x00\x00" * width for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+@pytest.fixture
+def image_server():
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.end_headers()
+            self.wfile.write(_png())
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/photo.png"
+    server.shutdown()
+    server.server_close()
+
+
+def test_local_sources_need_allow_local(tmp_path):
+    path = tmp_path / "photo.png"
+    path.write_bytes(_png())
+    for source in (str(path), path.as_uri()):
+        with pytest.raises(ValueError):
+            fetch_image(source)
+        assert fetch_image(source, allow_local=True) == _png()
+
+
+@pytest.mark.parametrize("url", ["http://127.0.0.1/x.png", "http://10.0.0.1/x.png", "http://169.254.169.254/latest",
+                                 "http://[::1]/x.png", "ftp://example.org/x.png"])
+def test_private_hosts_are_refused(url):
+    with pytest.raises(ValueError):
+        fetch_image(url)
+
+
+def test_build_thumbnails_blocks_untrusted_sources(tmp_path, image_server):
+    path = tmp_path / "photo.png"
+    path.write_bytes(_png())
+    with ThumbnailCache(str(tmp_path / "cache")) as cache:
+        replacements, stats = build_thumbnails([str(path), image_server], cache=cache)
+        assert replacements == {}
+        assert stats["blocked"] == 1 and stats["failed"] == 1
+        replacements, stats = build_thumbnails([str(path), image_server], cache=cache, allow_local=True)
+        assert all(value.startswith("data:image/") for value in replacements.values())
+        assert len(replacements) == 2
+
+
+def test_large_thumbnails_keep_their_url_without_prefix(tmp_path, image_server):
+    with ThumbnailCache(str(tmp_path / "cache")) as cache:
+        replacements, stats = build_thumbnails([image_server], cache=cache, allow_local=True, inline_max_bytes=10)
+        assert replacements == {image_server: image_server}
+        assert stats["too_large"] == 1 and stats["inlined"] == 0
+        replacements, stats = build_thumbnails([image_server], cache=cache, allow_local=True, inline_max_bytes=10,
+                                               url_prefix="/thumbs/")
+        assert replacements[image_server].startswith("/thumbs/")
+        assert stats["linked"] == 1
+
+
+def test_large_photos_are_shrunk(tmp_path):
+    path = tmp_path / "photo.jpg"
+    # Noise does not compress, so the original is far over the inline limit
+    Image.effect_noise((2400, 1600), 64).convert("RGB").save(path, quality=95)
+    assert path.stat().st_size > 24 * 1024
+
+    with ThumbnailCache(str(tmp_path / "cache")) as cache:
+        replacements, stats = build_thumbnails([str(path)], cache=cache, allow_local=True, url_prefix="/thumbs/")
+        assert stats["fetched"] == 1 and stats["failed"] == 0
+        assert stats["thumbnail_bytes"] < stats["source_bytes"] / 10
+        digest, mime = cache.get(source_key(str(path), DEFAULT_MAX_DIMENSION, DEFAULT_QUALITY))
+        assert mime == "image/jpeg"
+        with Image.open(cache.path(digest, mime)) as thumbnail:
+            assert thumbnail.size == (DEFAULT_MAX_DIMENSION, DEFAULT_MAX_DIMENSION * 2 // 3)
+        assert replacements[str(path)].startswith(("data:image/jpeg", "/thumbs/"))
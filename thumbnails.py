@@ -0,0 +1,385 @@
+import base64
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import unquote, urljoin, urlparse
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is in requirements.txt; without it only images that are already small get inlined
+    Image = None
+    ImageOps = None
+
+# Content-addressed thumbnail store shared by the Streamlit apps and the batch preprocessor
+DEFAULT_THUMBNAIL_DIR = os.environ.get("THUMBNAIL_DIR", "thumbnail_cache")
+DEFAULT_MAX_DIMENSION = 300  # Tooltips show images 150px wide; twice that stays sharp on high-DPI screens
+DEFAULT_QUALITY = 75
+DEFAULT_INLINE_MAX_BYTES = 24 * 1024  # Thumbnails up to this size become data: URIs in the map itself
+DEFAULT_MAX_CACHE_BYTES = 512 * 1024 * 1024
+DEFAULT_FETCH_WORKERS = 8
+MAX_SOURCE_BYTES = 50 * 1024 * 1024  # Refuse to download anything bigger than this
+FETCH_TIMEOUT = (3.05, 20)
+MAX_REDIRECTS = 5
+
+_MAGIC = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/gif": "gif", "image/webp": "webp"}
+
+
+def sniff_mime(data):
+    """Return the image MIME type of ``data`` from its magic bytes, or None if it is not a known image."""
+    for magic, mime in _MAGIC:
+        if data.startswith(magic):
+            return mime
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def data_uri(data, mime):
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def make_thumbnail(data, max_dimension=DEFAULT_MAX_DIMENSION, quality=DEFAULT_QUALITY):
+    """
+    Shrink an image so its longest side is at most ``max_dimension`` pixels.
+
+    Returns:
+        tuple: (image bytes, MIME type). Without Pillow the original bytes are returned unchanged.
+    """
+    if Image is None:
+        return data, sniff_mime(data)
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension))
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha channel: flatten transparent images onto white like the tooltip background
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue(), "image/jpeg"
+
+
+class ThumbnailCache:
+    """
+    Content-addressed thumbnail store on disk with least-recently-used eviction.
+
+    Thumbnails are stored once per content digest under ``directory``, so the same photo referenced
+    by several URLs is kept only once. A SQLite index maps each source to its digest. When the stored
+    thumbnails exceed ``max_bytes`` the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory=DEFAULT_THUMBNAIL_DIR, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                mime TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                source TEXT PRIMARY KEY,
+                digest TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_blobs_accessed ON blobs (accessed_at);
+            CREATE INDEX IF NOT EXISTS idx_sources_digest ON sources (digest);
+            """
+        )
+        self._conn.commit()
+
+    def relative_path(self, digest, mime):
+        return f"{digest[:2]}/{digest}.{_EXTENSIONS.get(mime, 'img')}"
+
+    def path(self, digest, mime):
+        return os.path.join(self.directory, *self.relative_path(digest, mime).split("/"))
+
+    def get(self, source):
+        """Return (digest, mime) of the thumbnail stored for a source, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT blobs.digest, blobs.mime FROM sources JOIN blobs ON blobs.digest = sources.digest "
+                "WHERE sources.source = ?", (source,)
+            ).fetchone()
+            if row is None or not os.path.exists(self.path(*row)):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE blobs SET accessed_at = ? WHERE digest = ?", (time.time(), row[0]))
+            self._conn.commit()
+            self.hits += 1
+            return row
+
+    def put(self, source, data, mime):
+        """Store a thumbnail for a source and return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest, mime)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs (digest, mime, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (digest, mime, len(data), time.time()),
+            )
+            self._conn.execute("INSERT OR REPLACE INTO sources (source, digest) VALUES (?, ?)", (source, digest))
+            self._conn.commit()
+        return digest
+
+    def read(self, digest, mime):
+        with open(self.path(digest, mime), "rb") as f:
+            return f.read()
+
+    def evict(self):
+        """Delete the least recently used thumbnails until the store fits in ``max_bytes``."""
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for digest, mime, size in self._conn.execute("SELECT digest, mime, size FROM blobs ORDER BY accessed_at ASC"):
+                if total <= self.max_bytes:
+                    break
+                victims.append((digest, mime))
+                total -= size
+            for digest, mime in victims:
+                self._conn.execute("DELETE FROM sources WHERE digest = ?", (digest,))
+                self._conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                try:
+                    os.remove(self.path(digest, mime))
+                except OSError:
+                    pass
+            self._conn.commit()
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _local_path(source):
+    parsed = urlparse(source)
+    if parsed.scheme == "file":
+        return unquote(parsed.path)
+    if parsed.scheme in ("http", "https"):
+        return None
+    return source
+
+
+def source_key(source, max_dimension, quality):
+    """Cache key for a source; local files include their size and mtime so edits are picked up."""
+    key = f"{max_dimension}:{quality}:{source}"
+    path = _local_path(source)
+    if path is not None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return key
+        key += f":{stat.st_size}:{stat.st_mtime_ns}"
+    return key
+
+
+def check_public_url(url):
+    """Raise ValueError unless ``url`` is http(s) and its host resolves only to public addresses."""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError(f"Not an http(s) URL: {url}")
+    try:
+        infos = socket.getaddrinfo(parsed.hostname, parsed.port or 443, proto=socket.IPPROTO_TCP)
+    except socket.gaierror as exc:
+        raise ValueError(f"Cannot resolve {parsed.hostname}") from exc
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"Refusing to fetch from non-public address {address}: {url}")
+
+
+def fetch_image(source, session=None, timeout=FETCH_TIMEOUT, max_bytes=MAX_SOURCE_BYTES, allow_local=False):
+    """
+    Return the bytes of an image given as an http(s) URL, or with ``allow_local`` also a file:// URL
+    or local path.
+
+    Without ``allow_local``, as for sources uploaded to the apps, hosts resolving to private, loopback
+    or link-local addresses are refused, and redirects are followed by hand so each hop is checked too.
+    ``allow_local`` is meant for the command line, where the operator supplies the input.
+    """
+    path = _local_path(source)
+    if path is not None:
+        if not allow_local:
+            raise ValueError(f"Local image sources are not allowed: {source}")
+        if os.path.getsize(path) > max_bytes:
+            raise ValueError(f"Image larger than {max_bytes} bytes: {source}")
+        with open(path, "rb") as f:
+            return f.read()
+    session = session or requests
+    url = source
+    for _ in range(MAX_REDIRECTS + 1):
+        if not allow_local:
+            check_public_url(url)
+        with session.get(url, timeout=timeout, stream=True, allow_redirects=allow_local) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers["Location"])
+                continue
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Image larger than {max_bytes} bytes: {source}")
+                chunks.append(chunk)
+        return b"".join(chunks)
+    raise ValueError(f"Too many redirects: {source}")
+
+
+def build_thumbnails(sources, cache=None, max_workers=DEFAULT_FETCH_WORKERS, max_dimension=DEFAULT_MAX_DIMENSION,
+                     quality=DEFAULT_QUALITY, inline_max_bytes=DEFAULT_INLINE_MAX_BYTES, url_prefix=None,
+                     session=None, allow_local=False):
+    """
+    Fetch images concurrently and return what each source should be replaced with.
+
+    Thumbnails no larger than ``inline_max_bytes`` become data: URIs. Larger ones are referenced as
+    ``url_prefix`` followed by their path inside the cache directory, e.g. when the cache directory is
+    served as static files; without a ``url_prefix`` they keep their original URL.
+
+    Parameters:
+        sources (list): Distinct image URLs or local paths.
+        cache (ThumbnailCache, optional): Thumbnail store. Defaults to ``DEFAULT_THUMBNAIL_DIR``.
+        max_workers (int): Number of concurrent downloads.
+        max_dimension (int): Longest side of a thumbnail in pixels.
+        quality (int): JPEG quality of the thumbnails.
+        inline_max_bytes (int): Largest thumbnail embedded as a data: URI.
+        url_prefix (str, optional): URL under which the cache directory is served.
+        session (requests.Session, optional): Session used for downloads.
+        allow_local (bool): Also read local paths and file:// URLs and fetch from private hosts. Only
+            for trusted input such as the command line; uploaded data must leave this off.
+
+    Returns:
+        tuple: ({source: replacement}, dict of statistics). Sources that could not be fetched or
+        decoded are left out, so callers keep the original value.
+    """
+    own_cache = cache is None
+    cache = cache or ThumbnailCache()
+    own_session = session is None
+    if own_session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max_workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    def replacement(source, digest, mime):
+        size = os.path.getsize(cache.path(digest, mime))
+        if size <= inline_max_bytes:
+            stats["inlined"] += 1
+            return data_uri(cache.read(digest, mime), mime)
+        if url_prefix is None:
+            stats["too_large"] += 1
+            return source
+        stats["linked"] += 1
+        return url_prefix + cache.relative_path(digest, mime)
+
+    def worker(source):
+        data = fetch_image(source, session=session, allow_local=allow_local)
+        thumbnail, mime = make_thumbnail(data, max_dimension, quality)
+        if mime is None:
+            raise ValueError(f"Not an image: {source}")
+        if Image is None and len(thumbnail) > inline_max_bytes:
+            raise ValueError(f"Cannot shrink {source} without Pillow")
+        return len(data), thumbnail, mime
+
+    stats = {"images": len(sources), "cache_hits": 0, "fetched": 0, "failed": 0, "blocked": 0, "inlined": 0,
+             "linked": 0, "too_large": 0, "source_bytes": 0, "thumbnail_bytes": 0}
+    replacements = {}
+    pending = []
+    for source in sources:
+        if not allow_local and _local_path(source) is not None:
+            # Checked before the cache, so a thumbnail made from a trusted run is not served either
+            stats["blocked"] += 1
+            continue
+        found = cache.get(source_key(source, max_dimension, quality))
+        if found is not None:
+            stats["cache_hits"] += 1
+            replacements[source] = replacement(source, *found)
+        else:
+            pending.append(source)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(worker, source): source for source in pending}
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    size, thumbnail, mime = future.result()
+                except Exception:
+                    stats["failed"] += 1
+                    continue
+                digest = cache.put(source_key(source, max_dimension, quality), thumbnail, mime)
+                stats["fetched"] += 1
+                stats["source_bytes"] += size
+                stats["thumbnail_bytes"] += len(thumbnail)
+                replacements[source] = replacement(source, digest, mime)
+    finally:
+        if own_session:
+            session.close()
+        if own_cache:
+            cache.close()
+        else:
+            cache.evict()
+    return replacements, stats
+
+
+def thumbnail_frame(data, image_column, cache=None, **kwargs):
+    """
+    Replace each image in ``data[image_column]`` with a thumbnail, fetching every distinct image once.
+
+    Values that are missing, already data: URIs, or could not be fetched are left alone. Extra keyword
+    arguments are passed through to ``build_thumbnails``.
+
+    Returns:
+        tuple: (DataFrame with the image column rewritten, dict of statistics from ``build_thumbnails``).
+    """
+    data = data.copy()
+    values = data[image_column]
+    is_source = values.notna() & ~values.astype(str).str.startswith("data:")
+    sources = [str(value) for value in pd.unique(values[is_source])]
+    replacements, stats = build_thumbnails(sources, cache=cache, **kwargs)
+    data.loc[is_source, image_column] = values[is_source].astype(str).map(replacements).fillna(values[is_source])
+    return data, stats
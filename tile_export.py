@@ -0,0 +1,292 @@
+import html as html_lib
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from clustering import DEFAULT_MAX_ZOOM, DEFAULT_MIN_ZOOM, DEFAULT_RADIUS, TILE_SIZE, build_cluster_hierarchy, project
+from map_layers import DEFAULT_TOOLTIP_TEMPLATE, _compact, _to_js
+from pointset import PointSet
+
+LEAFLET_JS = "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"
+LEAFLET_CSS = "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css"
+# Bundle tiles span 4x4 map tiles, which keeps the file count manageable at street-level zooms
+DEFAULT_BUNDLE_TILE_SIZE = 4 * TILE_SIZE
+MARKERCLUSTER_CSS = [
+    "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.css",
+    "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.Default.css",
+]
+
+VIEWER_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{{title}}</title>
+<link rel="stylesheet" href="{{leaflet_css}}">
+{{cluster_css}}
+<script src="{{leaflet_js}}"></script>
+<style>
+html, body, #map { height: 100%; margin: 0; }
+#banner { position: fixed; top: 0; left: 0; right: 0; z-index: 1000; background: #111; color: white;
+          padding: 10px 20px; font-family: Arial, sans-serif; display: flex; justify-content: space-between; }
+#banner h1 { margin: 0; font-size: 1.5rem; }
+</style>
+</head>
+<body>
+<div id="banner"><h1>{{title}}</h1><div id="totals"></div></div>
+<div id="map"></div>
+<script>
+(function() {
+    var config = {{config}};
+    var map = L.map('map', {preferCanvas: true}).fitBounds(config.bounds);
+    L.tileLayer('https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png', {
+        attribution: '&copy; OpenStreetMap contributors &copy; CARTO', subdomains: 'abcd', maxZoom: 20
+    }).addTo(map);
+    document.getElementById('totals').textContent =
+        Math.round(config.total_weight).toLocaleString() + ' people attended | ' + config.count.toLocaleString() + ' records';
+
+    var dataBounds = L.latLngBounds(config.bounds);
+    var renderer = L.canvas({padding: 0.5});
+    var group = L.layerGroup().addTo(map);
+    var loaded = {};
+    var drawn = 0;
+    var esc = function(v) {
+        return String(v === null || v === undefined ? '' : v).replace(/[&<>"']/g, function(c) {
+            return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+        });
+    };
+    var fill = function(template, d, i) {
+        return template.replace(/\\{(\\w+)\\}/g, function(m, key) {
+            return d[key] ? esc(d[key][i]) : m;
+        });
+    };
+
+    function buildTile(t, z) {
+        var layer = L.layerGroup();
+        var c = t.clusters;
+        c.lat.forEach(function(lat, j) {
+            var total = c.weight[j];
+            var size = total < config.small ? 'small' : (total < config.large ? 'medium' : 'large');
+            var latlng = L.latLng(lat, c.lon[j]);
+            L.marker(latlng, {
+                icon: L.divIcon({
+                    html: '<div><span>' + Math.round(total).toLocaleString() + '</span></div>',
+                    className: 'marker-cluster marker-cluster-' + size,
+                    iconSize: L.point(40, 40)
+                })
+            }).bindTooltip(c.count[j] + ' locations').on('click', function() {
+                map.setView(latlng, Math.min(z + 2, config.detail_zoom));
+            }).addTo(layer);
+        });
+        var p = t.points;
+        p.lat.forEach(function(lat, i) {
+            var r = config.radius_field ? Math.max(config.min_radius, (+p[config.radius_field][i] || 0) * config.radius_scale)
+                                        : config.min_radius;
+            L.circleMarker([lat, p.lon[i]], {
+                renderer: renderer, radius: r, color: config.color, fillColor: config.color,
+                fillOpacity: config.fill_opacity, weight: 1
+            }).bindTooltip(function() { return fill(config.tooltip_template, p, i); }, {sticky: true}).addTo(layer);
+        });
+        return layer;
+    }
+
+    function load(z, key) {
+        // One request per tile for the lifetime of the page; empty tiles are not written and 404
+        if (!loaded[z + '/' + key]) {
+            loaded[z + '/' + key] = fetch('tiles/' + z + '/' + key + '.json')
+                .then(function(response) { return response.ok ? response.json() : null; })
+                .then(function(t) { return t ? buildTile(t, z) : null; })
+                .catch(function() { return null; });
+        }
+        return loaded[z + '/' + key];
+    }
+
+    function draw() {
+        var z = Math.max(config.min_zoom, Math.min(Math.round(map.getZoom()), config.detail_zoom));
+        var view = map.getBounds();
+        if (!view.intersects(dataBounds)) { group.clearLayers(); return; }
+        // Only request tiles in the part of the view that contains data
+        var bounds = L.latLngBounds(
+            [Math.max(view.getSouth(), dataBounds.getSouth()), Math.max(view.getWest(), dataBounds.getWest())],
+            [Math.min(view.getNorth(), dataBounds.getNorth()), Math.min(view.getEast(), dataBounds.getEast())]
+        );
+        var nw = map.project(bounds.getNorthWest(), z).divideBy(config.tile_size).floor();
+        var se = map.project(bounds.getSouthEast(), z).divideBy(config.tile_size).floor();
+        var token = ++drawn;
+        group.clearLayers();
+        for (var x = nw.x; x <= se.x; x++) {
+            for (var y = nw.y; y <= se.y; y++) {
+                load(z, x + '/' + y).then(function(layer) {
+                    // Ignore tiles that arrive after the view has moved on
+                    if (layer && token === drawn) { group.addLayer(layer); }
+                });
+            }
+        }
+    }
+    map.on('moveend', draw);
+    draw();
+})();
+</script>
+</body>
+</html>
+"""
+
+
+def _tile_coords(lat, lon, zoom, tile_size):
+    x, y = project(lat, lon, zoom)
+    last = max(0, int(np.ceil(TILE_SIZE * 2 ** zoom / tile_size)) - 1)
+    tx = np.clip(np.floor(x / tile_size), 0, last).astype(np.int64)
+    ty = np.clip(np.floor(y / tile_size), 0, last).astype(np.int64)
+    return tx, ty
+
+
+def _split_by_tile(frame, names, zoom, tile_size):
+    # Sort rows by tile once and slice plain lists, rather than grouping DataFrames per tile
+    if frame.empty:
+        return
+    tx, ty = _tile_coords(frame["lat"], frame["lon"], zoom, tile_size)
+    order = np.lexsort((ty, tx))
+    tx, ty = tx[order], ty[order]
+    values = {}
+    for name in names:
+        column = frame[name].to_numpy()[order]
+        # NaN is sent as null, matching the map_layers payloads
+        values[name] = [None if isinstance(value, float) and value != value else value for value in column.tolist()]
+    starts = np.flatnonzero(np.r_[True, (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1])])
+    ends = np.r_[starts[1:], len(order)]
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        yield (int(tx[start]), int(ty[start])), {name: values[name][start:end] for name in names}
+
+
+def _write_json(path, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(_to_js(value))
+
+
+def build_tiles(columns, weight_field, min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM, radius=DEFAULT_RADIUS,
+                tile_size=DEFAULT_BUNDLE_TILE_SIZE, precision=5):
+    """
+    Split a columnar payload into per-zoom, per-tile aggregates.
+
+    Zooms ``min_zoom`` to ``max_zoom`` hold the precomputed clusters of that zoom (centroid, summed
+    ``weight_field`` and point count) and the points that are on their own at that zoom. One more
+    detail level at ``max_zoom + 1`` holds every point. Each tile covers ``tile_size`` screen pixels
+    square at its zoom.
+
+    Returns:
+        dict: {(z, x, y): {"clusters": {"lat", "lon", "weight", "count"}, "points": {"lat", "lon", <fields>}}}
+    """
+    points = pd.DataFrame(columns)
+    fields = list(columns)
+    hierarchy = build_cluster_hierarchy(points["lat"], points["lon"], points[weight_field],
+                                        min_zoom=min_zoom, max_zoom=max_zoom, radius=radius)
+    empty_clusters = {"lat": [], "lon": [], "weight": [], "count": []}
+    tiles = {}
+
+    def add_points(zoom, frame):
+        for (x, y), values in _split_by_tile(frame, fields, zoom, tile_size):
+            tiles.setdefault((zoom, x, y), {"clusters": empty_clusters, "points": None})["points"] = values
+
+    for zoom, level in hierarchy.items():
+        clusters = level[level["count"] > 1].assign(lat=lambda f: f["lat"].round(precision),
+                                                    lon=lambda f: f["lon"].round(precision))
+        for (x, y), values in _split_by_tile(clusters, ["lat", "lon", "weight", "count"], zoom, tile_size):
+            tiles[(zoom, x, y)] = {"clusters": values, "points": None}
+        add_points(zoom, points.iloc[level.loc[level["count"] == 1, "point"].to_numpy()])
+    add_points(max_zoom + 1, points)
+
+    empty_points = {name: [] for name in fields}
+    for tile in tiles.values():
+        if tile["points"] is None:
+            tile["points"] = empty_points
+    return tiles
+
+
+def export_tile_bundle(data, output_dir, lat_key="Latitude", lon_key="Longitude", weight_key="People Attended",
+                       fields=None, tooltip_template=DEFAULT_TOOLTIP_TEMPLATE, title="Principles Exposure Map",
+                       min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM, radius=DEFAULT_RADIUS,
+                       tile_size=DEFAULT_BUNDLE_TILE_SIZE, radius_scale=0.1, min_radius=2, color="yellow", fill_opacity=0.7, small=10, large=100):
+    """
+    Write a static map bundle: aggregated ``tiles/z/x/y.json`` files plus an ``index.html`` viewer.
+
+    The viewer only downloads the tiles covering the current view, so the bundle stays usable for
+    hundreds of thousands of records. It can be served from any static host; browsers refuse to
+    fetch the tiles from ``file://`` pages, so use e.g. ``python -m http.server -d <output_dir>`` locally.
+    The bundle is built next to ``output_dir`` and swapped in at the end, so an existing bundle stays
+    intact if the export fails.
+
+    Parameters:
+        data (pd.DataFrame): Consolidated data from ``add_geocoded_columns_to_excel``.
+        output_dir (str): Directory to write; replaced if it exists.
+        lat_key, lon_key (str): Coordinate columns.
+        weight_key (str): Column summed per cluster and used for marker size.
+        fields (dict, optional): Tooltip name -> column. Defaults to ``people`` and, when present, ``img``.
+        tooltip_template (str): HTML with ``{field}`` placeholders for single points.
+        title (str): Page title and banner text.
+        min_zoom, max_zoom, radius: Clustering range and cell size, as for ``build_cluster_hierarchy``.
+        tile_size (int): Screen pixels covered by one bundle tile; larger tiles mean fewer, bigger files.
+        radius_scale, min_radius, color, fill_opacity, small, large: Marker styling, as for ``ClusterLayer``.
+
+    Returns:
+        dict: Bundle metadata as written to ``tiles.json``.
+    """
+    if fields is None:
+        fields = {"people": weight_key}
+        if "Img" in data.columns:
+            fields["img"] = "Img"
+    # PointSet keeps "people", "year" and "name" as typed columns of their own; other fields are tooltip values
+    roles = {key: fields.get(key) for key in ("people", "year", "name")}
+    points = PointSet.from_frame(data, lat=lat_key, lon=lon_key, **roles,
+                                 fields={key: column for key, column in fields.items() if key not in roles})
+    columns = points.columns(list(fields))
+    weight_field = next(name for name, key in fields.items() if key == weight_key)
+    tiles = build_tiles(columns, weight_field, min_zoom=min_zoom, max_zoom=max_zoom, radius=radius,
+                        tile_size=tile_size)
+
+    lat = np.asarray(columns["lat"], dtype=float)
+    lon = np.asarray(columns["lon"], dtype=float)
+    config = {
+        "bounds": [[float(lat.min()), float(lon.min())], [float(lat.max()), float(lon.max())]] if len(lat) else
+                  [[-85, -180], [85, 180]],
+        "count": len(lat),
+        "total_weight": float(pd.to_numeric(pd.Series(columns[weight_field]), errors="coerce").fillna(0).sum()),
+        "min_zoom": min_zoom,
+        "max_zoom": max_zoom,
+        "detail_zoom": max_zoom + 1,
+        "tile_size": tile_size,
+        "tiles": len(tiles),
+        "radius_field": weight_field,
+        "radius_scale": radius_scale,
+        "min_radius": min_radius,
+        "color": color,
+        "fill_opacity": fill_opacity,
+        "small": small,
+        "large": large,
+        "tooltip_template": _compact(tooltip_template),
+    }
+
+    build_dir = output_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    for (z, x, y), tile in tiles.items():
+        _write_json(os.path.join(build_dir, "tiles", str(z), str(x), f"{y}.json"), tile)
+    _write_json(os.path.join(build_dir, "tiles.json"), config)
+    html = (VIEWER_TEMPLATE
+            .replace("{{leaflet_css}}", LEAFLET_CSS)
+            .replace("{{leaflet_js}}", LEAFLET_JS)
+            .replace("{{cluster_css}}", "\n".join(f'<link rel="stylesheet" href="{url}">' for url in MARKERCLUSTER_CSS))
+            .replace("{{title}}", html_lib.escape(title))
+            .replace("{{config}}", _to_js(config)))
+    with open(os.path.join(build_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(html)
+
+    # Swap the finished bundle in place of the previous one
+    old_dir = output_dir.rstrip("/\\") + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(output_dir):
+        os.replace(output_dir, old_dir)
+    os.replace(build_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return config